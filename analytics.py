@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""analytics.py
+
+Columnar snapshots of the conference data, and the registration
+statistics computed from them with vectorized NumPy operations.
+
+A table is a dict of equal-length NumPy arrays (columns). String columns
+are dictionary-encoded: an int32 code array, plus a '<column>_dict' array
+holding the distinct values in sorted order. Tables serialize to .npz
+bytes.
+
+Pure NumPy: this module never touches the datastore.
+
+"""
+
+import io
+import zipfile
+
+import numpy as np
+
+# columns holding strings, dictionary-encoded
+STRING_COLUMNS = frozenset(['conference', 'city', 'topic'])
+DICT_SUFFIX = '_dict'
+
+
+# - - - Tables - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def encode(values):
+    """Dictionary-encode a list of strings; return (codes, dictionary)."""
+    dictionary = np.array(sorted(set(values)), dtype=np.unicode_)
+    codes = np.searchsorted(dictionary, np.array(values, dtype=np.unicode_))
+    return codes.astype(np.int32), dictionary
+
+
+def table(**columns):
+    """Return a table from lists of values, encoding the string columns."""
+    tbl = {}
+    for name, values in columns.items():
+        if name in STRING_COLUMNS:
+            tbl[name], tbl[name + DICT_SUFFIX] = encode(values)
+        else:
+            tbl[name] = np.array(values, dtype=np.int32)
+    return tbl
+
+
+def concat(tables):
+    """Concatenate tables with the same columns, merging the dictionaries
+    of their string columns."""
+    merged = {}
+    for name in tables[0]:
+        if name.endswith(DICT_SUFFIX):
+            continue
+        if name + DICT_SUFFIX not in tables[0]:
+            merged[name] = np.concatenate([tbl[name] for tbl in tables])
+            continue
+
+        dictionary = np.array(
+            sorted(set().union(*[tbl[name + DICT_SUFFIX].tolist()
+                                 for tbl in tables])),
+            dtype=np.unicode_)
+        # remap the codes of every table onto the merged dictionary
+        merged[name] = np.concatenate([
+            np.searchsorted(dictionary, tbl[name + DICT_SUFFIX]).astype(
+                np.int32)[tbl[name]]
+            for tbl in tables])
+        merged[name + DICT_SUFFIX] = dictionary
+    return merged
+
+
+def dumps(tables):
+    """Serialize a dict of tables to .npz bytes; arrays are written
+    in memory, without the temporary files np.savez uses."""
+    buf = io.BytesIO()
+    npz = zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED)
+    for table_name, tbl in tables.items():
+        for name, column in tbl.items():
+            npy = io.BytesIO()
+            np.lib.format.write_array(npy, column)
+            npz.writestr('%s.%s.npy' % (table_name, name), npy.getvalue())
+    npz.close()
+    return buf.getvalue()
+
+
+def loads(data):
+    """Deserialize a dict of tables from .npz bytes."""
+    npz = np.load(io.BytesIO(data))
+    tables = {}
+    for key in npz.files:
+        table_name, name = key.split('.', 1)
+        tables.setdefault(table_name, {})[name] = npz[key]
+    return tables
+
+
+# - - - Statistics - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _counts(groups, size, weights=None):
+    """Return the per group counts (or weight sums) of a code array."""
+    if not len(groups):
+        return np.zeros(size)
+    return np.bincount(groups, weights=weights, minlength=size)
+
+
+def _conferenceRows(tbl, conferences):
+    """Return the conference table rows referenced by a table's conference
+    column, and the mask of its rows referencing a known conference."""
+    conf_dict = conferences['conference' + DICT_SUFFIX]
+    # conference table row of every conference key code
+    row_of_code = np.empty(len(conf_dict), dtype=np.int32)
+    row_of_code[conferences['conference']] = np.arange(
+        len(conferences['conference']))
+
+    tbl_dict = tbl['conference' + DICT_SUFFIX]
+    if not len(conf_dict) or not len(tbl_dict):
+        return (np.zeros(0, dtype=np.int32),
+                np.zeros(len(tbl['conference']), dtype=bool))
+    pos = np.minimum(np.searchsorted(conf_dict, tbl_dict), len(conf_dict) - 1)
+    found = conf_dict[pos] == tbl_dict
+    dict_rows = np.where(found, row_of_code[pos], -1)
+
+    rows = dict_rows[tbl['conference']]
+    mask = rows >= 0
+    return rows[mask], mask
+
+
+def _groupBy(labels, groups, rows, measures):
+    """Sum per conference measures by group; rows are the conference rows
+    of the group codes, a conference may be in several groups. Return a
+    list of rows as dicts, most registrations first."""
+    size = len(labels)
+    sums = dict((name, _counts(groups, size, values[rows].astype(float)))
+                for name, values in measures.items())
+    conferences = _counts(groups, size)
+    capacity = sums['maxAttendees']
+    fill_rate = np.where(capacity > 0,
+                         sums['registrations'] / np.maximum(capacity, 1), 0.0)
+
+    result = []
+    for i in np.argsort(-sums['registrations'], kind='mergesort'):
+        if not conferences[i]:
+            continue
+        row = {'key': labels[i], 'conferences': int(conferences[i]),
+               'fillRate': round(float(fill_rate[i]), 4)}
+        for name in measures:
+            row[name] = int(sums[name][i])
+        result.append(row)
+    return result
+
+
+def registrationStats(tables):
+    """Return registration and fill rate statistics by month, city and
+    topic of the conferences of a snapshot."""
+    conferences = tables['conference']
+    count = len(conferences['conference'])
+
+    session_rows, _ = _conferenceRows(tables['session'], conferences)
+    registration_rows, _ = _conferenceRows(tables['registration'],
+                                           conferences)
+    measures = {
+        'maxAttendees': conferences['maxAttendees'],
+        'seatsAvailable': conferences['seatsAvailable'],
+        'registrations': _counts(registration_rows, count),
+        'sessions': _counts(session_rows, count),
+    }
+
+    all_rows = np.arange(count)
+    topic_rows, topic_mask = _conferenceRows(tables['topic'], conferences)
+    months = [None] + range(1, 13)
+    cities = [city or None for city in conferences['city_dict'].tolist()]
+    return {
+        'conferences': count,
+        'registrations': int(measures['registrations'].sum()),
+        'month': _groupBy(months, conferences['month'], all_rows, measures),
+        'city': _groupBy(cities, conferences['city'], all_rows, measures),
+        'topic': _groupBy(tables['topic']['topic_dict'].tolist(),
+                          tables['topic']['topic'][topic_mask],
+                          topic_rows, measures),
+    }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""index_writes.py
+
+Count the datastore write operations of the main write paths, with the
+properties unindexed by the index audit indexed again (before) and as
+the models stand (after):
+
+    python benchmarks/index_writes.py --sdk ~/google-cloud-sdk/platform/google_appengine
+
+Write operations are what a put costs beyond the entity itself: the
+index rows it adds and deletes. They're counted from the entities'
+protocol buffers and the composite indexes of index.yaml, with the
+datastore's rules: a new entity costs 2 writes, plus 2 per indexed
+property value and 1 per composite index row; an updated one costs 1
+write, plus 4 per modified indexed property value and 2 per modified
+composite index row. The puts of each path are also timed against the
+SDK's datastore stub, --repeat times.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# kind -> properties unindexed by the index audit
+UNINDEXED = {
+    'Conference': ('description', 'organizerUserId', 'sessionKeys',
+                   'version', 'scheduleVersion'),
+    'Session': ('highlights', 'speaker.email', 'speaker.name',
+                'speaker.websafeSpeakerKey', 'duration', 'endMinute',
+                'startTimestamp'),
+    'Profile': ('displayName', 'sessionKeysWishlist'),
+    'Speaker': ('email', 'sessionKeysToAttend'),
+    'WaitlistEntry': ('userId',),
+}
+
+
+def loadCompositeIndexes():
+    """Return the composite indexes of index.yaml, as (kind, ancestor,
+    property names) tuples."""
+    import yaml
+    with open(os.path.join(APP_DIR, 'index.yaml')) as f:
+        indexes = yaml.safe_load(f)['indexes']
+    return [(index['kind'], bool(index.get('ancestor')),
+             [prop['name'] for prop in index['properties']])
+            for index in indexes]
+
+
+def indexRows(entity, composites, before):
+    """Return the built-in and composite index rows of an entity, as two
+    sets; before also indexes the properties in UNINDEXED."""
+    pb = entity._to_pb()
+    props = list(pb.property_list())
+    if before:
+        props += [prop for prop in pb.raw_property_list()
+                  if prop.name() in UNINDEXED.get(entity._get_kind(), ())]
+    values = {}
+    for prop in props:
+        values.setdefault(prop.name(), []).append(prop.value().Encode())
+
+    builtin = set((name, value) for name, vals in values.items()
+                  for value in vals)
+    composite = set()
+    for kind, ancestor, names in composites:
+        if kind != entity._get_kind() or \
+                any(name not in values for name in names):
+            continue
+        rows = [()]
+        for name in names:
+            rows = [row + (value,) for row in rows for value in values[name]]
+        ancestors = entity.key.pairs()[:-1] if ancestor else [None]
+        composite.update((kind, tuple(names), anc, row)
+                         for anc in ancestors for row in rows)
+    return builtin, composite
+
+
+def _modified(old, new):
+    """Return the number of modified index values between two row sets;
+    a changed value removes a row and adds one."""
+    return max(len(old - new), len(new - old))
+
+
+def writeOps(old, new, composites, before):
+    """Return the write operations of putting new over old (None for a
+    new entity)."""
+    new_builtin, new_composite = indexRows(new, composites, before)
+    if old is None:
+        return 2 + 2 * len(new_builtin) + len(new_composite)
+    old_builtin, old_composite = indexRows(old, composites, before)
+    return (1 + 4 * _modified(old_builtin, new_builtin) +
+            2 * _modified(old_composite, new_composite))
+
+
+def scenarios():
+    """Return the write paths measured, as (name, [(old, new)]) where old
+    is None for a new entity."""
+    import copy
+    from datetime import date
+    from google.appengine.ext import ndb
+    from models import Conference
+    from models import Profile
+    from models import Session
+    from models import SessionSummary
+    from models import Speaker
+    from models import SpeakerProperty
+    from utils import sessionTimeFields
+
+    p_key = ndb.Key(Profile, 'organizer@example.com')
+    c_key = ndb.Key(Conference, 1, parent=p_key)
+    wsck = c_key.urlsafe()
+    s_keys = [ndb.Key(Session, i, parent=c_key) for i in range(1, 21)]
+
+    profile = Profile(key=ndb.Key(Profile, 'attendee@example.com'),
+                      displayName='An Attendee',
+                      mainEmail='attendee@example.com',
+                      teeShirtSize='M_W',
+                      conferenceKeysToAttend=[
+                          ndb.Key(Conference, i, parent=p_key).urlsafe()
+                          for i in range(2, 7)],
+                      sessionKeysWishlist=[key.urlsafe()
+                                           for key in s_keys[:10]])
+    conf = Conference(key=c_key, name='PyCon', description='x' * 500,
+                      organizerUserId=p_key.id(),
+                      topics=['Programming', 'Python', 'Web'],
+                      city='Paris', startDate=date(2026, 6, 1), month=6,
+                      endDate=date(2026, 6, 3), maxAttendees=1000,
+                      seatsAvailable=500, version=3, scheduleVersion=20,
+                      sessionSummary=SessionSummary(sessionCount=20))
+    speaker = Speaker(key=ndb.Key(Speaker, 'speaker@example.com'),
+                      email='speaker@example.com',
+                      sessionKeysToAttend=[key.urlsafe()
+                                           for key in s_keys[:3]])
+    fields = sessionTimeFields(date(2026, 6, 2), 1430, 60)
+    session = Session(key=s_keys[-1], name='Keynote', highlights='y' * 300,
+                      speaker=SpeakerProperty(
+                          email=speaker.email, name='A Speaker',
+                          websafeSpeakerKey=speaker.key.urlsafe()),
+                      date=date(2026, 6, 2), duration=60, startTime=1430,
+                      sessionType='KEYNOTE', **fields)
+
+    def changed(entity, **values):
+        new = copy.deepcopy(entity)
+        new.populate(**values)
+        return new
+
+    return [
+        ('createConference', [(None, conf)]),
+        ('updateConference', [
+            (conf, changed(conf, description='z' * 500,
+                           version=conf.version + 1))]),
+        ('createSession', [
+            (None, session),
+            (conf, changed(conf, scheduleVersion=conf.scheduleVersion + 1,
+                           version=conf.version + 1)),
+            (speaker, changed(speaker, sessionKeysToAttend=(
+                speaker.sessionKeysToAttend + [session.key.urlsafe()])))]),
+        ('registerForConference', [
+            (profile, changed(profile, conferenceKeysToAttend=(
+                profile.conferenceKeysToAttend + [wsck]))),
+            (conf, changed(conf, seatsAvailable=conf.seatsAvailable - 1,
+                           version=conf.version + 1))]),
+        ('addSessionToWishlist', [
+            (profile, changed(profile, sessionKeysWishlist=(
+                profile.sessionKeysWishlist + [session.key.urlsafe()])))]),
+        ('saveProfile', [
+            (profile, changed(profile, displayName='Another Name'))]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', required=True,
+                        help='path to the google_appengine SDK directory')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+    from google.appengine.ext import testbed
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_datastore_v3_stub()
+    tb.init_memcache_stub()
+
+    from google.appengine.ext import ndb
+    ndb.get_context().set_cache_policy(False)
+    ndb.get_context().set_memcache_policy(False)
+
+    composites = loadCompositeIndexes()
+    print('%-24s %12s %12s %8s %14s' % (
+        'write path', 'ops before', 'ops after', 'saved', 'stub put ms'))
+    for name, writes in scenarios():
+        before = sum(writeOps(old, new, composites, True)
+                     for old, new in writes)
+        after = sum(writeOps(old, new, composites, False)
+                    for old, new in writes)
+        entities = [new for _, new in writes]
+        start = time.time()
+        for _ in range(args.repeat):
+            ndb.put_multi(entities)
+        elapsed = (time.time() - start) / args.repeat
+        print('%-24s %12d %12d %7.0f%% %14.2f' % (
+            name, before, after, 100.0 * (before - after) / before,
+            elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""mail_pipeline.py
+
+Measure the throughput and lag of the email pipeline (mailer.py) against
+the SDK's local mail and task queue stubs:
+
+    python benchmarks/mail_pipeline.py --sdk ~/google-cloud-sdk/platform/google_appengine
+
+Queues --notifications conference creation notifications for --recipients
+organizers, then runs the worker until the pull queue is empty, and
+reports notifications / emails per second, the number of emails actually
+sent (digests combine a recipient's notifications) and the queue lag.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeConference(object):
+
+    """FakeConference -- the Conference fields a notification renders"""
+
+    def __init__(self, i):
+        self.name = 'Conference %d' % i
+        self.city = 'City %d' % (i % 10)
+        self.startDate = None
+        self.endDate = None
+        self.topics = ['Topic %d' % (i % 7)]
+        self.maxAttendees = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', required=True,
+                        help='path to the google_appengine SDK directory')
+    parser.add_argument('--notifications', type=int, default=2000)
+    parser.add_argument('--recipients', type=int, default=500)
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+    from google.appengine.ext import testbed
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_app_identity_stub()
+    tb.init_datastore_v3_stub()
+    tb.init_memcache_stub()
+    tb.init_mail_stub()
+    tb.init_taskqueue_stub(root_path=APP_DIR)
+    mail_stub = tb.get_stub(testbed.MAIL_SERVICE_NAME)
+
+    import mailer
+
+    start = time.time()
+    for i in range(args.notifications):
+        mailer.enqueueConferenceCreated(
+            'organizer%d@example.com' % (i % args.recipients),
+            FakeConference(i))
+    enqueued = time.time() - start
+
+    start = time.time()
+    leased = mailer.run(deadline=float('inf'))
+    elapsed = time.time() - start
+
+    metrics = mailer.getMetrics()
+    sent = len(mail_stub.get_sent_messages())
+    print('enqueued      %d notifications in %.2f s (%.0f/s)' % (
+        args.notifications, enqueued, args.notifications / enqueued))
+    print('leased        %d notifications' % leased)
+    print('sent          %d emails, %d digests, %d failures in %.2f s' % (
+        sent, metrics['digests'], metrics['failures'], elapsed))
+    print('throughput    %.0f notifications/s, %.0f emails/s' % (
+        metrics['notifications'] / elapsed, sent / elapsed))
+    print('mean lag      %.2f s' % (
+        float(metrics['lagSeconds']) / max(metrics['notifications'], 1)))
+    tb.deactivate()
+
+
+if __name__ == '__main__':
+    main()
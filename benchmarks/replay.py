@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""replay.py
+
+Replay a capture of ConferenceApi calls (capture.py, downloaded from
+/admin/capture) concurrently, and report per method throughput, latency
+percentiles and error rates:
+
+    python benchmarks/replay.py capture.jsonl --target http://localhost:8080
+    python benchmarks/replay.py capture.jsonl --sdk ~/google-cloud-sdk/platform/google_appengine
+
+With --target, calls are posted to the /_ah/spi/ backend of a local dev
+server; they carry no credentials, so authenticated methods fail unless
+the server signs calls in. Without --target, the API runs in-process on
+the SDK's testbed stubs, every call signed in as --user.
+
+Calls keep the timing of the capture, divided by --speed (0 replays as
+fast as --concurrency allows). Captured keys and personal data are
+anonymized. On the testbed, a Conference or Session is created for
+every anonymized key of those kinds before the replay, so the calls
+about them find them; against a dev server they measure the not-found
+path.
+
+"""
+
+import argparse
+import json
+import os
+import Queue
+import sys
+import threading
+import time
+import urllib2
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPI_PREFIX = '/_ah/spi/'
+# seats of the seeded conferences, so that replayed registrations don't
+# sell them out
+SEEDED_SEATS = 1000000
+
+
+def percentile(values, pct):
+    """Return the pct percentile of a sorted list of values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def httpCaller(target):
+    """Return a function posting a call to a dev server; it returns the
+    HTTP status."""
+    def call(record):
+        req = urllib2.Request(target + SPI_PREFIX + record['method'],
+                              json.dumps(record['body'] or {}),
+                              {'Content-Type': 'application/json'})
+        try:
+            return urllib2.urlopen(req).getcode()
+        except urllib2.HTTPError as e:
+            return e.code
+    return call
+
+
+def testbedCaller(sdk, user):
+    """Return a function running a call in-process on testbed stubs; it
+    returns the HTTP status."""
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+    from google.appengine.ext import testbed
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.setup_env(ENDPOINTS_AUTH_EMAIL=user, ENDPOINTS_AUTH_DOMAIN='',
+                 overwrite=True)
+    tb.init_all_stubs()
+    tb.init_taskqueue_stub(root_path=APP_DIR)
+
+    import webob
+    import conference
+
+    def call(record):
+        req = webob.Request.blank(SPI_PREFIX + record['method'],
+                                  method='POST',
+                                  body=json.dumps(record['body'] or {}),
+                                  content_type='application/json')
+        return req.get_response(conference.api).status_int
+    return call
+
+
+def seedEntities(records):
+    """Create a Conference or Session, in the testbed's app, for every
+    websafe key of those kinds in the records, and rewrite the records'
+    keys to theirs; return the number of entities created."""
+    from datetime import date
+    from datetime import timedelta
+    from google.appengine.ext import ndb
+    from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+    from models import Conference
+    from models import Session
+
+    start = date.today() + timedelta(days=30)
+    entities = {}
+    local_keys = {}
+
+    def seed(websafe):
+        if websafe in local_keys:
+            return local_keys[websafe]
+        try:
+            key = ndb.Key(pairs=ndb.Key(urlsafe=websafe).pairs())
+        except (TypeError, ProtocolBufferDecodeError):
+            # not a key in the capture either
+            local_keys[websafe] = websafe
+            return websafe
+        local_keys[websafe] = key.urlsafe()
+        if key.kind() == 'Session' and key.parent():
+            entities[key] = Session(key=key, name='Replayed session',
+                                    date=start)
+            key = key.parent()
+        if key.kind() == 'Conference' and key not in entities:
+            entities[key] = Conference(
+                key=key, name='Replayed conference',
+                organizerUserId=key.parent().id() if key.parent() else None,
+                startDate=start, month=start.month,
+                endDate=start + timedelta(days=2),
+                maxAttendees=SEEDED_SEATS, seatsAvailable=SEEDED_SEATS)
+        return local_keys[websafe]
+
+    def rewrite(value, field=None):
+        if isinstance(value, dict):
+            return dict((k, rewrite(v, k)) for k, v in value.items())
+        if isinstance(value, list):
+            return [rewrite(v, field) for v in value]
+        if isinstance(value, basestring) and \
+                (field or '').startswith('websafe'):
+            return seed(value)
+        return value
+
+    for record in records:
+        record['body'] = rewrite(record['body'])
+    ndb.put_multi(entities.values())
+    return len(entities)
+
+
+def replay(records, call, speed, concurrency):
+    """Replay records with concurrency threads; return the results as
+    (method, status, seconds) tuples and the wall time."""
+    pending = Queue.Queue()
+    for record in records:
+        pending.put(record)
+    results = []
+    lock = threading.Lock()
+    first_ts = records[0]['ts'] if records else 0
+    start = time.time()
+
+    def worker():
+        while True:
+            try:
+                record = pending.get_nowait()
+            except Queue.Empty:
+                return
+            if speed:
+                delay = start + (record['ts'] - first_ts) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            began = time.time()
+            try:
+                status = call(record)
+            except Exception:
+                status = None
+            elapsed = time.time() - began
+            with lock:
+                results.append((record['method'], status, elapsed))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - start
+
+
+def report(records, results, wall):
+    """Print per method throughput, latency percentiles and error rates,
+    next to the captured latency."""
+    captured = {}
+    for record in records:
+        captured.setdefault(record['method'], []).append(
+            record['elapsed_ms'])
+    by_method = {}
+    for method, status, elapsed in results:
+        by_method.setdefault(method, []).append((status, elapsed * 1000))
+
+    print('%-48s %6s %8s %8s %8s %8s %7s %12s' % (
+        'method', 'calls', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'errors', 'capt p50 ms'))
+    rows = sorted(by_method.items()) + [('TOTAL', [
+        call for calls in by_method.values() for call in calls])]
+    for method, calls in rows:
+        latencies = sorted(elapsed for _, elapsed in calls)
+        errors = sum(1 for status, _ in calls
+                     if status is None or status >= 400)
+        capt = sorted(captured.get(method, []) if method != 'TOTAL' else
+                      [ms for mss in captured.values() for ms in mss])
+        print('%-48s %6d %8.1f %8.1f %8.1f %8.1f %6.1f%% %12.1f' % (
+            method, len(calls), len(calls) / wall,
+            percentile(latencies, 50), percentile(latencies, 90),
+            percentile(latencies, 99), 100.0 * errors / len(calls),
+            percentile(capt, 50)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('capture', help='captured calls, JSONL')
+    parser.add_argument('--target',
+                        help='dev server URL, e.g. http://localhost:8080')
+    parser.add_argument('--sdk',
+                        help='path to the google_appengine SDK directory, '
+                             'to replay on the testbed')
+    parser.add_argument('--user', default='replay@example.com',
+                        help='user signed in on the testbed')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed multiplier; 0 replays without waits')
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+    if not (args.target or args.sdk):
+        parser.error('either --target or --sdk is required')
+
+    with open(args.capture) as f:
+        records = sorted((json.loads(line) for line in f if line.strip()),
+                         key=lambda record: record['ts'])
+    if not records:
+        parser.error('no calls in %s' % args.capture)
+    if args.target:
+        call = httpCaller(args.target.rstrip('/'))
+    else:
+        call = testbedCaller(args.sdk, args.user)
+        print('seeded %d entities' % seedEntities(records))
+
+    results, wall = replay(records, call, args.speed, args.concurrency)
+    report(records, results, wall)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""startup.py
+
+Measure the cold-start import time of the app's entry points.
+
+Every run imports one module in a fresh interpreter, the way a new App
+Engine instance does, and reports min / median / max wall time:
+
+    python benchmarks/startup.py --sdk ~/google-cloud-sdk/platform/google_appengine
+
+Modules measured:
+    main        task handlers (should not pull in the API layer)
+    tasks       background work only
+    conference  the Endpoints API, including building api_server
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('tasks', 'main', 'conference')
+
+# run in the child interpreter; prints a JSON result on stdout
+CHILD = '''
+import json, os, sys, time
+sys.path.insert(0, %(sdk)r)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, %(app)r)
+os.environ.setdefault('APPLICATION_ID', 'dev~conference-app')
+os.environ.setdefault('SERVER_SOFTWARE', 'Development/benchmark')
+start = time.time()
+import %(module)s
+elapsed = time.time() - start
+print(json.dumps({'elapsed': elapsed,
+                  'conference_loaded': 'conference' in sys.modules}))
+'''
+
+
+def measure(sdk, module):
+    """Import module in a fresh interpreter; return its result dict."""
+    code = CHILD % {'sdk': sdk, 'app': APP_DIR, 'module': module}
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', required=True,
+                        help='path to the google_appengine SDK directory')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='fresh interpreters per module (default 10)')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    print('%-12s %10s %10s %10s  %s' % (
+        'module', 'min ms', 'median ms', 'max ms', 'imports API layer'))
+    for module in args.modules:
+        results = [measure(args.sdk, module) for _ in range(args.runs)]
+        times = sorted(r['elapsed'] * 1000 for r in results)
+        print('%-12s %10.1f %10.1f %10.1f  %s' % (
+            module, times[0], times[len(times) // 2], times[-1],
+            any(r['conference_loaded'] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""capture.py
+
+Capture of production traffic for replays (benchmarks/replay.py).
+CaptureMiddleware wraps the Endpoints SPI application and logs a sample
+of the ConferenceApi calls, anonymized, with their status and timing, as
+one JSON object per application log line; exportLines() reads them back
+from the request logs, as JSONL.
+
+Logging costs no RPC, so captured requests aren't slowed down.
+
+Websafe keys keep their kinds and app, with every id replaced by a
+stable token, so they still decode; replay.py creates an entity for
+each of them before replaying.
+
+"""
+
+import hashlib
+import io
+import json
+import logging
+import random
+import time
+
+from google.appengine.api import logservice
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+from settings import CAPTURE_SAMPLE_RATE
+
+# prefix of the application log lines holding a captured call
+CAPTURE_PREFIX = 'CAPTURE '
+SPI_PREFIX = '/_ah/spi/'
+
+# request fields holding personal data or user ids; websafe keys embed
+# the organizer's user id
+ANONYMIZED_FIELDS = frozenset([
+    'displayName', 'mainEmail', 'email', 'name', 'organizerUserId',
+    'organizerDisplayName', 'requestId',
+])
+
+
+def _token(value):
+    """Return a stable anonymous token standing for value."""
+    return 'anon-%s' % hashlib.sha1(
+        unicode(value).encode('utf-8')).hexdigest()[:12]
+
+
+def _tokenId(id_):
+    """Return the anonymous key id standing for a key id."""
+    if isinstance(id_, (int, long)):
+        # a positive id of at most 48 bits
+        return int(_token(id_)[len('anon-'):], 16) or 1
+    token = _token(id_)
+    return token + '@example.com' if '@' in id_ else token
+
+
+def anonymizeKey(websafe):
+    """Return the websafe key standing for a websafe key: same kinds and
+    app, anonymous ids; a token if it doesn't decode."""
+    try:
+        key = ndb.Key(urlsafe=websafe)
+    except (TypeError, ProtocolBufferDecodeError):
+        return _token(websafe)
+    return ndb.Key(pairs=[(kind, _tokenId(id_)) for kind, id_ in key.pairs()],
+                   app=key.app()).urlsafe()
+
+
+def anonymize(value, field=None):
+    """Return a JSON value with personal data replaced by stable tokens,
+    and websafe keys by anonymous ones, so that calls about the same user
+    or entity still match."""
+    if isinstance(value, dict):
+        # conference and session names aren't personal, speaker ones are
+        return dict((k, anonymize(v, k) if k != 'name' or field == 'speaker'
+                     else v)
+                    for k, v in value.items())
+    if isinstance(value, list):
+        return [anonymize(v, field) for v in value]
+    if isinstance(value, basestring) and (field or '').startswith('websafe'):
+        return anonymizeKey(value)
+    if isinstance(value, basestring) and (
+            field in ANONYMIZED_FIELDS or '@' in value):
+        token = _token(value)
+        return token + '@example.com' if '@' in value else token
+    return value
+
+
+class CaptureMiddleware(object):
+
+    """CaptureMiddleware -- WSGI middleware logging a sample of the SPI
+    calls, anonymized, with their status and timing"""
+
+    def __init__(self, app, sample_rate=CAPTURE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not (path.startswith(SPI_PREFIX) and
+                random.random() < self.sample_rate):
+            return self.app(environ, start_response)
+
+        # read the body, then hand the app a copy of it
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(body)
+
+        status = []
+
+        def capture_start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+            return start_response(status_line, headers, exc_info)
+
+        started = time.time()
+        result = self.app(environ, capture_start_response)
+        elapsed = time.time() - started
+
+        try:
+            request = anonymize(json.loads(body)) if body else {}
+        except ValueError:
+            request = None
+        auth = environ.get('HTTP_AUTHORIZATION')
+        logging.info('%s%s', CAPTURE_PREFIX, json.dumps({
+            'ts': round(started, 3),
+            'method': path[len(SPI_PREFIX):],
+            'body': request,
+            # stable per OAuth token, so a client's calls stay together
+            'client': _token(auth) if auth else None,
+            'status': status[0] if status else None,
+            'elapsed_ms': round(elapsed * 1000, 1),
+        }, sort_keys=True))
+        return result
+
+
+def exportLines(start_time, end_time, version_ids=None):
+    """Yield the calls captured between two timestamps, as JSONL lines."""
+    for request_log in logservice.fetch(start_time=start_time,
+                                        end_time=end_time,
+                                        include_app_logs=True,
+                                        version_ids=version_ids):
+        if not request_log.resource.startswith(SPI_PREFIX):
+            continue
+        for app_log in request_log.app_logs:
+            if app_log.message.startswith(CAPTURE_PREFIX):
+                yield app_log.message[len(CAPTURE_PREFIX):] + '\n'
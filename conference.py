@@ -13,18 +13,20 @@ created by wesc on 2014 apr 21
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
-from datetime import datetime, time
-import json
-import os
+from datetime import datetime
+import hashlib
+import logging
+import random
 import time
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 
@@ -33,7 +35,16 @@ from models import ProfileMiniForm
 from models import ProfileForm
 from models import TeeShirtSize
 
+from utils import MAX_SESSION_DURATION
+from utils import MEMCACHE_CONF_VERSION_KEY
+from utils import addToSessionSummary
+from utils import bumpConferenceVersion
+from utils import cacheConferenceVersions
+from utils import getFeaturedSpeaker
 from utils import getUserId
+from utils import sessionInterval
+from utils import sessionTimeFields
+from utils import summarizeSessions
 
 from settings import WEB_CLIENT_ID
 
@@ -41,17 +52,25 @@ from models import Conference
 from models import ConferenceForm
 
 from models import ConferenceForms
+from models import ConferenceKeysForm
+from models import ConferenceResultForm
+from models import ConferenceResultForms
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
+from models import FacetCountForm
 
 from models import BooleanMessage
 from models import ConflictException
+from models import ServiceUnavailableException
+from models import SoldOutException
 
 from models import StringMessage
 
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import SessionSummary
+from models import SessionSummaryForm
 from models import SpeakerProperty
 from models import SpeakerForm
 from models import Speaker
@@ -59,6 +78,42 @@ from models import SessionType
 
 from models import TeeShirtSizeForm
 
+from models import ConferenceDetailForm
+from models import ConferenceStatsForm
+from models import ConferenceStatsForms
+from models import SessionTypeCountForm
+
+from models import CheckoutForm
+from models import CheckoutOutcome
+from models import CheckoutResultForm
+from models import CheckoutResultForms
+from models import RegistrationMetricsForm
+from models import RegistrationRecord
+from models import RosterChunkForm
+from models import RosterExport
+from models import RosterExportForm
+from models import WaitlistForm
+
+from models import WishlistSlot
+from models import WishlistConflictForm
+from models import WishlistConflictForms
+from models import WishlistUpdateForm
+
+from capture import CaptureMiddleware
+from profiler import ProfileMiddleware
+from ratelimit import rateLimited
+from unitofwork import UnitOfWork
+
+import facets
+import keyresolver
+import mailer
+import roster
+import upcoming
+import waitlist
+
+from tasks import MEMCACHE_ANNOUNCEMENTS_KEY
+from tasks import MEMCACHE_SPEAKERS_KEY
+
 
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
@@ -71,11 +126,66 @@ SESSION_BYTYPE_GET_REQUEST = endpoints.ResourceContainer(
     typeOfSession=messages.StringField(2),
 )
 
+SESSION_BYTIME_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    startTime=messages.IntegerField(2),
+    endTime=messages.IntegerField(3),
+    date=messages.StringField(4),
+    fieldMask=messages.StringField(5, repeated=True),
+)
+
 SESSION_BYSPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSpeakerKey=messages.StringField(1),
 )
 
+CONF_CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+    fieldMask=messages.StringField(3, repeated=True),
+)
+
+CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+    fieldMask=messages.StringField(2, repeated=True),
+)
+
+UPCOMING_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageToken=messages.StringField(1),
+)
+
+FIELD_MASK_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    fieldMask=messages.StringField(1, repeated=True),
+)
+
+CONF_REGISTRATION_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    requestId=messages.StringField(2),
+)
+
+ROSTER_EXPORT_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    format=messages.StringField(2),
+)
+
+ROSTER_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeExportKey=messages.StringField(1),
+)
+
+ROSTER_CHUNK_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeExportKey=messages.StringField(1),
+    index=messages.IntegerField(2),
+)
+
 CONF_PUT_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
@@ -107,13 +217,58 @@ FIELDS = {
     'TOPIC': 'topics',
     'MONTH': 'month',
     'MAX_ATTENDEES': 'maxAttendees',
+    'START_DATE': 'startDate',
 }
 
+# Conference properties fetched by projection queries when a field mask
+# only asks for listing fields; see the matching indexes in index.yaml
+CONF_PROJECTION = ('name', 'city', 'endDate', 'maxAttendees',
+                   'seatsAvailable', 'startDate')
+# ConferenceForm fields that can be filled from a projected Conference
+CONF_PROJECTION_FIELDS = frozenset(CONF_PROJECTION) | frozenset(
+    ['websafeKey', 'organizerDisplayName'])
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 
-MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT ANNOUNCEMENTS'
-MEMCACHE_SPEAKERS_KEY = 'FEATURED SPEAKERS'
+# aggregates are keyed by the conference version they were computed
+# from, so bumping a version invalidates them
+MEMCACHE_TSHIRTS_KEY = 'TSHIRTS %s %d'
+# t-shirt sizes can change without bumping a version, hence the expiry
+MEMCACHE_STATS_TTL = 600
+
+# rendered ConferenceForms of getConferences, keyed by conference version
+# and field mask; organizer names can change without bumping a version
+MEMCACHE_CONF_FORM_KEY = 'CONFERENCE FORM %s %d %s'
+MEMCACHE_CONF_FORM_TTL = 600
+# most keys a getConferences request may ask for
+MAX_BATCH_KEYS = 100
+
+# outcome of a registration, keyed by user, conference, operation and the
+# client's requestId; replays within the TTL return it as is. The key
+# holds REGISTRATION_PENDING while the first request runs, so concurrent
+# duplicates don't run it again; the claim expires if that request dies
+MEMCACHE_REGISTRATION_RESULT_KEY = 'REGISTRATION OUTCOME %s %s %s %s'
+REGISTRATION_RESULT_TTL = 600
+REGISTRATION_PENDING = 'pending'
+REGISTRATION_PENDING_TTL = 60
+# registration outcomes, also kept on the Profile for the latest
+# MAX_REGISTRATION_RECORDS requests with a requestId
+REGISTRATION_DONE = 'done'
+REGISTRATION_UNCHANGED = 'unchanged'
+REGISTRATION_SOLD_OUT = 'soldOut'
+REGISTRATION_ALREADY_REGISTERED = 'alreadyRegistered'
+MAX_REGISTRATION_RECORDS = 20
+# per conference registration counters, see getRegistrationMetrics
+MEMCACHE_REGISTRATION_METRICS_PREFIX = 'REGISTRATION METRICS %s '
+REGISTRATION_METRICS = ('attempts', 'retries', 'contentionFailures',
+                        'replays')
+# registration transaction retries on contention, with a jittered
+# exponential backoff starting at REGISTRATION_BACKOFF seconds
+REGISTRATION_RETRIES = 4
+REGISTRATION_BACKOFF = 0.05
+# most conferences a registerForConferences request may ask for
+MAX_CHECKOUT_CONFERENCES = 20
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -126,6 +281,77 @@ class ConferenceApi(remote.Service):
 
     """Conference API v0.1"""
 
+# - - - Conditional GET - - - - - - - - - - - - - - - - - - - -
+
+    def _makeEtag(self, *parts):
+        """Return a quoted ETag built from the given version parts."""
+        digest = hashlib.md5('|'.join(str(part) for part in parts))
+        return '"%s"' % digest.hexdigest()
+
+    def _getIfNoneMatch(self, request):
+        """Return the ETag sent by the client, either as the ifNoneMatch
+        parameter or as the If-None-Match header."""
+        if request.ifNoneMatch:
+            return request.ifNoneMatch
+        headers = getattr(self.request_state, 'headers', None)
+        if headers:
+            return headers.get('If-None-Match')
+        return None
+
+    def _isNotModified(self, request, etag):
+        """Return whether the client's ETag matches; Endpoints doesn't pass
+        a 304 through, so callers answer with notModified set instead."""
+        return etag == self._getIfNoneMatch(request)
+
+    @staticmethod
+    def _getConferenceVersions(wscks):
+        """Return a dict mapping websafe conference keys to their
+        (version, scheduleVersion) tuple; memcache first, datastore on miss.
+        Conferences that don't exist are left out of the result."""
+        cache_keys = dict((MEMCACHE_CONF_VERSION_KEY % wsck, wsck)
+                          for wsck in wscks)
+        cached = memcache.get_multi(cache_keys.keys())
+        versions = dict((cache_keys[k], v) for k, v in cached.items())
+
+        missing = [(wsck, keyresolver.decodeKey(wsck, Conference))
+                   for wsck in wscks if wsck not in versions]
+        missing = [(wsck, key) for wsck, key in missing if key]
+        if missing:
+            confs = keyresolver.getMulti([key for _, key in missing])
+            fresh = {}
+            for (wsck, _), conf in zip(missing, confs):
+                if conf:
+                    versions[wsck] = (conf.version, conf.scheduleVersion)
+                    fresh[MEMCACHE_CONF_VERSION_KEY % wsck] = versions[wsck]
+            memcache.add_multi(fresh)
+        return versions
+
+# - - - Field masks - - - - - - - - - - - - - - - - - - - - -
+
+    def _parseFieldMask(self, fieldMask, formClass):
+        """Return the set of form field names requested by a field mask,
+        or None when no mask was given (every field is returned)."""
+        if not fieldMask:
+            return None
+        names = set()
+        for item in fieldMask:
+            names.update(name.strip() for name in item.split(',')
+                         if name.strip())
+        valid = set(field.name for field in formClass.all_fields())
+        invalid = names - valid
+        if invalid:
+            raise endpoints.BadRequestException(
+                "Invalid field(s) in fieldMask: %s" % ', '.join(
+                    sorted(invalid)))
+        return names
+
+    def _fetchConferences(self, q, fields):
+        """Fetch a Conference query, using a projection query when the
+        field mask only asks for listing fields."""
+        if fields is not None and fields <= CONF_PROJECTION_FIELDS:
+            return q.fetch(projection=CONF_PROJECTION)
+        return q.fetch()
+
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
@@ -143,8 +369,11 @@ class ConferenceApi(remote.Service):
         pf.check_initialized()
         return pf
 
-    def _getProfileFromUser(self):
-        """Return user Profile from datastore, creating new one if non-existent."""  # noqa
+    def _getProfileFromUser(self, uow=None):
+        """Return user Profile from datastore, creating new one if non-existent.
+
+        With a UnitOfWork the profile is read through it, and a new profile
+        is only registered with it, to be written when it commits."""  # noqa
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
@@ -156,7 +385,7 @@ class ConferenceApi(remote.Service):
         p_key = ndb.Key(Profile, user_id)
 
         # Get the entity from datastore by using get() on the key
-        profile = p_key.get()
+        profile = uow.get(p_key) if uow else p_key.get()
 
         # If profile doesn't exist, we create a new one
         if not profile:
@@ -165,16 +394,21 @@ class ConferenceApi(remote.Service):
                 displayName=user.nickname(),
                 mainEmail=user.email(),
                 teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
+                wishlistIndexed=True,
             )
             # Save the profile to datastore
-            profile.put()
+            if uow:
+                uow.add(profile)
+            else:
+                profile.put()
 
         return profile      # return Profile
 
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
-        # get user Profile
-        prof = self._getProfileFromUser()
+        # get user Profile; a new one is written along with the changes
+        uow = UnitOfWork()
+        prof = self._getProfileFromUser(uow)
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
@@ -184,7 +418,8 @@ class ConferenceApi(remote.Service):
                     if val:
                         setattr(prof, field, str(val))
             # Put the modified profile to datastore
-            prof.put()
+            uow.add(prof)
+        uow.commit()
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -203,11 +438,18 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
+    def _copyConferenceToForm(self, conf, displayName, fields=None):
+        """Copy relevant fields from Conference to ConferenceForm;
+        only the fields in the mask, if one is given."""
         cf = ConferenceForm()
         for field in cf.all_fields():
-            if hasattr(conf, field.name):
+            if fields is not None and field.name not in fields:
+                continue
+            if field.name == 'sessionSummary':
+                if conf.sessionSummary:
+                    cf.sessionSummary = self._copySessionSummaryToForm(
+                        conf.sessionSummary)
+            elif hasattr(conf, field.name):
                 # convert Date to date string; just copy others
                 if field.name.endswith('Date'):
                     setattr(cf, field.name, str(getattr(conf, field.name)))
@@ -215,11 +457,21 @@ class ConferenceApi(remote.Service):
                     setattr(cf, field.name, getattr(conf, field.name))
             elif field.name == "websafeKey":
                 setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
+        if displayName and (fields is None or
+                            'organizerDisplayName' in fields):
             setattr(cf, 'organizerDisplayName', displayName)
         cf.check_initialized()
         return cf
 
+    def _copySessionSummaryToForm(self, summary):
+        """Copy relevant fields from SessionSummary to SessionSummaryForm."""
+        return SessionSummaryForm(
+            sessionCount=summary.sessionCount,
+            sessionsByType=self._copySessionsByTypeToForms(summary),
+            firstDate=str(summary.firstDate) if summary.firstDate else None,
+            lastDate=str(summary.lastDate) if summary.lastDate else None,
+            speakerCount=summary.speakerCount)
+
     def _createConferenceObject(self, request):
         """Create a Conference object, returning ConferenceForm/request."""  # noqa
         # preload necessary data items
@@ -237,6 +489,10 @@ class ConferenceApi(remote.Service):
                 for field in request.all_fields()}
         del data['websafeKey']
         del data['organizerDisplayName']
+        del data['etag']
+        del data['notModified']
+        # maintained by createSession
+        data['sessionSummary'] = SessionSummary()
 
         # add default values for those missing (both data model & outbound
         # Message)
@@ -256,6 +512,7 @@ class ConferenceApi(remote.Service):
         if data['endDate']:
             data['endDate'] = datetime.strptime(
                 data['endDate'][:10], "%Y-%m-%d").date()
+        self._checkConferenceDates(data['startDate'], data['endDate'])
 
         # set seatsAvailable to be same as maxAttendees on creation
         # both for data model & outbound Message
@@ -272,17 +529,30 @@ class ConferenceApi(remote.Service):
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
+        conf = Conference(**data)
+
+        def _putConference():
+            # the facet changes and the confirmation email to the
+            # conference creator are only enqueued if the conference
+            # commits, as part of the commit
+            conf.put()
+            facets.enqueueUpdate(conf, set(), transactional=True)
+            mailer.enqueueConferenceCreated(user.email(), conf,
+                                            transactional=True)
+            upcoming.enqueueRefresh(transactional=True)
         # create Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-
-        # Send confirmation email to the conference creator
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email'
-                      )
+        ndb.transaction(_putConference)
 
         return request
 
+    def _checkConferenceDates(self, startDate, endDate):
+        """Check that a conference doesn't end before it starts."""
+        if not (startDate and endDate):
+            return
+        if endDate < startDate:
+            raise endpoints.BadRequestException(
+                "Conference 'endDate' is before its 'startDate'")
+
     @ndb.transactional()
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
@@ -295,7 +565,7 @@ class ConferenceApi(remote.Service):
                 for field in request.all_fields()}
 
         # update existing conference
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = keyresolver.resolve(request.websafeConferenceKey, Conference)
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
@@ -305,13 +575,15 @@ class ConferenceApi(remote.Service):
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
+        old_facets = facets.facetValues(conf)
 
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
             data = getattr(request, field.name)
-            # only copy fields where we get data
-            if data not in (None, []):
+            # only copy fields where we get data; the session summary is
+            # maintained by createSession
+            if data not in (None, []) and field.name != 'sessionSummary':
                 # special handling for dates (convert string to Date)
                 if field.name in ('startDate', 'endDate'):
                     data = datetime.strptime(data, "%Y-%m-%d").date()
@@ -319,7 +591,13 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        # only a change of dates can make them inconsistent
+        if request.startDate or request.endDate:
+            self._checkConferenceDates(conf.startDate, conf.endDate)
+        bumpConferenceVersion(conf)
         conf.put()
+        facets.enqueueUpdate(conf, old_facets, transactional=True)
+        upcoming.enqueueRefresh(transactional=True)
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
@@ -351,6 +629,9 @@ class ConferenceApi(remote.Service):
         for filtr in filters:
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
+            elif filtr["field"] == "startDate":
+                filtr["value"] = datetime.strptime(
+                    filtr["value"][:10], "%Y-%m-%d").date()
             formatted_query = ndb.query.FilterNode(
                 filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
@@ -387,35 +668,192 @@ class ConferenceApi(remote.Service):
             formatted_filters.append(filtr)
         return (inequality_field, formatted_filters)
 
+    def _copyFacetCountsToForms(self, counts):
+        """Copy facet counts to FacetCountForms, most frequent first."""
+        return [FacetCountForm(field=field, value=value, count=count)
+                for field in sorted(counts)
+                for value, count in sorted(counts[field].items(),
+                                           key=lambda item: -item[1])]
+
     @endpoints.method(ConferenceQueryForms, ConferenceForms,
                       path='queryConferences',
                       http_method='POST',
                       name='queryConferences')
+    @rateLimited
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
+        fields = self._parseFieldMask(request.fieldMask, ConferenceForm)
+        q = self._getQuery(request)
+
+        # projected queries need their own composite index, which only
+        # exists for the unfiltered listing
+        if request.filters:
+            conferences = q.fetch()
+        else:
+            conferences = self._fetchConferences(q, fields)
 
         # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "")
+        cfs = ConferenceForms(
+            items=[self._copyConferenceToForm(conf, "", fields)
                    for conf in conferences]
         )
+        if request.includeFacets:
+            cfs.facets = self._copyFacetCountsToForms(facets.getCounts())
+        return cfs
+
+    @endpoints.method(UPCOMING_GET_REQUEST, ConferenceForms,
+                      path='conferences/upcoming',
+                      http_method='GET', name='getUpcomingConferences')
+    def getUpcomingConferences(self, request):
+        """Return a page of the conferences that haven't ended yet, by
+        start date; pass the nextPageToken to get the next page."""
+        # the first pages are precomputed, see upcoming.py
+        confs, next_token = upcoming.getPage(request.pageToken)
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(conf, "") for conf in confs],
+            nextPageToken=next_token
+        )
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
+        fields = self._parseFieldMask(request.fieldMask, ConferenceForm)
+
+        # validate the client's ETag against the cached version first
+        wsck = request.websafeConferenceKey
+        versions = self._getConferenceVersions([wsck])
+        if wsck not in versions:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        etag = self._makeEtag(wsck, versions[wsck][0], sorted(fields or []))
+        if self._isNotModified(request, etag):
+            return ConferenceForm(etag=etag, notModified=True)
+
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = keyresolver.resolve(wsck, Conference)
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)  # noqa
+                'No conference found with key: %s' % wsck)
         prof = conf.key.parent().get()
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        cf = self._copyConferenceToForm(
+            conf, getattr(prof, 'displayName'), fields)
+        cf.etag = etag
+        return cf
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @staticmethod
+    def _isConferenceKey(wsck):
+        """Return whether wsck is a well-formed websafe Conference key."""
+        return keyresolver.decodeKey(wsck, Conference) is not None
+
+    @endpoints.method(ConferenceKeysForm, ConferenceResultForms,
+                      path='conferences/batch',
+                      http_method='POST', name='getConferences')
+    def getConferences(self, request):
+        """Return the requested conferences (by websafeConferenceKeys), in
+        request order; missing ones are marked found=False."""
+        fields = self._parseFieldMask(request.fieldMask, ConferenceForm)
+        wscks = request.websafeConferenceKeys
+        if len(wscks) > MAX_BATCH_KEYS:
+            raise endpoints.BadRequestException(
+                'At most %d conference keys per request' % MAX_BATCH_KEYS)
+        unique = [wsck for wsck in set(wscks) if self._isConferenceKey(wsck)]
+
+        # step 1: rendered forms cached under the current conference
+        # versions, both read from memcache
+        mask = ','.join(sorted(fields)) if fields is not None else '*'
+        version_keys = dict((MEMCACHE_CONF_VERSION_KEY % wsck, wsck)
+                            for wsck in unique)
+        form_keys = {}
+        for key, versions in memcache.get_multi(version_keys.keys()).items():
+            wsck = version_keys[key]
+            form_keys[wsck] = MEMCACHE_CONF_FORM_KEY % (wsck, versions[0],
+                                                        mask)
+        cached = memcache.get_multi(form_keys.values())
+        forms = dict((wsck, protojson.decode_message(ConferenceForm,
+                                                     cached[form_key]))
+                     for wsck, form_key in form_keys.items()
+                     if form_key in cached)
+
+        # step 2: one get_multi for the other conferences, and one for
+        # their distinct organizers
+        missing = [wsck for wsck in unique if wsck not in forms]
+        if missing:
+            confs = keyresolver.getMulti(
+                [ndb.Key(urlsafe=wsck) for wsck in missing])
+            p_keys = list(set(conf.key.parent() for conf in confs if conf))
+            organizers = dict(zip(p_keys, ndb.get_multi(p_keys)))
+
+            fresh_forms = {}
+            fresh_versions = {}
+            for wsck, conf in zip(missing, confs):
+                if not conf:
+                    continue
+                forms[wsck] = self._copyConferenceToForm(
+                    conf, getattr(organizers[conf.key.parent()],
+                                  'displayName', None), fields)
+                fresh_forms[MEMCACHE_CONF_FORM_KEY % (
+                    wsck, conf.version, mask)] = protojson.encode_message(
+                        forms[wsck])
+                fresh_versions[MEMCACHE_CONF_VERSION_KEY % wsck] = (
+                    conf.version, conf.scheduleVersion)
+            memcache.set_multi(fresh_forms, time=MEMCACHE_CONF_FORM_TTL)
+            memcache.add_multi(fresh_versions)
+
+        return ConferenceResultForms(items=[
+            ConferenceResultForm(websafeConferenceKey=wsck,
+                                 found=wsck in forms,
+                                 conference=forms.get(wsck))
+            for wsck in wscks])
+
+    @endpoints.method(CONF_GET_REQUEST, ConferenceDetailForm,
+                      path='conference/{websafeConferenceKey}/detail',
+                      http_method='GET', name='getConferenceDetail')
+    def getConferenceDetail(self, request):
+        """Return requested conference with the caller's registration and
+        wishlist state, its session summary and featured speaker."""
+        wsck = request.websafeConferenceKey
+        c_key = keyresolver.decodeKey(wsck, Conference)
+        if not c_key or keyresolver.isMissing(c_key):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        # the conference, its organizer (the parent key) and the caller's
+        # profile, if signed in, are fetched in parallel
+        conf_future = c_key.get_async()
+        organizer_future = c_key.parent().get_async()
+        user = endpoints.get_current_user()
+        prof_future = None
+        if user:
+            prof_future = ndb.Key(Profile, getUserId(user)).get_async()
+
+        conf = conf_future.get_result()
+        if not conf:
+            keyresolver.rememberMissing([c_key])
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        organizer = organizer_future.get_result()
+        prof = prof_future.get_result() if prof_future else None
+        summary = conf.sessionSummary or SessionSummary()
+
+        detail = ConferenceDetailForm(
+            conference=self._copyConferenceToForm(
+                conf, getattr(organizer, 'displayName', None)),
+            isAttending=bool(prof and wsck in prof.conferenceKeysToAttend),
+            sessionCount=summary.sessionCount,
+            sessionsByType=self._copySessionsByTypeToForms(summary),
+            featuredSpeaker=self._copyFeaturedSpeakerToForm(summary),
+        )
+        if prof:
+            # wishlisted sessions that belong to this conference
+            detail.wishlistSessionKeys = [
+                wssk for wssk in prof.sessionKeysWishlist
+                if ndb.Key(urlsafe=wssk).parent() == c_key]
+        return detail
+
+    @endpoints.method(FIELD_MASK_REQUEST, ConferenceForms,
                       path='getConferencesCreated',
                       http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
@@ -424,11 +862,13 @@ class ConferenceApi(remote.Service):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
+        fields = self._parseFieldMask(request.fieldMask, ConferenceForm)
 
         # make profile key
         p_key = ndb.Key(Profile, getUserId(user))
         # create ancestor query for this user
-        conferences = Conference.query(ancestor=p_key)
+        conferences = self._fetchConferences(
+            Conference.query(ancestor=p_key), fields)
         # get the user profile and display name
         prof = p_key.get()
 
@@ -436,7 +876,7 @@ class ConferenceApi(remote.Service):
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(
-                conf, displayName) for conf in conferences]
+                conf, displayName, fields) for conf in conferences]
         )
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -466,16 +906,105 @@ class ConferenceApi(remote.Service):
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
+    @staticmethod
+    def _countRegistration(wsck, **deltas):
+        """Add deltas to the registration counters of a conference."""
+        memcache.offset_multi(
+            deltas, key_prefix=MEMCACHE_REGISTRATION_METRICS_PREFIX % wsck,
+            initial_value=0)
+
+    def _runRegistrationTransaction(self, wsck, callback):
+        """Run callback in an xg transaction, retrying on contention with a
+        jittered exponential backoff; return its result."""
+        self._countRegistration(wsck, attempts=1)
+        backoff = REGISTRATION_BACKOFF
+        for retry in range(REGISTRATION_RETRIES + 1):
+            try:
+                # ndb's own retries would back off in lockstep with every
+                # other contending request, so they're disabled here
+                return ndb.transaction(callback, xg=True, retries=0)
+            except datastore_errors.TransactionFailedError:
+                if retry == REGISTRATION_RETRIES:
+                    break
+                self._countRegistration(wsck, retries=1)
+                time.sleep(random.uniform(0, backoff))
+                backoff *= 2
+        self._countRegistration(wsck, contentionFailures=1)
+        raise ServiceUnavailableException(
+            'Too many concurrent registrations, please try again.')
+
     def _conferenceRegistration(self, request, reg=True):
-        """Register or unregister user for selected conference."""
-        retval = None
-        prof = self._getProfileFromUser()  # get user Profile
+        """Register or unregister user for selected conference; requests
+        repeating a requestId get the outcome of the first one back."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        c_key = keyresolver.decodeKey(wsck, Conference)
+        if not c_key or keyresolver.isMissing(c_key):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        # claim the requestId before opening a transaction; a duplicate
+        # finds the claim, or the outcome to replay
+        record_id = result_key = None
+        if request.requestId:
+            operation = 'reg' if reg else 'unreg'
+            record_id = '%s %s %s' % (operation, wsck, request.requestId)
+            result_key = MEMCACHE_REGISTRATION_RESULT_KEY % (
+                getUserId(user), wsck, operation, request.requestId)
+            if not memcache.add(result_key, REGISTRATION_PENDING,
+                                time=REGISTRATION_PENDING_TTL):
+                outcome = memcache.get(result_key)
+                if outcome == REGISTRATION_PENDING:
+                    raise ConflictException(
+                        'Request %s is in progress, please retry.' %
+                        request.requestId)
+                if outcome is not None:
+                    self._countRegistration(wsck, replays=1)
+                    return self._registrationResult(outcome)
+
+        try:
+            outcome = self._runRegistrationTransaction(
+                wsck, lambda: self._conferenceRegistrationTxn(
+                    wsck, reg, record_id))
+        except Exception:
+            if result_key:
+                # give the claim up, so a retry runs the registration
+                memcache.delete(result_key)
+            raise
+        if result_key:
+            memcache.set(result_key, outcome, time=REGISTRATION_RESULT_TTL)
+        return self._registrationResult(outcome)
+
+    @staticmethod
+    def _registrationResult(outcome):
+        """Return the BooleanMessage of a registration outcome, or raise
+        the exception it stands for."""
+        if outcome == REGISTRATION_SOLD_OUT:
+            raise SoldOutException(
+                "There are no seats available.")
+        if outcome == REGISTRATION_ALREADY_REGISTERED:
+            raise ConflictException(
+                "You have already registered for this conference")
+        return BooleanMessage(data=outcome == REGISTRATION_DONE)
+
+    def _conferenceRegistrationTxn(self, wsck, reg, record_id=None):
+        """Register or unregister user for selected conference, in a
+        transaction; return the outcome. With a record_id the outcome is
+        recorded on the Profile, and a request recorded already returns
+        its outcome without changing anything."""
+        uow = UnitOfWork()
+        prof = self._getProfileFromUser(uow)  # get user Profile
+        if record_id:
+            for record in prof.registrationRecords:
+                if record.requestId == record_id:
+                    # a retry of a request that committed
+                    return record.outcome
 
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
-        wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
+        conf = uow.get(ndb.Key(urlsafe=wsck))
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
@@ -484,99 +1013,321 @@ class ConferenceApi(remote.Service):
         if reg:
             # check if user already registered otherwise add
             if wsck in prof.conferenceKeysToAttend:
-                raise ConflictException(
-                    "You have already registered for this conference")
+                outcome = REGISTRATION_ALREADY_REGISTERED
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
+            # check if seats avail; seats freed up while users are
+            # waitlisted go to them first
+            elif conf.seatsAvailable <= 0 or conf.waitlistLength > 0:
+                outcome = REGISTRATION_SOLD_OUT
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            else:
+                prof.conferenceKeysToAttend.append(wsck)
+                conf.seatsAvailable -= 1
+                outcome = REGISTRATION_DONE
 
         # unregister
         else:
             # check if user already registered
             if wsck in prof.conferenceKeysToAttend:
 
-                # unregister user, add back one seat
+                # unregister user, add back one seat and hand it over to
+                # the waitlist once the transaction commits
                 prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
-                retval = True
+                waitlist.enqueuePromotion(wsck, transactional=True)
+                outcome = REGISTRATION_DONE
             else:
-                retval = False
+                outcome = REGISTRATION_UNCHANGED
+
+        # write things back to the datastore, with a single put_multi
+        if outcome == REGISTRATION_DONE:
+            bumpConferenceVersion(conf)
+            uow.add(conf)
+            uow.add(prof)
+        if record_id:
+            prof.registrationRecords = [RegistrationRecord(
+                requestId=record_id, outcome=outcome)] + \
+                prof.registrationRecords[:MAX_REGISTRATION_RECORDS - 1]
+            uow.add(prof)
+        uow.commit()
+        return outcome
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+    @staticmethod
+    @ndb.tasklet
+    def _changeSeatsAsync(c_key, delta):
+        """Add delta to a conference's seatsAvailable in a transaction of
+        its own, unless no seat is left or, taking seats, while users are
+        waitlisted; return whether it changed and the Conference (None if
+        it doesn't exist)."""
+        @ndb.tasklet
+        def txn():
+            conf = yield c_key.get_async()
+            if not conf or conf.seatsAvailable + delta < 0 or \
+                    (delta < 0 and conf.waitlistLength > 0):
+                raise ndb.Return((False, conf))
+            conf.seatsAvailable += delta
+            # concurrent transactions can't use bumpConferenceVersion's
+            # commit hook; the caller refreshes the memcache copy
+            conf.version += 1
+            yield conf.put_async()
+            raise ndb.Return((True, conf))
+        result = yield ndb.transaction_async(txn)
+        raise ndb.Return(result)
+
+    def _releaseSeats(self, c_keys):
+        """Give back a seat taken in each conference, in parallel; return
+        the Conferences changed."""
+        futures = [(c_key, self._changeSeatsAsync(c_key, 1))
+                   for c_key in c_keys]
+        confs = []
+        for c_key, future in futures:
+            try:
+                released, conf = future.get_result()
+            except datastore_errors.TransactionFailedError:
+                # the seat stays taken until the seats reconciliation
+                logging.error('Failed to release a seat of conference %s',
+                              c_key.urlsafe())
+                continue
+            if released:
+                confs.append(conf)
+                waitlist.enqueuePromotion(c_key.urlsafe())
+        return confs
+
+    @endpoints.method(CheckoutForm, CheckoutResultForms,
+                      path='conferences/checkout',
+                      http_method='POST', name='registerForConferences')
+    def registerForConferences(self, request):
+        """Register user for several conferences at once: all or nothing,
+        or as many as possible with bestEffort; no waitlist is joined."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wscks = []
+        for wsck in request.websafeConferenceKeys:
+            if wsck not in wscks:
+                wscks.append(wsck)
+        if len(wscks) > MAX_CHECKOUT_CONFERENCES:
+            raise endpoints.BadRequestException(
+                'At most %d conferences per checkout' %
+                MAX_CHECKOUT_CONFERENCES)
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+        prof = self._getProfileFromUser()
+        outcomes = {}
+        c_keys = {}
+        for wsck in wscks:
+            c_key = keyresolver.decodeKey(wsck, Conference)
+            if not c_key:
+                outcomes[wsck] = CheckoutOutcome.NOT_FOUND
+            elif wsck in prof.conferenceKeysToAttend:
+                outcomes[wsck] = CheckoutOutcome.ALREADY_REGISTERED
+            else:
+                c_keys[wsck] = c_key
+
+        # step 1: take a seat in every conference, each in a transaction
+        # of its own, all of them in parallel
+        futures = [(wsck, self._changeSeatsAsync(c_key, -1))
+                   for wsck, c_key in c_keys.items()]
+        changed = []
+        for wsck, future in futures:
+            try:
+                taken, conf = future.get_result()
+            except datastore_errors.TransactionFailedError:
+                outcomes[wsck] = CheckoutOutcome.CONTENTION
+                self._countRegistration(wsck, attempts=1,
+                                        contentionFailures=1)
+                continue
+            self._countRegistration(wsck, attempts=1)
+            if taken:
+                outcomes[wsck] = CheckoutOutcome.REGISTERED
+                changed.append(conf)
+            elif conf:
+                outcomes[wsck] = CheckoutOutcome.SOLD_OUT
+            else:
+                outcomes[wsck] = CheckoutOutcome.NOT_FOUND
+        taken = [wsck for wsck in wscks
+                 if outcomes[wsck] == CheckoutOutcome.REGISTERED]
+        failed = [wsck for wsck in wscks if outcomes[wsck] not in (
+            CheckoutOutcome.REGISTERED, CheckoutOutcome.ALREADY_REGISTERED)]
+
+        # step 2: record the registrations in the profile, at once
+        proceed = request.bestEffort or not failed
+        added = []
+        if taken and proceed:
+            def _addRegistrations():
+                uow = UnitOfWork()
+                prof = self._getProfileFromUser(uow)
+                new = [wsck for wsck in taken
+                       if wsck not in prof.conferenceKeysToAttend]
+                prof.conferenceKeysToAttend.extend(new)
+                uow.add(prof)
+                uow.commit()
+                return new
+            try:
+                added = ndb.transaction(_addRegistrations)
+            except datastore_errors.TransactionFailedError:
+                changed.extend(self._releaseSeats(
+                    [c_keys[wsck] for wsck in taken]))
+                self._refreshConferenceVersions(changed)
+                raise ServiceUnavailableException(
+                    'Too many concurrent registrations, please try again.')
+
+        # give back the seats not recorded: all of them when the checkout
+        # failed, or the ones a concurrent registration recorded first
+        released = [wsck for wsck in taken if wsck not in added]
+        for wsck in released:
+            outcomes[wsck] = (CheckoutOutcome.ALREADY_REGISTERED if proceed
+                              else CheckoutOutcome.CANCELLED)
+        changed.extend(self._releaseSeats([c_keys[wsck] for wsck in released]))
+        self._refreshConferenceVersions(changed)
+
+        return CheckoutResultForms(items=[
+            CheckoutResultForm(websafeConferenceKey=wsck,
+                               outcome=outcomes[wsck])
+            for wsck in wscks])
+
+    @staticmethod
+    def _refreshConferenceVersions(confs):
+        """Move forward the memcache copies of the versions of conferences
+        changed outside bumpConferenceVersion."""
+        for conf in confs:
+            cacheConferenceVersions(conf.key.urlsafe(),
+                                    (conf.version, conf.scheduleVersion))
+
+    @endpoints.method(CONF_REGISTRATION_REQUEST, WaitlistForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='POST', name='registerForConference')
     def registerForConference(self, request):
-        """Register user for selected conference."""
-        return self._conferenceRegistration(request)
+        """Register user for selected conference; when it's sold out the
+        user is queued on its waitlist instead, and gets their position
+        back. Retries may repeat the requestId of the first attempt to get
+        its result back."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+        wsck = request.websafeConferenceKey
+        c_key = keyresolver.decodeKey(wsck, Conference)
+        if not c_key or keyresolver.isMissing(c_key):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+        # a waitlisted user gets their position back without opening the
+        # registration transaction
+        entry = waitlist.entryKey(wsck, user_id).get()
+        if not entry:
+            try:
+                self._conferenceRegistration(request)
+                return WaitlistForm(websafeConferenceKey=wsck,
+                                    registered=True)
+            except SoldOutException:
+                # make sure the profile exists for the promotion task
+                self._getProfileFromUser()
+                entry = waitlist.join(wsck, user_id)
+        return WaitlistForm(websafeConferenceKey=wsck, registered=False,
+                            position=waitlist.position(entry))
+
+    @endpoints.method(CONF_REGISTRATION_REQUEST, BooleanMessage,
                       path='unregisterFromConference /{websafeConferenceKey}',
                       http_method='POST', name='unregisterFromConference')
     def unregisterFromConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request, False)
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(CONF_GET_REQUEST, RegistrationMetricsForm,
+                      path='conference/{websafeConferenceKey}/registrationMetrics',  # noqa
+                      http_method='GET', name='getRegistrationMetrics')
+    def getRegistrationMetrics(self, request):
+        """Return registration contention counters of selected conference
+        (by organizer)."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        conf = keyresolver.resolve(wsck, Conference)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can view the registration metrics.')
+
+        counters = memcache.get_multi(
+            REGISTRATION_METRICS,
+            key_prefix=MEMCACHE_REGISTRATION_METRICS_PREFIX % wsck)
+        rf = RegistrationMetricsForm(websafeConferenceKey=wsck)
+        for name in REGISTRATION_METRICS:
+            setattr(rf, name, counters.get(name, 0))
+        return rf
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistForm,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='GET', name='getWaitlistPosition')
+    def getWaitlistPosition(self, request):
+        """Return user's position on the waitlist of selected conference."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        c_key = keyresolver.decodeKey(wsck, Conference)
+        if not c_key or keyresolver.isMissing(c_key):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        wf = WaitlistForm(websafeConferenceKey=wsck,
+                          registered=wsck in prof.conferenceKeysToAttend)
+        entry = waitlist.entryKey(wsck, prof.key.id()).get()
+        if entry:
+            wf.position = waitlist.position(entry)
+        return wf
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+                      path='conference/{websafeConferenceKey}/waitlist/leave',  # noqa
+                      http_method='POST', name='leaveWaitlist')
+    def leaveWaitlist(self, request):
+        """Remove user from the waitlist of selected conference."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        if not keyresolver.decodeKey(wsck, Conference):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        return BooleanMessage(data=waitlist.leave(wsck, getUserId(user)))
+
+    @endpoints.method(CONDITIONAL_GET_REQUEST, ConferenceForms,
                       path='conferences/attending',
                       http_method='GET', name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
+        fields = self._parseFieldMask(request.fieldMask, ConferenceForm)
+
         # step 1: get user profile
         prof = self._getProfileFromUser()
 
         # step 2: get conferenceKeysToAttend from profile.
         wscks = prof.conferenceKeysToAttend
 
-        # step 3: fetch conferences from datastore.
+        # step 3: validate the client's ETag against the cached versions
+        versions = self._getConferenceVersions(wscks)
+        etag = self._makeEtag(sorted(fields or []),
+                              *['%s:%s' % (wsck, versions.get(wsck))
+                                for wsck in wscks])
+        if self._isNotModified(request, etag):
+            return ConferenceForms(etag=etag, notModified=True)
+
+        # step 4: fetch conferences from datastore.
         ds_keys = [ndb.Key(urlsafe=wsck) for wsck in wscks]
 
         conferences = ndb.get_multi(ds_keys)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, "")
-                                      for conf in conferences]
+        return ConferenceForms(items=[self._copyConferenceToForm(
+                                          conf, "", fields)
+                                      for conf in conferences],
+                               etag=etag
                                )
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job.
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
-
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
@@ -590,12 +1341,13 @@ class ConferenceApi(remote.Service):
 
 # - - - Task 1: Session objects - - - - - - - - - - - - - - - - -
 
-    def _getSpeaker(self, email):
+    def _getSpeaker(self, email, uow):
+        """Return Speaker through the unit of work, creating a new one if non-existent."""  # noqa
         # Create a new key of kind Speaker from the id.
         s_key = ndb.Key(Speaker, email)
 
         # Get the entity from datastore by using get() on the key
-        speaker = s_key.get()
+        speaker = uow.get(s_key)
 
         # If speaker doesn't exist, we create a new one
         if not speaker:
@@ -603,23 +1355,26 @@ class ConferenceApi(remote.Service):
                 key=s_key,
                 email=email,  # e-mail is enough, no name to store
             )
-            # Save the speaker to datastore
-            speaker.put()
+            # Save the speaker to datastore when the unit of work commits
+            uow.add(speaker)
 
         return speaker     # return Speaker
 
-    def _addSessionToSpeaker(self, session_key, speakerForm):
+    def _addSessionToSpeaker(self, session_key, speakerForm, uow):
         """Append session key to Speaker entity given in the parameter as SpeakerForm entity"""  # noqa
-        speakerObj = self._getSpeaker(speakerForm.email)
+        speakerObj = self._getSpeaker(speakerForm.email, uow)
         speakerObj.sessionKeysToAttend.append(session_key.urlsafe())
-        speakerObj.put()
+        uow.add(speakerObj)
         # Return the speaker websafe key
         return speakerObj.key.urlsafe()
 
-    def _copySessionToForm(self, sess):
-        """Copy relevant fields from Session to SessionForm."""
+    def _copySessionToForm(self, sess, fields=None):
+        """Copy relevant fields from Session to SessionForm;
+        only the fields in the mask, if one is given."""
         sf = SessionForm()
         for field in sf.all_fields():
+            if fields is not None and field.name not in fields:
+                continue
             if hasattr(sess, field.name):
                 if field.name == 'speaker':
                     sf.speaker = SpeakerForm(
@@ -655,15 +1410,14 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # get Conference Key from websafeConferenceKey
-        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        # get the actual Conference object
-        conf = c_key.get()
+        # get the Conference object from websafeConferenceKey
+        conf = keyresolver.resolve(request.websafeConferenceKey, Conference)
 
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)  # noqa
+        c_key = conf.key
 
         # check that user is owner
         if user_id != conf.organizerUserId:
@@ -685,13 +1439,20 @@ class ConferenceApi(remote.Service):
             data['date'] = datetime.strptime(
                 data['date'][:10], "%Y-%m-%d").date()
 
-        if data['startTime']:
-            # If start time was given we want to be sure it's in military
-            # format
-            startTimeDigits = len(str(data['startTime']))
-            if startTimeDigits < 3 or startTimeDigits > 4:
-                raise endpoints.BadRequestException(
-                    "Start time must be in military notation (3 or 4 digits)")
+        if data['duration'] and not (
+                0 < data['duration'] <= MAX_SESSION_DURATION):
+            raise endpoints.BadRequestException(
+                "Duration must be between 1 and %d minutes" %
+                MAX_SESSION_DURATION)
+
+        # If start time was given we want to be sure it's in military
+        # format, then store its normalized start/end minutes & timestamp
+        try:
+            data.update(sessionTimeFields(
+                data['date'], data['startTime'], data['duration']))
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "Start time must be in military notation (e.g. 930 or 1430)")
 
         if data['sessionType']:
             # Convert enum field to string
@@ -709,25 +1470,51 @@ class ConferenceApi(remote.Service):
                 "Speaker 'e-mail' field cannot be empty"
             )
 
-        # Add the websafe session key to the speaker object
-        # and return the websafe speaker key
-        wssk = self._addSessionToSpeaker(s_key, data['speaker'])
-        speaker = SpeakerProperty(
-            name=data['speaker'].name,
-            email=data['speaker'].email,
-            websafeSpeakerKey=wssk
-        )
-
-        # Overwrite the inbound SpeakerForm object with
-        # the SpeakerProperty object
-        data['speaker'] = speaker
-
         # Get rid of useless field. Session object has not such fields
         del data['websafeConferenceKey']
         del data['websafeKey']
-
-        # create Session
-        Session(**data).put()
+        speakerForm = data.pop('speaker')
+
+        def _putSession():
+            # the Speaker, the Session and the Conference (for its schedule
+            # version) are written together when the unit of work commits
+            uow = UnitOfWork()
+
+            # a speaker is new to the conference if none of their
+            # sessions belongs to it
+            speaker = self._getSpeaker(speakerForm.email, uow)
+            newSpeaker = not any(
+                ndb.Key(urlsafe=key).parent() == c_key
+                for key in speaker.sessionKeysToAttend)
+
+            # Add the websafe session key to the speaker object
+            # and return the websafe speaker key
+            wssk = self._addSessionToSpeaker(s_key, speakerForm, uow)
+
+            # Store the speaker in the Session's SpeakerProperty
+            sess = Session(speaker=SpeakerProperty(
+                name=speakerForm.name,
+                email=speakerForm.email,
+                websafeSpeakerKey=wssk
+            ), **data)
+            uow.add(sess)
+
+            conf = uow.get(c_key)
+            if conf.sessionSummary is None:
+                # created before the summaries; the ancestor query sees
+                # the sessions committed so far
+                conf.sessionSummary = summarizeSessions(
+                    Session.query(ancestor=c_key))
+            addToSessionSummary(conf.sessionSummary, sess, newSpeaker)
+            # the summary is part of the conference's forms
+            bumpConferenceVersion(conf)
+            bumpConferenceVersion(conf, schedule=True)
+            uow.add(conf)
+
+            uow.commit()
+            return sess
+        # create Session in a transaction spanning the Speaker entity group
+        sess = ndb.transaction(_putSession, xg=True)
 
         # Set a new featured speaker, if any
         taskqueue.add(
@@ -735,28 +1522,36 @@ class ConferenceApi(remote.Service):
             url='/tasks/set_featured_speaker'
         )
 
-        # return SessionForm object
-        return self._copySessionToForm(s_key.get())
+        # return SessionForm object, built from the entity in memory
+        return self._copySessionToForm(sess)
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, SessionForms,
                       path='getConferenceSessions/{websafeConferenceKey}',
                       http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
         """Return all the sessions in a given conference."""
-        # get Conference object from request; bail if not found
+        fields = self._parseFieldMask(request.fieldMask, SessionForm)
+
+        # check that the conference exists and validate the client's
+        # ETag against the cached schedule version; bail if not found
         wsck = request.websafeConferenceKey
-        c_key = ndb.Key(urlsafe=wsck)
-        conf = c_key.get()
-        if not conf:
+        versions = self._getConferenceVersions([wsck])
+        if wsck not in versions:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        etag = self._makeEtag(wsck, 'schedule', versions[wsck][1],
+                              sorted(fields or []))
+        if self._isNotModified(request, etag):
+            return SessionForms(etag=etag, notModified=True)
 
         # Get sessions for the given conference
+        c_key = ndb.Key(urlsafe=wsck)
         q = Session.query(ancestor=c_key).order(Session.name).fetch()
 
         # return set of SessionForm objects
         return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in q]
+            items=[self._copySessionToForm(sess, fields) for sess in q],
+            etag=etag
         )
 
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
@@ -773,8 +1568,7 @@ class ConferenceApi(remote.Service):
         """Return conference sessions by type."""
         # get Conference object from request; bail if not found
         wsck = request.websafeConferenceKey
-        c_key = ndb.Key(urlsafe=wsck)
-        conf = c_key.get()
+        conf = keyresolver.resolve(wsck, Conference)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
@@ -782,7 +1576,7 @@ class ConferenceApi(remote.Service):
         # Turn the session type into an uppercased string
         sess_type = request.typeOfSession.upper()
         # Get sessions for the given conference, filtered by type
-        q = Session.query(ancestor=c_key).\
+        q = Session.query(ancestor=conf.key).\
             filter(Session.sessionType == sess_type).\
             order(Session.name).\
             fetch()
@@ -792,6 +1586,63 @@ class ConferenceApi(remote.Service):
             items=[self._copySessionToForm(sess)for sess in q]
         )
 
+    def _sessionEndMinute(self, sess):
+        """Return the session end minute; a session with no duration is
+        considered to last one minute."""
+        if sess.endMinute is None:
+            return sess.startMinute + 1
+        return sess.endMinute
+
+    @endpoints.method(SESSION_BYTIME_GET_REQUEST, SessionForms,
+                      path='getConferenceSessionsByTime/{websafeConferenceKey}',  # noqa
+                      http_method='GET', name='getConferenceSessionsByTime')
+    def getConferenceSessionsByTime(self, request):
+        """Return conference sessions running between startTime and endTime
+        (military notation), optionally on a given date (ISO format)."""
+        fields = self._parseFieldMask(request.fieldMask, SessionForm)
+        try:
+            windowStart = sessionTimeFields(
+                None, request.startTime, None)['startMinute']
+            windowEnd = sessionTimeFields(
+                None, request.endTime, None)['startMinute']
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "Start and end time must be in military notation")
+        if windowStart is None or windowEnd is None or \
+                windowEnd <= windowStart:
+            raise endpoints.BadRequestException(
+                "'startTime' and a later 'endTime' are required")
+
+        # get Conference object from request; bail if not found
+        wsck = request.websafeConferenceKey
+        conf = keyresolver.resolve(wsck, Conference)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        # A session overlaps the window if it starts before the window ends
+        # and ends after it starts. Only one inequality filter is allowed,
+        # so the start is bounded on both sides (no session lasts longer
+        # than MAX_SESSION_DURATION) and the end is checked in memory.
+        q = Session.query(ancestor=conf.key)
+        if request.date:
+            try:
+                date = datetime.strptime(
+                    request.date[:10], "%Y-%m-%d").date()
+            except ValueError:
+                raise endpoints.BadRequestException(
+                    "Session 'date' must be ISO format: YYYY-MM-DD")
+            q = q.filter(Session.date == date)
+        q = q.filter(Session.startMinute > windowStart - MAX_SESSION_DURATION)
+        q = q.filter(Session.startMinute < windowEnd)
+        q = q.order(Session.startMinute)
+
+        # return set of SessionForm objects
+        return SessionForms(
+            items=[self._copySessionToForm(sess, fields) for sess in q
+                   if self._sessionEndMinute(sess) > windowStart]
+        )
+
     @endpoints.method(SESSION_BYSPEAKER_GET_REQUEST, SessionForms,
                       path='getSessionsBySpeaker/{websafeSpeakerKey}',
                       http_method='GET', name='getSessionsBySpeaker')
@@ -799,8 +1650,7 @@ class ConferenceApi(remote.Service):
         """Get sessions by speaker, across al the conferences."""
         # get Speaker object from request; bail if not found
         wssk = request.websafeSpeakerKey
-        speaker_key = ndb.Key(urlsafe=wssk)
-        speaker = speaker_key.get()
+        speaker = keyresolver.resolve(wssk, Speaker)
         if not speaker:
             raise endpoints.NotFoundException(
                 'No speaker found with key: %s' % wssk)
@@ -817,6 +1667,63 @@ class ConferenceApi(remote.Service):
 
 # - - - Task 2: Wishlist - - - - - - - - - - - - - - - - - - - -
 
+    def _bisectSlots(self, slots, minute, right=False):
+        """Binary search the start-sorted wishlist slots; return the index
+        of the first slot starting at (or, if right, after) minute."""
+        lo, hi = 0, len(slots)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if slots[mid].start < minute or (
+                    right and slots[mid].start == minute):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _ensureWishlistIndex(self, prof):
+        """Build the wishlist interval index of a Profile created before
+        the index existed; returns True when the profile was modified."""
+        if prof.wishlistIndexed:
+            return False
+        wsskeys = prof.sessionKeysWishlist
+        sessions = ndb.get_multi([ndb.Key(urlsafe=wssk) for wssk in wsskeys])
+        slots = []
+        for wssk, sess in zip(wsskeys, sessions):
+            interval = sessionInterval(sess) if sess else None
+            if interval:
+                slots.append(WishlistSlot(
+                    websafeSessionKey=wssk, start=interval[0],
+                    end=interval[1]))
+        slots.sort(key=lambda slot: slot.start)
+        prof.wishlistSlots = slots
+        prof.wishlistMaxDuration = max(
+            [slot.end - slot.start for slot in slots] or [0])
+        prof.wishlistIndexed = True
+        return True
+
+    def _findWishlistConflicts(self, prof, interval):
+        """Return the websafe keys of the wishlisted sessions overlapping
+        the given (start, end) interval, in O(log n + conflicts).
+
+        Slots are sorted by start and none lasts longer than
+        wishlistMaxDuration, so only slots starting within
+        (start - wishlistMaxDuration, end) can overlap."""
+        start, end = interval
+        slots = prof.wishlistSlots
+        lo = self._bisectSlots(
+            slots, start - prof.wishlistMaxDuration, right=True)
+        hi = self._bisectSlots(slots, end)
+        return [slot.websafeSessionKey for slot in slots[lo:hi]
+                if slot.end > start]
+
+    def _addToWishlistIndex(self, prof, wssk, interval):
+        """Insert a session's slot in the wishlist interval index."""
+        start, end = interval
+        pos = self._bisectSlots(prof.wishlistSlots, start, right=True)
+        prof.wishlistSlots.insert(pos, WishlistSlot(
+            websafeSessionKey=wssk, start=start, end=end))
+        prof.wishlistMaxDuration = max(prof.wishlistMaxDuration, end - start)
+
     @endpoints.method(
         endpoints.ResourceContainer(
             message_types.VoidMessage,
@@ -830,15 +1737,14 @@ class ConferenceApi(remote.Service):
         """Add a session to the user's wishlist"""
         # get Session object from request; bail if not found
         wssk = request.websafeSessionKey
-        sess_key = ndb.Key(urlsafe=wssk)
-        session = sess_key.get()
-        print session
+        sess_key = keyresolver.decodeKey(wssk, Session)
+        if not sess_key:
+            raise endpoints.BadRequestException(
+                'The websafeKey: %s does not belong to a Session object' % wssk)  # noqa
+        session = keyresolver.getMulti([sess_key])[0]
         if not session:
             raise endpoints.NotFoundException(
                 'No session found with key: %s' % wssk)
-        elif sess_key.kind() != 'Session':
-            raise endpoints.BadRequestException(
-                'The websafeKey: %s does not belong to a Session object' % wssk)  # noqa
 
         # Get the session's ancestor conference
         conference = sess_key.parent().get()
@@ -856,12 +1762,105 @@ class ConferenceApi(remote.Service):
             raise ConflictException(
                 'You have already added this session to your wishlist')
 
+        # Look for schedule conflicts with the sessions already in the
+        # wishlist; they are reported back, not rejected
+        self._ensureWishlistIndex(prof)
+        conflicts = []
+        interval = sessionInterval(session)
+        if interval:
+            conflicts = self._findWishlistConflicts(prof, interval)
+            self._addToWishlistIndex(prof, wssk, interval)
+
         # Add the session key to the user's wishlist
         prof.sessionKeysWishlist.append(wssk)
         prof.put()
 
         # return ProfileForm
-        return self._copyProfileToForm(prof)
+        pf = self._copyProfileToForm(prof)
+        pf.wishlistConflicts = conflicts
+        return pf
+
+    @endpoints.method(WishlistUpdateForm, ProfileForm,
+                      path='wishlist',
+                      http_method='POST', name='updateWishlist')
+    def updateWishlist(self, request):
+        """Add sessions to and remove sessions from the user's wishlist at
+        once; sessions already in the wishlist, or not in it, are ignored"""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        # keys to add, without duplicates, in request order
+        add = []
+        for wssk in request.add:
+            if wssk not in add:
+                add.append(wssk)
+        remove = set(request.remove)
+        if remove.intersection(add):
+            raise endpoints.BadRequestException(
+                'Sessions both added and removed: %s' %
+                ', '.join(sorted(remove.intersection(add))))
+
+        # check the keys before reading anything
+        s_keys = {}
+        for wssk in add:
+            s_key = keyresolver.decodeKey(wssk, Session)
+            if not s_key:
+                raise endpoints.BadRequestException(
+                    'The websafeKey: %s does not belong to a Session object' % wssk)  # noqa
+            s_keys[wssk] = s_key
+
+        # the profile and every session with a single get_multi
+        uow = UnitOfWork()
+        uow.get_multi([ndb.Key(Profile, getUserId(user))] + s_keys.values())
+        prof = self._getProfileFromUser(uow)
+
+        missing = [wssk for wssk in add if not uow.get(s_keys[wssk])]
+        if missing:
+            raise endpoints.NotFoundException(
+                'No session found with keys: %s' % ', '.join(missing))
+        # the conference keys are the parents of the session keys
+        attending = set(prof.conferenceKeysToAttend)
+        unregistered = [wssk for wssk in add
+                        if s_keys[wssk].parent().urlsafe() not in attending]
+        if unregistered:
+            raise ConflictException(
+                'You need to be registered to the conference in order to join a session: %s' %  # noqa
+                ', '.join(unregistered))
+
+        wishlist = set(prof.sessionKeysWishlist)
+        added = [wssk for wssk in add if wssk not in wishlist]
+        removed = remove & wishlist
+        modified = self._ensureWishlistIndex(prof) or added or removed
+
+        if removed:
+            prof.sessionKeysWishlist = [wssk for wssk in
+                                        prof.sessionKeysWishlist
+                                        if wssk not in removed]
+            # the index stays sorted; wishlistMaxDuration remains an
+            # upper bound
+            prof.wishlistSlots = [slot for slot in prof.wishlistSlots
+                                  if slot.websafeSessionKey not in removed]
+
+        # Look for schedule conflicts with the sessions already in the
+        # wishlist, including the ones added before in this request
+        conflicts = set()
+        for wssk in added:
+            interval = sessionInterval(uow.get(s_keys[wssk]))
+            if interval:
+                conflicts.update(self._findWishlistConflicts(prof, interval))
+                self._addToWishlistIndex(prof, wssk, interval)
+        prof.sessionKeysWishlist.extend(added)
+
+        # write the profile once
+        if modified:
+            uow.add(prof)
+        uow.commit()
+
+        # return ProfileForm
+        pf = self._copyProfileToForm(prof)
+        pf.wishlistConflicts = sorted(conflicts)
+        return pf
 
     @endpoints.method(
         message_types.VoidMessage,
@@ -884,6 +1883,35 @@ class ConferenceApi(remote.Service):
             items=[self._copySessionToForm(sess)for sess in q]
         )
 
+    @endpoints.method(
+        message_types.VoidMessage,
+        WishlistConflictForms,
+        path='getWishlistConflicts',
+        http_method='GET',
+        name='getWishlistConflicts'
+    )
+    def getWishlistConflicts(self, request):
+        """Get all the pairs of sessions overlapping in the user's wishlist"""
+        # get user Profile
+        prof = self._getProfileFromUser()
+        if self._ensureWishlistIndex(prof):
+            prof.put()
+
+        # Sweep the start-sorted slots; every slot is compared only with
+        # the following ones starting before it ends
+        conflicts = []
+        slots = prof.wishlistSlots
+        for i, slot in enumerate(slots):
+            for other in slots[i + 1:]:
+                if other.start >= slot.end:
+                    break
+                conflicts.append(WishlistConflictForm(
+                    websafeSessionKey=slot.websafeSessionKey,
+                    conflictingSessionKey=other.websafeSessionKey))
+
+        # return set of WishlistConflictForm objects
+        return WishlistConflictForms(items=conflicts)
+
 # - - - Task 3: Additional queries - - - - - - - - - - - - - - - - -
 
     @endpoints.method(
@@ -895,6 +1923,7 @@ class ConferenceApi(remote.Service):
         http_method='GET',
         name='getSessionsByDate'
     )
+    @rateLimited
     def getSessionsByDate(self, request):
         """Get sessions on a given date (ISO format)."""
         date = None
@@ -927,32 +1956,61 @@ class ConferenceApi(remote.Service):
         http_method='GET',
         name='getTshirtsByConference'
     )
+    @rateLimited
     def getTshirtsByConference(self, request):
         """Get the amount of t-shirts, grouped by size, that are needed for the given conference"""  # noqa
         # get Conference object from request; bail if not found
         wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
+        conf = keyresolver.resolve(wsck, Conference)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)  # noqa
 
-        # Get all the people who are meant to attend the given conference
-        q = Profile.query().filter(Profile.conferenceKeysToAttend == str(wsck))
-
-        # Init a new TeeShirtSizeForm instance
-        tShirts = TeeShirtSizeForm()
-
-        # Loop through users attending the conference and add 1 unit
-        # to the corresponging tshirt size group in the TeeShirtSizeForm
-        # instance
-        for user in q:
-            setattr(
-                tShirts,
-                user.teeShirtSize,
-                getattr(tShirts, user.teeShirtSize) + 1
-            )
-
         # return TeeShirtSizeForm object
+        totals = self._getTshirtTotalsAsync([conf]).get_result()[wsck]
+        return self._copyTshirtTotalsToForm(totals)
+
+    @ndb.tasklet
+    def _getTshirtTotalsAsync(self, confs):
+        """Return {websafeConferenceKey: {teeShirtSize: amount}} for the
+        given conferences, from memcache or else with concurrent projection
+        queries on the attending profiles."""
+        cache_keys = dict(
+            (MEMCACHE_TSHIRTS_KEY % (conf.key.urlsafe(), conf.version), conf)
+            for conf in confs)
+        totals = memcache.get_multi(cache_keys.keys())
+
+        # Run a query for every cache miss
+        missing = [cache_key for cache_key in cache_keys
+                   if cache_key not in totals]
+        results = []
+        if missing:
+            results = yield [Profile.query(
+                Profile.conferenceKeysToAttend ==
+                cache_keys[cache_key].key.urlsafe()
+            ).fetch_async(projection=[Profile.teeShirtSize])
+                for cache_key in missing]
+
+        fresh = {}
+        for cache_key, profiles in zip(missing, results):
+            # add 1 unit to the corresponding tshirt size group for every
+            # user attending the conference
+            sizes = {}
+            for prof in profiles:
+                sizes[prof.teeShirtSize] = sizes.get(prof.teeShirtSize, 0) + 1
+            fresh[cache_key] = sizes
+        if fresh:
+            memcache.set_multi(fresh, time=MEMCACHE_STATS_TTL)
+        totals.update(fresh)
+
+        raise ndb.Return(dict((conf.key.urlsafe(), totals[cache_key])
+                              for cache_key, conf in cache_keys.items()))
+
+    def _copyTshirtTotalsToForm(self, totals):
+        """Copy {teeShirtSize: amount} to a TeeShirtSizeForm."""
+        tShirts = TeeShirtSizeForm()
+        for size, amount in totals.items():
+            setattr(tShirts, size, amount)
         return tShirts
 
     @endpoints.method(
@@ -967,14 +2025,13 @@ class ConferenceApi(remote.Service):
         that are not workshops, for a given conference"""
         # get Conference object from request; bail if not found
         wsck = request.websafeConferenceKey
-        c_key = ndb.Key(urlsafe=wsck)
-        conf = c_key.get()
+        conf = keyresolver.resolve(wsck, Conference)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
         # Get sessions which start before 7pm for the given conference
-        q = Session.query(ancestor=c_key).\
+        q = Session.query(ancestor=conf.key).\
             filter(Session.startTime < 1900).\
             order(Session.startTime).\
             fetch()
@@ -996,53 +2053,6 @@ class ConferenceApi(remote.Service):
 
 # - - - Task 4: Featured Speaker - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheFeaturedSpeaker(websafeSessionKey):
-        """Create Featured Speaker & assign to memcache; used by
-        memcache cron job."""
-
-        featuredSpeaker = {}
-
-        # Get session
-        new_s_key = ndb.Key(urlsafe=websafeSessionKey)
-        new_session = new_s_key.get()
-        if not new_session:
-            raise endpoints.NotFoundException(
-                'No session found with key: %s' % websafeSessionKey)
-
-        # Retrieve conference parent's key
-        c_key = new_s_key.parent()
-        conference = c_key.get()
-
-        # Get all the sessions for the given conference
-        q = Session.query(ancestor=c_key).fetch()
-
-        # Set an empty dictionary to hold the new session
-        # speaker's websafe key and init it to 0
-        new_speakerKey = {}
-        new_speakerKey[new_session.speaker.websafeSpeakerKey] = 0
-
-        # check if new speakers are attending more than one
-        # session in the same conference
-        for session in q:
-            if session.speaker.websafeSpeakerKey in new_speakerKey:
-                new_speakerKey[session.speaker.websafeSpeakerKey] += 1
-                if new_speakerKey[session.speaker.websafeSpeakerKey] > 1:
-                    featuredSpeaker['name'] = session.speaker.name
-                    featuredSpeaker['email'] = session.speaker.email
-                    break
-
-        if any(featuredSpeaker):
-            # If there is a featured speaker we put it in the memcache
-            speaker = 'Come and listen to the best speakers! %s, %s, %s %s' % (
-                featuredSpeaker['name'],
-                featuredSpeaker['email'],
-                'is going to attend the:',
-                conference.name + ' conference!')
-            memcache.set(MEMCACHE_SPEAKERS_KEY, speaker)
-
-        return featuredSpeaker
-
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/getFeaturedSpeaker',
                       http_method='GET', name='getFeaturedSpeaker')
@@ -1053,5 +2063,158 @@ class ConferenceApi(remote.Service):
             speaker = 'There are no featured speakers'
         return StringMessage(data=speaker)
 
-# registers API
-api = endpoints.api_server([ConferenceApi])
+# - - - Organizer dashboard - - - - - - - - - - - - - - - - - - -
+
+    def _copySessionsByTypeToForms(self, summary):
+        """Copy the session counts by type of a SessionSummary to
+        SessionTypeCountForms."""
+        byType = summary.sessionsByType or {}
+        return [SessionTypeCountForm(
+                    sessionType=getattr(SessionType, sessType), count=count)
+                for sessType, count in sorted(byType.items())]
+
+    def _copyFeaturedSpeakerToForm(self, summary):
+        """Copy the featured speaker of a SessionSummary, if any, to
+        SpeakerForm."""
+        featured = getFeaturedSpeaker(summary)
+        if not featured:
+            return None
+        return SpeakerForm(
+            name=featured['name'],
+            email=featured['email'],
+            websafeSpeakerKey=featured['websafeSpeakerKey'])
+
+    def _copyStatsToForm(self, conf, displayName, tShirts):
+        """Copy a Conference and its statistics to ConferenceStatsForm."""
+        summary = conf.sessionSummary or SessionSummary()
+        return ConferenceStatsForm(
+            conference=self._copyConferenceToForm(conf, displayName),
+            registrations=(conf.maxAttendees or 0) - (
+                conf.seatsAvailable or 0),
+            seatsAvailable=conf.seatsAvailable,
+            sessionCount=summary.sessionCount,
+            sessionsByType=self._copySessionsByTypeToForms(summary),
+            featuredSpeaker=self._copyFeaturedSpeakerToForm(summary),
+            tShirts=self._copyTshirtTotalsToForm(tShirts),
+        )
+
+    @endpoints.method(message_types.VoidMessage, ConferenceStatsForms,
+                      path='organizerDashboard',
+                      http_method='GET', name='getOrganizerDashboard')
+    @rateLimited
+    def getOrganizerDashboard(self, request):
+        """Return statistics for every conference created by user."""
+        # make sure user is authed
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        # get the conferences and the organizer profile in parallel
+        p_key = ndb.Key(Profile, getUserId(user))
+        confs_future = Conference.query(ancestor=p_key).fetch_async()
+        prof_future = p_key.get_async()
+        confs = confs_future.get_result()
+        displayName = getattr(prof_future.get_result(), 'displayName', None)
+
+        # session statistics come from each conference's stored summary;
+        # t-shirt totals are cached, and their misses queried concurrently
+        tShirts = self._getTshirtTotalsAsync(confs).get_result()
+
+        # return set of ConferenceStatsForm objects per Conference
+        return ConferenceStatsForms(
+            items=[self._copyStatsToForm(
+                conf, displayName, tShirts[conf.key.urlsafe()])
+                for conf in confs]
+        )
+
+# - - - Roster export - - - - - - - - - - - - - - - - - - - - - -
+
+    def _getOrganizedConference(self, wsck):
+        """Return a Conference organized by the current user; bail if it's
+        not found or someone else's."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        conf = keyresolver.resolve(wsck, Conference)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can export the attendee roster.')
+        return conf
+
+    def _getRosterExport(self, wsek):
+        """Return a RosterExport of a conference organized by the current
+        user; bail if it's not found."""
+        export = keyresolver.resolve(wsek, RosterExport)
+        if not export:
+            raise endpoints.NotFoundException(
+                'No roster export found with key: %s' % wsek)
+        self._getOrganizedConference(export.websafeConferenceKey)
+        return export
+
+    def _copyRosterExportToForm(self, export):
+        """Copy relevant fields from RosterExport to RosterExportForm."""
+        return RosterExportForm(
+            websafeExportKey=export.key.urlsafe(),
+            websafeConferenceKey=export.websafeConferenceKey,
+            format=export.format,
+            status=roster.status(export),
+            rows=export.rows,
+            chunks=export.chunks,
+            created=str(export.created),
+            finished=str(export.finished) if export.finished else None)
+
+    @endpoints.method(ROSTER_EXPORT_REQUEST, RosterExportForm,
+                      path='conference/{websafeConferenceKey}/roster',
+                      http_method='POST', name='exportRoster')
+    def exportRoster(self, request):
+        """Start an export of the attendee roster of selected conference
+        (by organizer), as csv (default) or jsonl; a running export is
+        returned instead, a stalled one is resumed."""
+        wsck = request.websafeConferenceKey
+        self._getOrganizedConference(wsck)
+        fmt = (request.format or 'csv').lower()
+        if fmt not in roster.FORMATS:
+            raise endpoints.BadRequestException(
+                'Roster format must be one of: %s' % ', '.join(roster.FORMATS))  # noqa
+
+        export = roster.latestExport(wsck)
+        if export and not export.finished:
+            if roster.status(export) == 'STALLED':
+                roster.resume(export)
+        else:
+            export = roster.start(wsck, fmt)
+        return self._copyRosterExportToForm(export)
+
+    @endpoints.method(ROSTER_GET_REQUEST, RosterExportForm,
+                      path='roster/{websafeExportKey}',
+                      http_method='GET', name='getRosterExport')
+    def getRosterExport(self, request):
+        """Return the progress of a roster export (by organizer)."""
+        return self._copyRosterExportToForm(
+            self._getRosterExport(request.websafeExportKey))
+
+    @endpoints.method(ROSTER_CHUNK_GET_REQUEST, RosterChunkForm,
+                      path='roster/{websafeExportKey}/chunk/{index}',
+                      http_method='GET', name='getRosterChunk')
+    def getRosterChunk(self, request):
+        """Return a chunk of a finished roster export (by organizer); the
+        roster is its chunks, in index order."""
+        export = self._getRosterExport(request.websafeExportKey)
+        if not export.finished:
+            raise ConflictException('The roster export is not finished.')
+        data = roster.getChunk(export, request.index or 0)
+        if data is None:
+            raise endpoints.NotFoundException(
+                'No chunk %s in roster export: %s' %
+                (request.index, request.websafeExportKey))
+        return RosterChunkForm(websafeExportKey=request.websafeExportKey,
+                               index=request.index or 0,
+                               data=data.decode('utf-8'))
+
+# registers API, capturing a sample of the calls for replays and
+# profiling another
+api = CaptureMiddleware(ProfileMiddleware(
+    endpoints.api_server([ConferenceApi])))
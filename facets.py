@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""facets.py
+
+Facet counts of the queryConferences filters: the number of conferences
+per CITY, TOPIC and MONTH value, kept in sharded counters. Conference
+creations and updates enqueue the changes, transactionally when they
+can; the totals are cached in memcache per field, so queryConferences
+gets every facet count with a single get_multi.
+
+Each task carries an update id, the conference key and version. The
+update picks the shard of each counter from its id, and records the
+ids applied on the shard, so a retried task changes nothing.
+
+"""
+
+import hashlib
+import random
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import FacetCounterShard
+
+MEMCACHE_FACETS_PREFIX = 'FACET COUNTS '
+# counter reads are eventually consistent, hence the expiry
+MEMCACHE_FACETS_TTL = 60
+
+# update ids recorded per shard; retries come long before this many other
+# updates of the same shard
+MAX_APPLIED_UPDATES = 50
+
+# shards per counter: every conference has a month, and months have few
+# values, so their counters are the hottest
+FACET_SHARDS = {
+    'CITY': 4,
+    'TOPIC': 4,
+    'MONTH': 8,
+}
+
+
+def facetValues(conf):
+    """Return the set of (field, value) facets of a Conference."""
+    values = set(('TOPIC', topic) for topic in conf.topics)
+    if conf.city:
+        values.add(('CITY', conf.city))
+    if conf.month:
+        values.add(('MONTH', str(conf.month)))
+    return values
+
+
+def enqueueUpdate(conf, old, transactional=False):
+    """Enqueue a task applying the facet changes of a Conference since its
+    facetValues were old; nothing is enqueued when there are none."""
+    new = facetValues(conf)
+    deltas = [(field, value, 1) for field, value in new - old] + \
+        [(field, value, -1) for field, value in old - new]
+    if deltas:
+        taskqueue.add(params={'update': '%s %d' % (conf.key.urlsafe(),
+                                                   conf.version),
+                              'field': [d[0] for d in deltas],
+                              'value': [d[1] for d in deltas],
+                              'delta': [d[2] for d in deltas]},
+                      url='/tasks/update_facets',
+                      transactional=transactional)
+
+
+def _shardKey(field, value, index):
+    """Return the key of a FacetCounterShard."""
+    return ndb.Key(FacetCounterShard, '%s|%s|%d' % (field, value, index))
+
+
+@ndb.transactional
+def _increment(update_id, field, value, delta):
+    """Add delta to a shard of a facet counter, unless the update was
+    applied to it already; the shard is picked from the update id, so a
+    retry of the update finds it."""
+    if update_id:
+        index = int(hashlib.md5(update_id).hexdigest(), 16)
+    else:
+        # a task enqueued without an update id
+        index = random.randint(0, FACET_SHARDS[field] - 1)
+    key = _shardKey(field, value, index % FACET_SHARDS[field])
+    shard = key.get() or FacetCounterShard(key=key, field=field, value=value)
+    if update_id in shard.appliedUpdates:
+        return
+    shard.count += delta
+    if update_id:
+        shard.appliedUpdates = (shard.appliedUpdates +
+                                [update_id])[-MAX_APPLIED_UPDATES:]
+    shard.put()
+
+
+def update(update_id, deltas):
+    """Apply the (field, value, delta) facet changes of an update, once;
+    drop the cached totals of the fields changed."""
+    for field, value, delta in deltas:
+        _increment(update_id, field, value, delta)
+    memcache.delete_multi(set(field for field, _, _ in deltas),
+                          key_prefix=MEMCACHE_FACETS_PREFIX)
+
+
+def _countField(field):
+    """Return the totals of a field's counters, as a value -> count dict."""
+    totals = {}
+    for shard in FacetCounterShard.query(FacetCounterShard.field == field):
+        totals[shard.value] = totals.get(shard.value, 0) + shard.count
+    return dict((value, count) for value, count in totals.items() if count)
+
+
+def getCounts():
+    """Return the facet counts of every field, as a field -> (value ->
+    count) dict; served from memcache, counters are only read for the
+    fields missing there."""
+    counts = memcache.get_multi(FACET_SHARDS.keys(),
+                                key_prefix=MEMCACHE_FACETS_PREFIX)
+    missing = dict((field, _countField(field))
+                   for field in FACET_SHARDS if field not in counts)
+    if missing:
+        memcache.set_multi(missing, key_prefix=MEMCACHE_FACETS_PREFIX,
+                           time=MEMCACHE_FACETS_TTL)
+        counts.update(missing)
+    return counts
+
+
+def rebuild():
+    """Recount every facet from the Conferences, replacing the counters;
+    changes made while it runs can be lost."""
+    totals = {}
+    for conf in Conference.query().iter(batch_size=500):
+        for facet in facetValues(conf):
+            totals[facet] = totals.get(facet, 0) + 1
+
+    ndb.delete_multi(FacetCounterShard.query().iter(keys_only=True))
+    ndb.put_multi([FacetCounterShard(key=_shardKey(field, value, 0),
+                                     field=field, value=value, count=count)
+                   for (field, value), count in totals.items()])
+    memcache.delete_multi(FACET_SHARDS.keys(),
+                          key_prefix=MEMCACHE_FACETS_PREFIX)
+    return len(totals)
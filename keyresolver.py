@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""keyresolver.py
+
+Resolution of the websafe keys clients send. decodeKey() checks that a
+key is well formed, of the expected kind and of this app before any RPC
+is made. Not-found Conference and Session keys are remembered in memcache
+for MISSING_TTL seconds, so crawlers and stale clients asking for dead
+keys again never reach the datastore.
+
+Only kinds with allocated ids are remembered: a missing key of theirs
+never comes into existence later, unlike a Speaker (keyed by email) or
+a Profile (keyed by user id).
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+MEMCACHE_MISSING_KEY = 'MISSING %s'
+MISSING_TTL = 60
+
+NEGATIVE_CACHED_KINDS = frozenset(['Conference', 'Session'])
+
+
+def decodeKey(websafe, model):
+    """Return the ndb.Key of a websafe key of model's kind from this app,
+    or None when it's malformed, of another kind or of another app."""
+    if not websafe:
+        return None
+    try:
+        key = ndb.Key(urlsafe=websafe)
+    except (TypeError, ProtocolBufferDecodeError):
+        return None
+    kind = model._get_kind()
+    if key.kind() != kind or key.id() is None or \
+            key.app() != ndb.Key(kind, 1).app():
+        return None
+    return key
+
+
+def _cacheKeys(keys):
+    """Return a dict mapping memcache keys to the negatively cacheable
+    keys among keys."""
+    return dict((MEMCACHE_MISSING_KEY % key.urlsafe(), key) for key in keys
+                if key.kind() in NEGATIVE_CACHED_KINDS)
+
+
+def isMissing(key):
+    """Return whether key was recently found missing."""
+    cache_keys = _cacheKeys([key])
+    return bool(cache_keys and memcache.get(cache_keys.keys()[0]))
+
+
+def rememberMissing(keys):
+    """Remember that keys were found missing."""
+    cache_keys = _cacheKeys(keys)
+    if cache_keys:
+        memcache.set_multi(dict.fromkeys(cache_keys, 1), time=MISSING_TTL)
+
+
+def getMulti(keys):
+    """Like ndb.get_multi, except that keys recently found missing are
+    returned as None without reading the datastore."""
+    cache_keys = _cacheKeys(keys)
+    known = set(cache_keys[cache_key] for cache_key in
+                memcache.get_multi(cache_keys.keys())) if cache_keys else ()
+    to_get = [key for key in set(keys) if key not in known]
+    entities = dict(zip(to_get, ndb.get_multi(to_get)))
+    rememberMissing([key for key in to_get if entities[key] is None])
+    return [entities.get(key) for key in keys]
+
+
+def resolve(websafe, model):
+    """Return the entity of a websafe key of model's kind, or None when
+    the key is invalid or missing."""
+    key = decodeKey(websafe, model)
+    return getMulti([key])[0] if key else None
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""mailer.py
+
+Email notifications, sent through the 'mail' pull queue. Requests only
+enqueue the structured data of a notification, in the transaction that
+commits what it's about; a cron job leases the queued notifications in
+batches, renders them and sends one email per recipient, combining the
+notifications of a recipient into a digest.
+
+"""
+
+import json
+import logging
+import time
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+MAIL_QUEUE = 'mail'
+# notifications leased per batch, and how long they're leased for
+LEASE_SIZE = 100
+LEASE_SECONDS = 60
+# time a worker run spends leasing batches, within the cron deadline
+WORKER_SECONDS = 30
+# failed deliveries of a notification before it's dropped
+MAX_RETRIES = 5
+
+MEMCACHE_MAIL_METRICS_PREFIX = 'MAIL METRICS '
+MAIL_METRICS = ('notifications', 'emails', 'digests', 'failures',
+                'lagSeconds')
+
+CONFERENCE_CREATED = 'conference_created'
+
+CONFERENCE_FIELDS = ('name', 'city', 'startDate', 'endDate', 'topics',
+                     'maxAttendees')
+
+
+# - - - Enqueueing - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def enqueue(kind, email, data, transactional=False):
+    """Queue a notification of kind for email, rendered from data; tagged
+    by recipient, so that a recipient's notifications can be combined."""
+    payload = json.dumps({'kind': kind, 'email': email, 'data': data,
+                          'enqueued': time.time()})
+    taskqueue.Queue(MAIL_QUEUE).add(
+        taskqueue.Task(payload=payload, method='PULL', tag=email),
+        transactional=transactional)
+
+
+def enqueueConferenceCreated(email, conf, transactional=False):
+    """Queue the confirmation of a Conference creation for its organizer."""
+    data = {}
+    for field in CONFERENCE_FIELDS:
+        value = getattr(conf, field)
+        data[field] = str(value) if field.endswith('Date') and value \
+            else value
+    enqueue(CONFERENCE_CREATED, email, data, transactional=transactional)
+
+
+# - - - Rendering - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _renderConference(data):
+    """Render a conference's data as a few lines of text."""
+    lines = [data['name']]
+    if data.get('city'):
+        lines.append(data['city'])
+    if data.get('startDate'):
+        lines.append('%s - %s' % (data['startDate'],
+                                  data.get('endDate') or '?'))
+    if data.get('topics'):
+        lines.append('Topics: %s' % ', '.join(data['topics']))
+    if data.get('maxAttendees'):
+        lines.append('Seats: %d' % data['maxAttendees'])
+    return '\r\n'.join(lines)
+
+
+def render(notifications):
+    """Render a recipient's notifications as one (subject, body) email; a
+    digest when there's more than one."""
+    confs = [_renderConference(n['data']) for n in notifications
+             if n['kind'] == CONFERENCE_CREATED]
+    if len(confs) == 1:
+        return ('You created a new Conference!',
+                'Hi, you have created the following conference:'
+                '\r\n\r\n%s' % confs[0])
+    return ('You created %d new Conferences!' % len(confs),
+            'Hi, you have created the following conferences:'
+            '\r\n\r\n%s' % '\r\n\r\n'.join(confs))
+
+
+# - - - Worker - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _countMetrics(**deltas):
+    """Add deltas to the mail metrics counters."""
+    memcache.offset_multi(deltas, key_prefix=MEMCACHE_MAIL_METRICS_PREFIX,
+                          initial_value=0)
+
+
+def getMetrics():
+    """Return the mail metrics counters, as a name -> value dict."""
+    counters = memcache.get_multi(MAIL_METRICS,
+                                  key_prefix=MEMCACHE_MAIL_METRICS_PREFIX)
+    return dict((name, counters.get(name, 0)) for name in MAIL_METRICS)
+
+
+def sendBatch(queue=None):
+    """Lease a batch of notifications and send them, one email per
+    recipient; return the number of notifications leased."""
+    queue = queue or taskqueue.Queue(MAIL_QUEUE)
+    leased = queue.lease_tasks(LEASE_SECONDS, LEASE_SIZE)
+    if not leased:
+        return 0
+
+    by_email = {}
+    dropped = []
+    for task in leased:
+        if task.retry_count > MAX_RETRIES:
+            logging.error('Dropping notification after %d retries: %s',
+                          task.retry_count, task.payload)
+            dropped.append(task)
+            continue
+        by_email.setdefault(task.tag, []).append(task)
+
+    sender = 'noreply@%s.appspotmail.com' % (
+        app_identity.get_application_id())
+    sent = []
+    emails = digests = failures = 0
+    try:
+        for email, tasks in by_email.items():
+            notifications = [json.loads(task.payload) for task in tasks]
+            subject, body = render(notifications)
+            try:
+                mail.send_mail(sender, email, subject, body)
+            except mail.Error:
+                # left leased; they're sent again once the lease expires
+                logging.exception('Failed to send %d notifications to %s',
+                                  len(tasks), email)
+                failures += 1
+                continue
+            sent.extend(tasks)
+            emails += 1
+            digests += len(tasks) > 1
+    finally:
+        # however the loop ends (e.g. over quota, or out of time), the
+        # notifications sent must not be sent again
+        if sent or dropped:
+            queue.delete_tasks(sent + dropped)
+        now = time.time()
+        lag = sum(now - json.loads(task.payload)['enqueued']
+                  for task in sent)
+        _countMetrics(notifications=len(sent), emails=emails,
+                      digests=digests, failures=failures,
+                      lagSeconds=int(lag))
+    return len(leased)
+
+
+def run(deadline=WORKER_SECONDS):
+    """Send queued notifications, batch after batch, until the queue is
+    empty or deadline seconds have passed; return how many were leased."""
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    start = time.time()
+    total = 0
+    while time.time() - start < deadline:
+        leased = sendBatch(queue)
+        total += leased
+        if leased < LEASE_SIZE:
+            break
+    return total
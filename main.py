@@ -1,21 +1,66 @@
 #!/usr/bin/env python
+import json
+import time
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
-from conference import ConferenceApi
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ReconciliationJob
+
+# The handlers only import the background modules below, never the
+# Endpoints API layer in conference.py (bar the warmup handler), so that
+# they start fast on a cold instance.
+import capture
+import facets
+import mailer
+import profiler
+import reconcile
+import roster
+import tasks
+import upcoming
+import waitlist
+
+
+class WarmupHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Load the API layer and prime caches on a new instance."""
+        # importing conference builds the endpoints api_server, which
+        # would otherwise happen on the first /_ah/spi/ request
+        from conference import ConferenceApi
+
+        # prime the announcement and the version counters of the hot
+        # (nearly sold out) conferences used by conditional GETs
+        hot_confs = tasks.nearlySoldOutConferences()
+        if memcache.get(tasks.MEMCACHE_ANNOUNCEMENTS_KEY) is None:
+            tasks.cacheAnnouncement()
+        ConferenceApi._getConferenceVersions(
+            [conf.key.urlsafe() for conf in hot_confs])
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
 
     def get(self):
         """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        tasks.cacheAnnouncement()
+
+
+class SendMailHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Send the notifications queued in the mail pull queue."""
+        mailer.run()
 
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
 
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation; only drains the
+        tasks enqueued before the mail pull queue."""
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -32,11 +77,204 @@ class SetFeaturedtSpeaker(webapp2.RequestHandler):
     def post(self):
         """Set Featured Speaker in Memcache."""
         wssk = self.request.get('session')
-        ConferenceApi._cacheFeaturedSpeaker(wssk)
+        tasks.cacheFeaturedSpeaker(wssk)
+
+
+class BackfillSessionTimesHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Start the Session times backfill."""
+        taskqueue.add(url='/tasks/backfill_session_times')
+        self.response.write('Session times backfill started.')
+
+    def post(self):
+        """Backfill Session times, one batch per task."""
+        cursor = self.request.get('cursor')
+        tasks.backfillSessionTimes(
+            ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+
+class BackfillSessionSummariesHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Start the Conference session summaries backfill."""
+        taskqueue.add(url='/tasks/backfill_session_summaries')
+        self.response.write('Session summaries backfill started.')
+
+    def post(self):
+        """Backfill session summaries, one batch per task."""
+        cursor = self.request.get('cursor')
+        tasks.backfillSessionSummaries(
+            ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+
+class ReindexEntitiesHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Start rewriting the entities whose properties were unindexed."""
+        taskqueue.add(url='/tasks/reindex_entities')
+        self.response.write('Index rewrite started.')
+
+    def post(self):
+        """Rewrite a batch of entities, one batch per task."""
+        cursor = self.request.get('cursor')
+        tasks.reindexEntities(int(self.request.get('step') or 0),
+                              ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+
+class ReconcileSeatsHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Start a seats reconciliation job, or report on one."""
+        self.response.headers['Content-Type'] = 'text/plain'
+        job_id = self.request.get('job')
+        if job_id:
+            job = ReconciliationJob.get_by_id(int(job_id))
+            if not job:
+                self.abort(404)
+        else:
+            job = reconcile.start(self.request.get_range(
+                'shards', 1, reconcile.MAX_SHARDS, reconcile.DEFAULT_SHARDS))
+        self.response.write(reconcile.report(job))
+
+    def post(self):
+        """Reconcile a batch of one shard's Profiles."""
+        reconcile.processBatch(self.request.get('shard'),
+                               int(self.request.get('batch')))
+
+
+class ReconcileSeatsMergeHandler(webapp2.RequestHandler):
+
+    def post(self):
+        """Fix a batch of Conferences from the job's partial sums."""
+        cursor = self.request.get('cursor')
+        reconcile.merge(int(self.request.get('job')),
+                        ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+
+class AnalyticsSnapshotHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Start the analytics snapshot export."""
+        import snapshot
+        snap = snapshot.start()
+        self.response.write('Analytics snapshot %d started.' % snap.key.id())
+
+    def post(self):
+        """Export a batch of the analytics snapshot, or merge it."""
+        # NumPy is only loaded by the instances running the export
+        import snapshot
+        snapshot_id = int(self.request.get('snapshot'))
+        if self.request.get('merge'):
+            snapshot.merge(snapshot_id)
+            return
+        cursor = self.request.get('cursor')
+        snapshot.exportBatch(snapshot_id, int(self.request.get('step')),
+                             int(self.request.get('batch')),
+                             ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+
+class AnalyticsReportHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Serve the registration statistics of the latest snapshot."""
+        import snapshot
+        report = snapshot.latestReport()
+        if report is None:
+            self.abort(404, detail='No analytics snapshot yet.')
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(report))
+
+
+class UpdateFacetsHandler(webapp2.RequestHandler):
+
+    def post(self):
+        """Apply conference facet count changes."""
+        facets.update(self.request.get('update'),
+                      zip(self.request.get_all('field'),
+                          self.request.get_all('value'),
+                          [int(d) for d in self.request.get_all('delta')]))
+
+
+class RebuildFacetsHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Recount the conference facets from scratch."""
+        self.response.write('%d facet counters rebuilt.' % facets.rebuild())
+
+
+class RefreshUpcomingHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Refresh the upcoming conferences pages as conferences end."""
+        upcoming.refresh()
+
+    def post(self):
+        """Refresh the upcoming conferences pages after a change."""
+        upcoming.refresh()
+
+
+class CaptureExportHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Download the API calls captured in the last minutes, as JSONL."""
+        minutes = self.request.get_range('minutes', 1, 24 * 60, 60)
+        end_time = time.time()
+        self.response.headers['Content-Type'] = 'application/x-ndjson'
+        self.response.headers['Content-Disposition'] = \
+            'attachment; filename=capture.jsonl'
+        for line in capture.exportLines(end_time - minutes * 60, end_time):
+            self.response.write(line)
+
+
+class ExportRosterHandler(webapp2.RequestHandler):
+
+    def post(self):
+        """Export a batch of a conference's attendee roster."""
+        roster.exportBatch(int(self.request.get('export')),
+                           int(self.request.get('chunk')))
+
+
+class ProfileExportHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Download the stacks sampled in the last minutes, in collapsed
+        stack format."""
+        minutes = self.request.get_range('minutes', 1, 24 * 60, 60)
+        end_time = time.time()
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.headers['Content-Disposition'] = \
+            'attachment; filename=profile.collapsed'
+        self.response.write(''.join(profiler.exportCollapsed(
+            end_time - minutes * 60, end_time,
+            method=self.request.get('method') or None)))
+
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+
+    def post(self):
+        """Promote the head of a conference waitlist."""
+        waitlist.promote(self.request.get('conference'))
 
 
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_mail', SendMailHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/set_featured_speaker', SetFeaturedtSpeaker),
+    ('/tasks/backfill_session_times', BackfillSessionTimesHandler),
+    ('/tasks/backfill_session_summaries', BackfillSessionSummariesHandler),
+    ('/tasks/reindex_entities', ReindexEntitiesHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    ('/tasks/export_roster', ExportRosterHandler),
+    ('/tasks/reconcile_seats', ReconcileSeatsHandler),
+    ('/tasks/reconcile_seats_merge', ReconcileSeatsMergeHandler),
+    ('/tasks/analytics_snapshot', AnalyticsSnapshotHandler),
+    ('/admin/analytics', AnalyticsReportHandler),
+    ('/admin/capture', CaptureExportHandler),
+    ('/admin/profile', ProfileExportHandler),
+    ('/tasks/update_facets', UpdateFacetsHandler),
+    ('/tasks/rebuild_facets', RebuildFacetsHandler),
+    ('/tasks/refresh_upcoming', RefreshUpcomingHandler),
 ], debug=True)
@@ -30,16 +30,57 @@ class ConflictException(endpoints.ServiceException):
     http_status = httplib.CONFLICT
 
 
+class SoldOutException(ConflictException):
+
+    """SoldOutException -- ConflictException raised when a conference has no seats left"""  # noqa
+
+
+class ServiceUnavailableException(endpoints.ServiceException):
+
+    """ServiceUnavailableException -- exception mapped to HTTP 503 response"""
+    http_status = httplib.SERVICE_UNAVAILABLE
+
+
+class TooManyRequestsException(ServiceUnavailableException):
+
+    """TooManyRequestsException -- ServiceUnavailableException raised when a caller is over its rate limit; Endpoints doesn't pass a 429 through"""  # noqa
+
+
 # - - -Profile related classes - - - - - - - - - - - - - - - - - - -
 
+class WishlistSlot(ndb.Model):
+
+    """WishlistSlot -- time slot of a wishlisted Session, in minutes since
+    0001-01-01 00:00; Profile keeps them sorted by start"""
+    websafeSessionKey = ndb.StringProperty()
+    start = ndb.IntegerProperty()
+    end = ndb.IntegerProperty()
+
+
+class RegistrationRecord(ndb.Model):
+
+    """RegistrationRecord -- outcome of a registration request carrying a
+    requestId, kept on the Profile for retries of the request"""
+    requestId = ndb.StringProperty()
+    outcome = ndb.StringProperty()
+
+
 class Profile(ndb.Model):
 
     """Profile -- User profile object"""
-    displayName = ndb.StringProperty()
+    # only the properties queried (see index.yaml) are indexed
+    displayName = ndb.StringProperty(indexed=False)
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
-    sessionKeysWishlist = ndb.StringProperty(repeated=True)
+    sessionKeysWishlist = ndb.StringProperty(repeated=True, indexed=False)
+    # interval index over the wishlist, used to detect schedule conflicts
+    wishlistSlots = ndb.LocalStructuredProperty(WishlistSlot, repeated=True)
+    wishlistMaxDuration = ndb.IntegerProperty(default=0, indexed=False)
+    wishlistIndexed = ndb.BooleanProperty(default=False, indexed=False)
+    # latest registration requests with a requestId, the latest first
+    registrationRecords = ndb.LocalStructuredProperty(RegistrationRecord,
+                                                      repeated=True)
 
 
 class ProfileMiniForm(messages.Message):
@@ -58,6 +99,27 @@ class ProfileForm(messages.Message):
     teeShirtSize = messages.EnumField('TeeShirtSize', 4)
     conferenceKeysToAttend = messages.StringField(5, repeated=True)
     sessionKeysWishlist = messages.StringField(6, repeated=True)
+    wishlistConflicts = messages.StringField(7, repeated=True)
+
+
+class WishlistConflictForm(messages.Message):
+
+    """WishlistConflictForm -- pair of wishlisted sessions overlapping in time"""  # noqa
+    websafeSessionKey = messages.StringField(1)
+    conflictingSessionKey = messages.StringField(2)
+
+
+class WishlistConflictForms(messages.Message):
+
+    """WishlistConflictForms -- multiple WishlistConflictForm outbound form message"""  # noqa
+    items = messages.MessageField(WishlistConflictForm, 1, repeated=True)
+
+
+class WishlistUpdateForm(messages.Message):
+
+    """WishlistUpdateForm -- inbound websafe Session keys to add to and remove from a wishlist"""  # noqa
+    add = messages.StringField(1, repeated=True)
+    remove = messages.StringField(2, repeated=True)
 
 
 # - - - TeeShirt related classes - - - - - - - - - - - - - - - - - - -
@@ -105,12 +167,32 @@ class TeeShirtSizeForm(messages.Message):
 
 # - - - Conference related classes - - - - - - - - - - - - - - - - - - -
 
+# conferences lasting longer than this many days are long running: the
+# upcoming feed (upcoming.py) fetches them with a query of their own
+LONG_CONFERENCE_DAYS = 31
+
+
+class SessionSummary(ndb.Model):
+
+    """SessionSummary -- summary of a Conference's sessions, kept on the
+    Conference by createSession"""
+    sessionCount = ndb.IntegerProperty(default=0)
+    # sessionType -> number of sessions
+    sessionsByType = ndb.JsonProperty()
+    firstDate = ndb.DateProperty()
+    lastDate = ndb.DateProperty()
+    speakerCount = ndb.IntegerProperty(default=0)
+    # speaker email -> {name, websafeSpeakerKey, sessions}
+    speakers = ndb.JsonProperty()
+
+
 class Conference(ndb.Model):
 
     """Conference -- Conference object"""
+    # only the properties queried (see index.yaml) are indexed
     name = ndb.StringProperty(required=True)
-    description = ndb.StringProperty()
-    organizerUserId = ndb.StringProperty()
+    description = ndb.TextProperty()
+    organizerUserId = ndb.StringProperty(indexed=False)
     topics = ndb.StringProperty(repeated=True)
     city = ndb.StringProperty()
     startDate = ndb.DateProperty()
@@ -118,7 +200,39 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
-    sessionKeys = ndb.StringProperty(repeated=True)
+    sessionKeys = ndb.StringProperty(repeated=True, indexed=False)
+    version = ndb.IntegerProperty(default=0, indexed=False)
+    scheduleVersion = ndb.IntegerProperty(default=0, indexed=False)
+    sessionSummary = ndb.LocalStructuredProperty(SessionSummary)
+    # entries queued on the waitlist; while any are, freed seats are
+    # theirs
+    waitlistLength = ndb.IntegerProperty(default=0, indexed=False)
+    longRunning = ndb.ComputedProperty(
+        lambda self: bool(self.startDate and self.endDate and
+                          (self.endDate - self.startDate).days >
+                          LONG_CONFERENCE_DAYS))
+
+
+class FacetCounterShard(ndb.Model):
+
+    """FacetCounterShard -- shard of the counter of conferences with a
+    given city, topic or month; keyed by field, value & shard index"""
+    field = ndb.StringProperty(required=True)
+    value = ndb.StringProperty(required=True, indexed=False)
+    count = ndb.IntegerProperty(default=0, indexed=False)
+    # ids of the latest updates applied, see facets.py
+    appliedUpdates = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class SessionSummaryForm(messages.Message):
+
+    """SessionSummaryForm -- outbound summary of a Conference's sessions"""
+    sessionCount = messages.IntegerField(1)
+    sessionsByType = messages.MessageField(
+        'SessionTypeCountForm', 2, repeated=True)
+    firstDate = messages.StringField(3)
+    lastDate = messages.StringField(4)
+    speakerCount = messages.IntegerField(5)
 
 
 class ConferenceForm(messages.Message):
@@ -136,12 +250,112 @@ class ConferenceForm(messages.Message):
     endDate = messages.StringField(10)
     websafeKey = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    etag = messages.StringField(13)
+    sessionSummary = messages.MessageField(SessionSummaryForm, 14)
+    # set, with etag alone, when the client's ETag still matches
+    notModified = messages.BooleanField(15)
+
+
+class FacetCountForm(messages.Message):
+
+    """FacetCountForm -- number of conferences with a value of a query
+    field (CITY, TOPIC or MONTH)"""
+    field = messages.StringField(1)
+    value = messages.StringField(2)
+    count = messages.IntegerField(3)
 
 
 class ConferenceForms(messages.Message):
 
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    etag = messages.StringField(2)
+    facets = messages.MessageField(FacetCountForm, 3, repeated=True)
+    nextPageToken = messages.StringField(4)
+    # set, with etag alone, when the client's ETag still matches
+    notModified = messages.BooleanField(5)
+
+
+class ConferenceKeysForm(messages.Message):
+
+    """ConferenceKeysForm -- inbound websafe keys of a batch of Conferences"""  # noqa
+    websafeConferenceKeys = messages.StringField(1, repeated=True)
+    fieldMask = messages.StringField(2, repeated=True)
+
+
+class ConferenceResultForm(messages.Message):
+
+    """ConferenceResultForm -- outbound Conference of a batch, or found=False
+    when there's none with the requested key"""
+    websafeConferenceKey = messages.StringField(1)
+    found = messages.BooleanField(2)
+    conference = messages.MessageField(ConferenceForm, 3)
+
+
+class ConferenceResultForms(messages.Message):
+
+    """ConferenceResultForms -- outbound batch of ConferenceResultForm, in request order"""  # noqa
+    items = messages.MessageField(ConferenceResultForm, 1, repeated=True)
+
+
+class WaitlistEntry(ndb.Model):
+
+    """WaitlistEntry -- queued registration for a sold out Conference;
+    a child of the Conference, keyed by user id"""
+    websafeConferenceKey = ndb.StringProperty(required=True, indexed=False)
+    userId = ndb.StringProperty(required=True, indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class WaitlistForm(messages.Message):
+
+    """WaitlistForm -- outbound waitlist state of a user for a Conference"""
+    websafeConferenceKey = messages.StringField(1)
+    position = messages.IntegerField(2)
+    registered = messages.BooleanField(3)
+
+
+class CheckoutOutcome(messages.Enum):
+
+    """CheckoutOutcome -- outcome of a conference in a checkout"""
+    REGISTERED = 1
+    ALREADY_REGISTERED = 2
+    SOLD_OUT = 3
+    NOT_FOUND = 4
+    CONTENTION = 5
+    CANCELLED = 6
+
+
+class CheckoutForm(messages.Message):
+
+    """CheckoutForm -- inbound websafe Conference keys to register for at
+    once; all or nothing, unless bestEffort"""
+    websafeConferenceKeys = messages.StringField(1, repeated=True)
+    bestEffort = messages.BooleanField(2, default=False)
+
+
+class CheckoutResultForm(messages.Message):
+
+    """CheckoutResultForm -- outbound outcome of a conference in a checkout"""  # noqa
+    websafeConferenceKey = messages.StringField(1)
+    outcome = messages.EnumField('CheckoutOutcome', 2)
+
+
+class CheckoutResultForms(messages.Message):
+
+    """CheckoutResultForms -- multiple CheckoutResultForm outbound form message"""  # noqa
+    items = messages.MessageField(CheckoutResultForm, 1, repeated=True)
+
+
+class RegistrationMetricsForm(messages.Message):
+
+    """RegistrationMetricsForm -- outbound registration contention counters
+    of a Conference"""
+    websafeConferenceKey = messages.StringField(1)
+    attempts = messages.IntegerField(2)
+    retries = messages.IntegerField(3)
+    contentionFailures = messages.IntegerField(4)
+    replays = messages.IntegerField(5)
 
 
 class ConferenceQueryForm(messages.Message):
@@ -156,6 +370,8 @@ class ConferenceQueryForms(messages.Message):
 
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""  # noqa
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    fieldMask = messages.StringField(2, repeated=True)
+    includeFacets = messages.BooleanField(3)
 
 
 class StringMessage(messages.Message):
@@ -169,28 +385,34 @@ class StringMessage(messages.Message):
 class SpeakerProperty(ndb.Model):
 
     """SpeakerProperty -- Speaker structured property for Session model"""
-    email = ndb.StringProperty(required=True)
-    name = ndb.StringProperty()
-    websafeSpeakerKey = ndb.StringProperty()
+    email = ndb.StringProperty(required=True, indexed=False)
+    name = ndb.StringProperty(indexed=False)
+    websafeSpeakerKey = ndb.StringProperty(indexed=False)
 
 
 class Session(ndb.Model):
 
     """Conference -- Conference object"""
+    # only the properties queried (see index.yaml) are indexed
     name = ndb.StringProperty(required=True)
-    highlights = ndb.StringProperty()
+    highlights = ndb.TextProperty()
     speaker = ndb.StructuredProperty(SpeakerProperty)
     date = ndb.DateProperty()
-    duration = ndb.IntegerProperty()
+    duration = ndb.IntegerProperty(indexed=False)
     startTime = ndb.IntegerProperty()  # Military time notation
     sessionType = ndb.StringProperty()
+    # normalized from startTime, duration and date; range queries use
+    # startMinute, the end is checked in memory
+    startMinute = ndb.IntegerProperty()  # minutes after midnight
+    endMinute = ndb.IntegerProperty(indexed=False)
+    startTimestamp = ndb.DateTimeProperty(indexed=False)
 
 
 class Speaker(ndb.Model):
 
-    """Speaker -- Speaker object"""
-    email = ndb.StringProperty(required=True)
-    sessionKeysToAttend = ndb.StringProperty(repeated=True)
+    """Speaker -- Speaker object, keyed by email"""
+    email = ndb.StringProperty(required=True, indexed=False)
+    sessionKeysToAttend = ndb.StringProperty(repeated=True, indexed=False)
 
 
 class SpeakerForm(messages.Message):
@@ -218,6 +440,9 @@ class SessionForms(messages.Message):
 
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    etag = messages.StringField(2)
+    # set, with etag alone, when the client's ETag still matches
+    notModified = messages.BooleanField(3)
 
 
 class SessionType(messages.Enum):
@@ -227,3 +452,134 @@ class SessionType(messages.Enum):
     LECTURE = 2
     KEYNOTE = 3
     WORKSHOP = 4
+
+
+# - - - Dashboard related classes - - - - - - - - - - - - - - - - - - -
+
+class SessionTypeCountForm(messages.Message):
+
+    """SessionTypeCountForm -- number of sessions of a given type"""
+    sessionType = messages.EnumField('SessionType', 1)
+    count = messages.IntegerField(2)
+
+
+class ConferenceStatsForm(messages.Message):
+
+    """ConferenceStatsForm -- organizer dashboard statistics of a Conference"""  # noqa
+    conference = messages.MessageField(ConferenceForm, 1)
+    registrations = messages.IntegerField(2)
+    seatsAvailable = messages.IntegerField(3)
+    sessionCount = messages.IntegerField(4)
+    sessionsByType = messages.MessageField(
+        SessionTypeCountForm, 5, repeated=True)
+    featuredSpeaker = messages.MessageField(SpeakerForm, 6)
+    tShirts = messages.MessageField(TeeShirtSizeForm, 7)
+
+
+class ConferenceStatsForms(messages.Message):
+
+    """ConferenceStatsForms -- multiple ConferenceStatsForm outbound form message"""  # noqa
+    items = messages.MessageField(ConferenceStatsForm, 1, repeated=True)
+
+
+class ConferenceDetailForm(messages.Message):
+
+    """ConferenceDetailForm -- Conference detail page outbound form message, including the caller's registration state"""  # noqa
+    conference = messages.MessageField(ConferenceForm, 1)
+    isAttending = messages.BooleanField(2)
+    wishlistSessionKeys = messages.StringField(3, repeated=True)
+    sessionCount = messages.IntegerField(4)
+    sessionsByType = messages.MessageField(
+        SessionTypeCountForm, 5, repeated=True)
+    featuredSpeaker = messages.MessageField(SpeakerForm, 6)
+
+
+# - - - Reconciliation related classes - - - - - - - - - - - - - - - -
+
+class ReconciliationJob(ndb.Model):
+
+    """ReconciliationJob -- state of a seats reconciliation job"""
+    shards = ndb.IntegerProperty(required=True)
+    shardsDone = ndb.IntegerProperty(default=0)
+    conferencesFixed = ndb.IntegerProperty(default=0)
+    started = ndb.DateTimeProperty(auto_now_add=True)
+    finished = ndb.DateTimeProperty()
+
+
+class ReconciliationShard(ndb.Model):
+
+    """ReconciliationShard -- range of Profile keys scanned by one task
+    chain of a ReconciliationJob, with its partial registration sums;
+    a root entity, so that shards never contend with each other"""
+    job = ndb.KeyProperty(kind=ReconciliationJob, required=True)
+    startKey = ndb.KeyProperty()
+    endKey = ndb.KeyProperty()
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(default=0, indexed=False)
+    processed = ndb.IntegerProperty(default=0, indexed=False)
+    elapsed = ndb.FloatProperty(default=0.0, indexed=False)
+    registrations = ndb.JsonProperty()
+    done = ndb.BooleanProperty(default=False)
+
+
+# - - - Analytics related classes - - - - - - - - - - - - - - - - - - -
+
+class AnalyticsSnapshot(ndb.Model):
+
+    """AnalyticsSnapshot -- columnar snapshot of the conference data, with
+    the registration statistics computed from it"""
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    finished = ndb.DateTimeProperty()
+    size = ndb.IntegerProperty(indexed=False)
+    stats = ndb.JsonProperty(compressed=True)
+
+
+class SnapshotChunk(ndb.Model):
+
+    """SnapshotChunk -- .npz bytes of an exported batch, or a part of the
+    merged snapshot; a child of its AnalyticsSnapshot"""
+    data = ndb.BlobProperty()
+
+
+# - - - Roster export related classes - - - - - - - - - - - - - - - - -
+
+class RosterExport(ndb.Model):
+
+    """RosterExport -- state of an attendee roster export of a Conference;
+    a root entity, so that exports never contend with registrations"""
+    websafeConferenceKey = ndb.StringProperty(required=True)
+    format = ndb.StringProperty(required=True, indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    chunks = ndb.IntegerProperty(default=0, indexed=False)
+    rows = ndb.IntegerProperty(default=0, indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    updated = ndb.DateTimeProperty(auto_now=True, indexed=False)
+    finished = ndb.DateTimeProperty(indexed=False)
+
+
+class RosterChunk(ndb.Model):
+
+    """RosterChunk -- CSV or JSONL bytes of a batch of attendees; a child
+    of its RosterExport"""
+    data = ndb.BlobProperty()
+
+
+class RosterExportForm(messages.Message):
+
+    """RosterExportForm -- outbound progress of a roster export"""
+    websafeExportKey = messages.StringField(1)
+    websafeConferenceKey = messages.StringField(2)
+    format = messages.StringField(3)
+    status = messages.StringField(4)
+    rows = messages.IntegerField(5)
+    chunks = messages.IntegerField(6)
+    created = messages.StringField(7)
+    finished = messages.StringField(8)
+
+
+class RosterChunkForm(messages.Message):
+
+    """RosterChunkForm -- outbound chunk of a finished roster export"""
+    websafeExportKey = messages.StringField(1)
+    index = messages.IntegerField(2)
+    data = messages.StringField(3)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""profiler.py
+
+Sampled CPU profiling of the ConferenceApi calls. ProfileMiddleware wraps
+the Endpoints SPI application; for a sample of the calls, or for calls
+by an admin (per their OAuth token) carrying the X-Profile header, a
+thread samples the stack of the request thread every SAMPLE_INTERVAL
+seconds while the whole call runs (decoding, the ConferenceApi method,
+encoding). The stacks are
+logged as one JSON object per call; exportCollapsed() reads them back
+from the request logs and aggregates them per endpoint in the collapsed
+stack format of flamegraph.pl and speedscope.
+
+Unsampled calls pay a random() draw; sampled ones a thread waking up
+every SAMPLE_INTERVAL, and no RPC.
+
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import thread
+import threading
+
+import endpoints
+from google.appengine.api import logservice
+from google.appengine.api import oauth
+
+from settings import PROFILE_SAMPLE_RATE
+
+# prefix of the application log lines holding a profiled call
+PROFILE_PREFIX = 'PROFILE '
+SPI_PREFIX = '/_ah/spi/'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+SAMPLE_INTERVAL = 0.005
+# distinct stacks logged per call, the most sampled first; keeps a log
+# line within the log size limits
+MAX_STACKS = 200
+
+
+def _label(code):
+    """Return the collapsed stack label of a code object."""
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+class StackSampler(threading.Thread):
+
+    """StackSampler -- thread counting the stacks of another thread, up to
+    a root code object, until stopped"""
+
+    def __init__(self, thread_id, root_code, interval=SAMPLE_INTERVAL):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None and frame.f_code is not self.root_code:
+                labels.append(_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                stack = ';'.join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        """Stop sampling; return the stack -> samples counts."""
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+class ProfileMiddleware(object):
+
+    """ProfileMiddleware -- WSGI middleware logging the sampled stacks of
+    a sample of the SPI calls"""
+
+    def __init__(self, app, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _wanted(self, environ):
+        """Return whether to profile a call."""
+        if environ.get(PROFILE_HEADER):
+            # API calls carry an OAuth token, not the login cookie
+            try:
+                return oauth.is_current_user_admin(endpoints.EMAIL_SCOPE)
+            except oauth.Error:
+                return False
+        return random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not (path.startswith(SPI_PREFIX) and self._wanted(environ)):
+            return self.app(environ, start_response)
+
+        sampler = StackSampler(thread.get_ident(),
+                               ProfileMiddleware.__call__.__func__.__code__)
+        sampler.start()
+        try:
+            # the SPI application returns its whole body, encoded
+            return self.app(environ, start_response)
+        finally:
+            stacks = sampler.stop()
+            top = sorted(stacks.items(), key=lambda item: -item[1])
+            logging.info('%s%s', PROFILE_PREFIX, json.dumps({
+                'method': path[len(SPI_PREFIX):],
+                'interval_ms': SAMPLE_INTERVAL * 1000,
+                'stacks': dict(top[:MAX_STACKS]),
+            }, sort_keys=True))
+
+
+def exportCollapsed(start_time, end_time, method=None, version_ids=None):
+    """Return the stacks sampled between two timestamps, summed per
+    endpoint, as collapsed stack lines rooted at the endpoint name; only
+    method's when given."""
+    totals = {}
+    for request_log in logservice.fetch(start_time=start_time,
+                                        end_time=end_time,
+                                        include_app_logs=True,
+                                        version_ids=version_ids):
+        if not request_log.resource.startswith(SPI_PREFIX):
+            continue
+        for app_log in request_log.app_logs:
+            if not app_log.message.startswith(PROFILE_PREFIX):
+                continue
+            profile = json.loads(app_log.message[len(PROFILE_PREFIX):])
+            if method and profile['method'] != method:
+                continue
+            for stack, samples in profile['stacks'].items():
+                stack = '%s;%s' % (profile['method'], stack)
+                totals[stack] = totals.get(stack, 0) + samples
+    return ['%s %d\n' % (stack, samples)
+            for stack, samples in sorted(totals.items())]
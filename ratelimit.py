@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""ratelimit.py
+
+Admission control for the expensive conference API endpoints: every
+caller gets a token bucket per endpoint, configured in settings.py and
+kept in memcache. Instances lease a few tokens at a time from the shared
+bucket and spend them locally, so most calls are admitted without a
+memcache round-trip; calls over the limit fail with a 503 before any
+datastore work.
+
+"""
+
+import functools
+import threading
+import time
+
+import endpoints
+from google.appengine.api import memcache
+
+from models import TooManyRequestsException
+
+from settings import RATE_LIMITS
+
+from utils import getUserId
+
+MEMCACHE_BUCKET_KEY = 'RATE LIMIT %s %s'
+
+# most tokens an instance leases from a shared bucket at once
+LEASE_SIZE = 5
+# compare-and-set attempts on a shared bucket before admitting anyway
+CAS_RETRIES = 3
+# instance-local leases kept before they're all dropped
+MAX_LOCAL_LEASES = 10000
+
+# (endpoint, client id) -> tokens leased by this instance and not spent
+_leases = {}
+_leasesLock = threading.Lock()
+
+
+def clientId(remote_address=None):
+    """Return the id the caller's buckets are keyed by: their user id, or
+    the client's remote address when they aren't signed in; None when
+    neither is known."""
+    user = endpoints.get_current_user()
+    if user:
+        return getUserId(user)
+    if remote_address:
+        return 'ip:%s' % remote_address
+    return None
+
+
+def _leaseTokens(cache_key, rate, burst, wanted):
+    """Take up to wanted tokens from a shared bucket; return how many."""
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        now = time.time()
+        bucket = client.gets(cache_key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens, updated = bucket
+            tokens = min(burst, tokens + (now - updated) * rate)
+        granted = min(wanted, int(tokens))
+        if not granted:
+            return 0
+
+        # an untouched bucket is full again after burst / rate seconds
+        state = (tokens - granted, now)
+        ttl = int(burst / float(rate)) + 1
+        if bucket is None:
+            stored = client.add(cache_key, state, time=ttl)
+        else:
+            stored = client.cas(cache_key, state, time=ttl)
+        if stored:
+            return granted
+    # memcache is contended or down: don't turn that into an outage
+    return wanted
+
+
+def admit(endpoint, client_id):
+    """Spend a token of the client's bucket for endpoint; return False if
+    the bucket is empty. Endpoints without a limit always admit."""
+    if endpoint not in RATE_LIMITS:
+        return True
+    local_key = (endpoint, client_id)
+    with _leasesLock:
+        if _leases.get(local_key, 0) > 0:
+            _leases[local_key] -= 1
+            return True
+
+    rate, burst = RATE_LIMITS[endpoint]
+    granted = _leaseTokens(MEMCACHE_BUCKET_KEY % local_key, rate, burst,
+                           min(LEASE_SIZE, max(1, burst // 4)))
+    if not granted:
+        return False
+    with _leasesLock:
+        if len(_leases) >= MAX_LOCAL_LEASES:
+            _leases.clear()
+        _leases[local_key] = _leases.get(local_key, 0) + granted - 1
+    return True
+
+
+def rateLimited(func):
+    """Decorate an Endpoints method to admit its calls through the caller's
+    bucket for the method's name; callers over the limit get a 503."""
+    @functools.wraps(func)
+    def wrapper(self, request):
+        # behind the Endpoints proxy, REMOTE_ADDR is the proxy's address:
+        # the client's is in the request state
+        request_state = getattr(self, 'request_state', None)
+        client_id = clientId(getattr(request_state, 'remote_address', None))
+        # anonymous callers of unknown address share no bucket: they
+        # aren't limited
+        if client_id and not admit(func.__name__, client_id):
+            rate, _ = RATE_LIMITS[func.__name__]
+            raise TooManyRequestsException(
+                'Too many %s requests, please retry in %d seconds.' % (
+                    func.__name__, max(1, int(round(1.0 / rate)))))
+        return func(self, request)
+    return wrapper
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""reconcile.py
+
+Reconciliation of Conference.seatsAvailable with the registrations held
+by Profiles. The Profile key space is split into ranges, at __scatter__
+sample split points, and every range (shard) is scanned by its own chain
+of push queue tasks, in parallel. Each batch adds its registrations per
+conference to the shard's partial sums and saves them with the query
+cursor in the same transaction that enqueues the next batch, so a failed
+task resumes where its shard stopped. Once every shard is done, a merge
+task sums the partial sums and fixes the conferences that drifted.
+
+Registrations made while the job runs can be counted or not, so run it
+when registrations are quiet.
+
+"""
+
+import logging
+import time
+from datetime import datetime
+
+from google.appengine.api import datastore
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Profile
+from models import ReconciliationJob
+from models import ReconciliationShard
+
+import tasks
+import waitlist
+
+from utils import bumpConferenceVersion
+
+# entities processed per task
+BATCH_SIZE = 200
+DEFAULT_SHARDS = 8
+# one batch add enqueues the first task of every shard
+MAX_SHARDS = taskqueue.MAX_TASKS_PER_ADD
+# __scatter__ samples fetched per shard to pick the split points
+OVERSAMPLING = 32
+
+
+def _splitKeys(shards):
+    """Return up to shards - 1 sorted Profile keys splitting the key space
+    into ranges of similar size."""
+    # about 1 in 512 entities has a __scatter__ property, a uniformly
+    # random sample of the kind
+    q = datastore.Query(Profile._get_kind(), keys_only=True)
+    q.Order('__scatter__')
+    samples = sorted(set(ndb.Key.from_old_key(key)
+                         for key in q.Get(shards * OVERSAMPLING)),
+                     key=lambda key: key.id())
+    if not samples:
+        # no entity has a __scatter__ property yet (few Profiles, or the
+        # dev server): one shard
+        return []
+    splits = [samples[i * len(samples) // shards] for i in range(1, shards)]
+    return sorted(set(splits), key=lambda key: key.id())
+
+
+def _shardKey(job_id, index):
+    """Return the ReconciliationShard key of a job's shard."""
+    return ndb.Key(ReconciliationShard, '%d-%d' % (job_id, index))
+
+
+def _batchTask(shard_id, batch):
+    """Return the task processing a shard's batch."""
+    return taskqueue.Task(params={'shard': shard_id, 'batch': batch},
+                          url='/tasks/reconcile_seats')
+
+
+def start(shards=DEFAULT_SHARDS):
+    """Start a reconciliation job with up to shards parallel task chains;
+    return the ReconciliationJob."""
+    bounds = [None] + _splitKeys(min(shards, MAX_SHARDS)) + [None]
+    job = ReconciliationJob(shards=len(bounds) - 1)
+    job.put()
+
+    shard_list = [ReconciliationShard(key=_shardKey(job.key.id(), i),
+                                      job=job.key,
+                                      startKey=bounds[i],
+                                      endKey=bounds[i + 1],
+                                      registrations={})
+                  for i in range(job.shards)]
+    ndb.put_multi(shard_list)
+    taskqueue.Queue().add([_batchTask(shard.key.id(), 0)
+                           for shard in shard_list])
+    return job
+
+
+def processBatch(shard_id, batch):
+    """Add the registrations of a shard's next batch of Profiles to its
+    partial sums; duplicate or stale tasks are ignored."""
+    shard = ReconciliationShard.get_by_id(shard_id)
+    if not shard or shard.done or shard.batches != batch:
+        return
+
+    started = time.time()
+    q = Profile.query()
+    if shard.startKey:
+        q = q.filter(Profile.key >= shard.startKey)
+    if shard.endKey:
+        q = q.filter(Profile.key < shard.endKey)
+    cursor = ndb.Cursor(urlsafe=shard.cursor) if shard.cursor else None
+    profiles, next_cursor, more = q.order(Profile.key).fetch_page(
+        BATCH_SIZE, start_cursor=cursor)
+
+    counts = dict(shard.registrations or {})
+    for prof in profiles:
+        for wsck in set(prof.conferenceKeysToAttend):
+            counts[wsck] = counts.get(wsck, 0) + 1
+
+    _saveBatch(shard.key, batch, counts,
+               next_cursor.urlsafe() if more and next_cursor else None,
+               len(profiles), time.time() - started)
+
+
+@ndb.transactional(xg=True)
+def _saveBatch(shard_key, batch, counts, cursor, processed, elapsed):
+    """Save a shard's batch results, then enqueue its next batch or, for
+    its last batch, mark it done and enqueue the merge once every shard
+    of the job is done."""
+    shard = shard_key.get()
+    if shard.batches != batch:
+        # a concurrent run of the same task got there first
+        return
+    shard.populate(registrations=counts, cursor=cursor,
+                   batches=batch + 1,
+                   processed=shard.processed + processed,
+                   elapsed=shard.elapsed + elapsed,
+                   done=cursor is None)
+    if not shard.done:
+        shard.put()
+        _batchTask(shard_key.id(), batch + 1).add(transactional=True)
+        return
+
+    job = shard.job.get()
+    job.shardsDone += 1
+    ndb.put_multi([shard, job])
+    if job.shardsDone == job.shards:
+        taskqueue.add(params={'job': job.key.id()},
+                      url='/tasks/reconcile_seats_merge',
+                      transactional=True)
+
+
+@ndb.transactional
+def _fixSeats(c_key, registrations):
+    """Set a conference's seatsAvailable from its registrations; return
+    whether it had drifted."""
+    conf = c_key.get()
+    if not conf:
+        return False
+    seats = max(0, (conf.maxAttendees or 0) - registrations)
+    if conf.seatsAvailable == seats:
+        return False
+    logging.warning('Conference %s had %s seats available instead of %d',
+                    c_key.urlsafe(), conf.seatsAvailable, seats)
+    if seats > conf.seatsAvailable:
+        # hand the seats found over to the waitlist
+        waitlist.enqueuePromotion(c_key.urlsafe(), transactional=True)
+    conf.seatsAvailable = seats
+    bumpConferenceVersion(conf)
+    conf.put()
+    return True
+
+
+def merge(job_id, cursor=None):
+    """Sum the partial sums of a job's shards and fix the seatsAvailable
+    of a batch of Conferences, then chain a task for the next batch."""
+    job = ReconciliationJob.get_by_id(job_id)
+    shard_list = ndb.get_multi(
+        [_shardKey(job_id, i) for i in range(job.shards)])
+    totals = {}
+    for shard in shard_list:
+        for wsck, count in shard.registrations.items():
+            totals[wsck] = totals.get(wsck, 0) + count
+
+    confs, next_cursor, more = Conference.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor)
+    fixed = 0
+    for conf in confs:
+        expected = max(0, (conf.maxAttendees or 0) -
+                       totals.get(conf.key.urlsafe(), 0))
+        # only drifted conferences open a transaction
+        if conf.seatsAvailable != expected and _fixSeats(
+                conf.key, totals.get(conf.key.urlsafe(), 0)):
+            fixed += 1
+
+    done = not (more and next_cursor)
+    job = _saveMerge(job.key, fixed, done)
+    if not done:
+        taskqueue.add(params={'job': job_id, 'cursor': next_cursor.urlsafe()},
+                      url='/tasks/reconcile_seats_merge')
+    else:
+        # the announcement lists nearly sold out conferences
+        tasks.cacheAnnouncement()
+        logging.info(report(job, shard_list))
+
+
+@ndb.transactional
+def _saveMerge(job_key, fixed, done):
+    """Count the conferences fixed by a merge batch; return the job."""
+    job = job_key.get()
+    job.conferencesFixed += fixed
+    if done:
+        job.finished = datetime.now()
+    job.put()
+    return job
+
+
+def report(job, shard_list=None):
+    """Return a text report of a job's progress and throughput."""
+    if shard_list is None:
+        shard_list = ndb.get_multi(
+            [_shardKey(job.key.id(), i) for i in range(job.shards)])
+    processed = sum(shard.processed for shard in shard_list)
+    wall = ((job.finished or datetime.now()) - job.started).total_seconds()
+
+    lines = ['Reconciliation job %d: %s, %d/%d shards done, '
+             '%d conferences fixed' % (
+                 job.key.id(), 'finished' if job.finished else 'running',
+                 job.shardsDone, job.shards, job.conferencesFixed),
+             'Profiles: %d in %.1f s, %.1f entities/s' % (
+                 processed, wall, processed / wall if wall else 0.0)]
+    for shard in shard_list:
+        lines.append('  shard %s: %d profiles, %d batches, %.1f entities/s' % (
+            shard.key.id(), shard.processed, shard.batches,
+            shard.processed / shard.elapsed if shard.elapsed else 0.0))
+    return '\n'.join(lines)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""roster.py
+
+Export of a Conference's attendee roster (name, email and t-shirt size)
+as CSV or JSONL. A chain of push queue tasks queries the attending
+Profiles in batches of BATCH_SIZE; every task writes its batch as one
+RosterChunk and saves the query cursor in the same transaction that
+enqueues the next task, so memory stays constant whatever the size of
+the conference, and a failed task resumes where the export stopped.
+An export whose chain died (e.g. a task ran out of retries) is STALLED
+and can be resumed from its cursor.
+
+Registrations made while an export runs can be included or not.
+
+"""
+
+import csv
+import json
+import StringIO
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import RosterChunk
+from models import RosterExport
+
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ('displayName', 'mainEmail', 'teeShirtSize')
+
+# attendees written per task, and so per RosterChunk
+BATCH_SIZE = 500
+# a running export without progress for this long has lost its chain
+STALL_SECONDS = 600
+
+
+def _encodeCsv(profiles, header):
+    """Return a batch of attendees as CSV bytes."""
+    out = StringIO.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(COLUMNS)
+    for prof in profiles:
+        writer.writerow([(getattr(prof, column) or u'').encode('utf-8')
+                         for column in COLUMNS])
+    return out.getvalue()
+
+
+def _encodeJsonl(profiles, header):
+    """Return a batch of attendees as JSONL bytes."""
+    return ''.join(json.dumps(dict((column, getattr(prof, column))
+                                   for column in COLUMNS),
+                              sort_keys=True) + '\n'
+                   for prof in profiles)
+
+
+ENCODERS = {
+    'csv': _encodeCsv,
+    'jsonl': _encodeJsonl,
+}
+
+
+def status(export):
+    """Return the status of an export: DONE, RUNNING or STALLED."""
+    if export.finished:
+        return 'DONE'
+    if datetime.now() - export.updated > timedelta(seconds=STALL_SECONDS):
+        return 'STALLED'
+    return 'RUNNING'
+
+
+def _batchTask(export_id, chunk):
+    """Return the task exporting an export's chunk."""
+    return taskqueue.Task(params={'export': export_id, 'chunk': chunk},
+                          url='/tasks/export_roster')
+
+
+def latestExport(wsck):
+    """Return the latest RosterExport of a conference, or None."""
+    return RosterExport.query(
+        RosterExport.websafeConferenceKey == wsck
+    ).order(-RosterExport.created).get()
+
+
+def start(wsck, format):
+    """Start a roster export of a conference; return the RosterExport."""
+    export = RosterExport(websafeConferenceKey=wsck, format=format)
+    export.put()
+    _batchTask(export.key.id(), 0).add()
+    return export
+
+
+def resume(export):
+    """Enqueue the next task of a stalled export again; a duplicate of a
+    task still in the queue is ignored."""
+    _batchTask(export.key.id(), export.chunks).add()
+
+
+def exportBatch(export_id, chunk):
+    """Write the export's next batch of attendees as a chunk; duplicate or
+    stale tasks are ignored."""
+    export = RosterExport.get_by_id(export_id)
+    if not export or export.finished or export.chunks != chunk:
+        return
+
+    cursor = ndb.Cursor(urlsafe=export.cursor) if export.cursor else None
+    profiles, next_cursor, more = Profile.query(
+        Profile.conferenceKeysToAttend == export.websafeConferenceKey
+    ).order(Profile.key).fetch_page(BATCH_SIZE, start_cursor=cursor)
+    data = ENCODERS[export.format](profiles, header=chunk == 0)
+
+    _saveBatch(export.key, chunk, data,
+               next_cursor.urlsafe() if more and next_cursor else None,
+               len(profiles))
+
+
+@ndb.transactional
+def _saveBatch(export_key, chunk, data, cursor, rows):
+    """Save a chunk with the export's progress, then enqueue the next
+    batch, or mark the export finished."""
+    export = export_key.get()
+    if export.chunks != chunk:
+        # a concurrent run of the same task got there first
+        return
+    export.populate(cursor=cursor, chunks=chunk + 1,
+                    rows=export.rows + rows,
+                    finished=None if cursor else datetime.now())
+    ndb.put_multi([export, RosterChunk(parent=export_key,
+                                       id='%06d' % chunk, data=data)])
+    if cursor:
+        _batchTask(export_key.id(), chunk + 1).add(transactional=True)
+
+
+def getChunk(export, index):
+    """Return the bytes of an export's chunk, or None."""
+    chunk = RosterChunk.get_by_id('%06d' % index, parent=export.key)
+    return chunk.data if chunk else None
@@ -14,3 +14,20 @@ created/forked from conference.py by wesc on 2014 may 24
 # Console or Cloud Console.
 WEB_CLIENT_ID = '214397887330-m5egjlsg58glb4hgng8q27b9jbndccbq.apps.googleusercontent.com'
 
+
+# Admission control (see ratelimit.py): endpoint name -> (tokens refilled
+# per second, bucket size) of each user's token bucket
+RATE_LIMITS = {
+    'queryConferences': (2, 20),
+    'getSessionsByDate': (2, 20),
+    'getTshirtsByConference': (1, 10),
+    'getOrganizerDashboard': (1, 10),
+}
+
+# Fraction of the API calls logged, anonymized, for replays (capture.py);
+# 0 turns capture off
+CAPTURE_SAMPLE_RATE = 0.01
+
+# Fraction of the API calls profiled (profiler.py); 0 only profiles the
+# calls of admins sending an X-Profile header
+PROFILE_SAMPLE_RATE = 0
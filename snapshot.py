@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""snapshot.py
+
+Export job of the analytics snapshot (see analytics.py). A chain of push
+queue tasks streams Conferences, Session keys and registrations (a
+projection of Profile.conferenceKeysToAttend) in batches, saving every
+batch as a columnar chunk. The last task merges the chunks into the
+snapshot, computes its registration statistics and caches them, so that
+reports never query the live data.
+
+Only the instances running the export or serving the report load NumPy.
+
+"""
+
+import logging
+from datetime import datetime
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import AnalyticsSnapshot
+from models import Conference
+from models import Profile
+from models import Session
+from models import SnapshotChunk
+
+import analytics
+
+MEMCACHE_ANALYTICS_KEY = 'ANALYTICS STATS'
+
+# entities exported per task
+BATCH_SIZE = 500
+# merged snapshot bytes stored per SnapshotChunk, under the 1MB limit
+PART_SIZE = 900 * 1024
+
+
+def _conferenceBatch(cursor):
+    """Export a batch of Conferences, with their topics."""
+    confs, next_cursor, more = Conference.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor)
+    topics = [(conf.key.urlsafe(), topic)
+              for conf in confs for topic in conf.topics]
+    tables = {
+        'conference': analytics.table(
+            conference=[conf.key.urlsafe() for conf in confs],
+            city=[conf.city or u'' for conf in confs],
+            month=[conf.month or 0 for conf in confs],
+            maxAttendees=[conf.maxAttendees or 0 for conf in confs],
+            seatsAvailable=[conf.seatsAvailable or 0 for conf in confs]),
+        'topic': analytics.table(
+            conference=[wsck for wsck, _ in topics],
+            topic=[topic for _, topic in topics]),
+    }
+    return tables, next_cursor, more
+
+
+def _sessionBatch(cursor):
+    """Export the conferences of a batch of Sessions; keys only."""
+    s_keys, next_cursor, more = Session.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor, keys_only=True)
+    tables = {
+        'session': analytics.table(
+            conference=[key.parent().urlsafe() for key in s_keys]),
+    }
+    return tables, next_cursor, more
+
+
+def _registrationBatch(cursor):
+    """Export a batch of registrations; the projection returns one result
+    per registration."""
+    profs, next_cursor, more = Profile.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor,
+        projection=[Profile.conferenceKeysToAttend])
+    tables = {
+        'registration': analytics.table(
+            conference=[prof.conferenceKeysToAttend[0] for prof in profs]),
+    }
+    return tables, next_cursor, more
+
+
+# export steps, in order
+STEPS = (
+    ('conference', _conferenceBatch),
+    ('session', _sessionBatch),
+    ('registration', _registrationBatch),
+)
+
+
+def _enqueue(snapshot_id, **params):
+    """Enqueue the next task of an export."""
+    params['snapshot'] = snapshot_id
+    taskqueue.add(params=params, url='/tasks/analytics_snapshot')
+
+
+def start():
+    """Start an export; return the AnalyticsSnapshot."""
+    snapshot = AnalyticsSnapshot()
+    snapshot.put()
+    _enqueue(snapshot.key.id(), step=0, batch=0)
+    return snapshot
+
+
+def exportBatch(snapshot_id, step, batch, cursor=None):
+    """Export a batch of a step, then chain a task for the next batch, the
+    next step or the merge."""
+    _, batch_fn = STEPS[step]
+    tables, next_cursor, more = batch_fn(cursor)
+    # every step saves at least one chunk, for the merge to find its
+    # columns even when there's nothing to export
+    SnapshotChunk(parent=ndb.Key(AnalyticsSnapshot, snapshot_id),
+                  id='%d-%06d' % (step, batch),
+                  data=analytics.dumps(tables)).put()
+
+    if more and next_cursor:
+        _enqueue(snapshot_id, step=step, batch=batch + 1,
+                 cursor=next_cursor.urlsafe())
+    elif step + 1 < len(STEPS):
+        _enqueue(snapshot_id, step=step + 1, batch=0)
+    else:
+        _enqueue(snapshot_id, merge=1)
+
+
+def merge(snapshot_id):
+    """Merge the exported chunks into the snapshot, compute and cache its
+    statistics."""
+    snap_key = ndb.Key(AnalyticsSnapshot, snapshot_id)
+    snapshot = snap_key.get()
+    if snapshot.finished:
+        return
+    # skip the parts written by a failed run of this task
+    chunks = [chunk for chunk in SnapshotChunk.query(ancestor=snap_key)
+              if not chunk.key.id().startswith('snapshot-')]
+
+    parts = {}
+    for chunk in chunks:
+        for name, tbl in analytics.loads(chunk.data).items():
+            parts.setdefault(name, []).append(tbl)
+    tables = dict((name, analytics.concat(tbls))
+                  for name, tbls in parts.items())
+    data = analytics.dumps(tables)
+
+    # replace the batch chunks by the parts of the merged snapshot
+    ndb.put_multi([SnapshotChunk(parent=snap_key, id='snapshot-%03d' % i,
+                                 data=data[start:start + PART_SIZE])
+                   for i, start in enumerate(
+                       range(0, len(data), PART_SIZE))])
+    snapshot.populate(finished=datetime.now(), size=len(data),
+                      stats=analytics.registrationStats(tables))
+    snapshot.put()
+    ndb.delete_multi([chunk.key for chunk in chunks])
+    memcache.set(MEMCACHE_ANALYTICS_KEY, _report(snapshot))
+    logging.info('Analytics snapshot %d: %d bytes', snapshot_id, len(data))
+
+
+def _report(snapshot):
+    """Return the report of a finished snapshot."""
+    report = {'snapshot': snapshot.key.id(),
+              'created': snapshot.created.isoformat(),
+              'size': snapshot.size}
+    report.update(snapshot.stats)
+    return report
+
+
+def latestReport():
+    """Return the report of the latest finished snapshot, or None."""
+    report = memcache.get(MEMCACHE_ANALYTICS_KEY)
+    if report is None:
+        # unfinished snapshots sort last
+        snapshot = AnalyticsSnapshot.query().order(
+            -AnalyticsSnapshot.finished).get()
+        if not snapshot or not snapshot.finished:
+            return None
+        report = _report(snapshot)
+        memcache.set(MEMCACHE_ANALYTICS_KEY, report)
+    return report
@@ -17,6 +17,14 @@ var conferenceApp = conferenceApp || {};
  */
 conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstrap']);
 
+/**
+ * The last list of conferences to attend, with its ETag. The ETag is sent back as ifNoneMatch,
+ * so that an unchanged list isn't sent again.
+ *
+ * @type {{etag: ?string, items: Array}}
+ */
+conferenceApp.attendingCache = {etag: null, items: []};
+
 /**
  * @ngdoc controller
  * @name MyProfileCtrl
@@ -257,7 +265,21 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.submitted = false;
 
-    $scope.selectedTab = 'ALL';
+    $scope.selectedTab = 'UPCOMING';
+
+    /**
+     * Holds the token of the next page of the upcoming conferences, if any.
+     * @type {string}
+     */
+    $scope.upcomingPageToken = null;
+
+    /**
+     * The only ConferenceForm fields rendered by the conference list; sent as a field mask
+     * so the server can skip the other fields.
+     * @type {string[]}
+     */
+    $scope.listFieldMask = ['name', 'city', 'startDate', 'endDate', 'maxAttendees', 'seatsAvailable',
+        'websafeKey', 'organizerDisplayName'];
 
     /**
      * Holds the filters that will be applied when queryConferencesAll is invoked.
@@ -270,6 +292,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         {enumValue: 'CITY', displayName: 'City'},
         {enumValue: 'TOPIC', displayName: 'Topic'},
         {enumValue: 'MONTH', displayName: 'Start month'},
+        {enumValue: 'START_DATE', displayName: 'Start date (yyyy-mm-dd)'},
         {enumValue: 'MAX_ATTENDEES', displayName: 'Max Attendees'}
     ]
 
@@ -300,6 +323,14 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.isOffcanvasEnabled = false;
 
+    /**
+     * Sets the selected tab to 'UPCOMING'
+     */
+    $scope.tabUpcomingSelected = function () {
+        $scope.selectedTab = 'UPCOMING';
+        $scope.queryConferences();
+    };
+
     /**
      * Sets the selected tab to 'ALL'
      */
@@ -414,7 +445,9 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.queryConferences = function () {
         $scope.submitted = false;
-        if ($scope.selectedTab == 'ALL') {
+        if ($scope.selectedTab == 'UPCOMING') {
+            $scope.getUpcomingConferences();
+        } else if ($scope.selectedTab == 'ALL') {
             $scope.queryConferencesAll();
         } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
             $scope.getConferencesCreated();
@@ -428,7 +461,8 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.queryConferencesAll = function () {
         var sendFilters = {
-            filters: []
+            filters: [],
+            fieldMask: $scope.listFieldMask
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -468,13 +502,51 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
             });
     }
 
+    /**
+     * Invokes the conference.getUpcomingConferences method; appends the next page to the
+     * conferences displayed when pageToken is given.
+     */
+    $scope.getUpcomingConferences = function (pageToken) {
+        $scope.loading = true;
+        gapi.client.conference.getUpcomingConferences({
+            pageToken: pageToken
+        }).execute(function (resp) {
+                $scope.$apply(function () {
+                    $scope.loading = false;
+                    if (resp.error) {
+                        // The request has failed.
+                        var errorMessage = resp.error.message || '';
+                        $scope.messages = 'Failed to query the upcoming conferences : ' + errorMessage;
+                        $scope.alertStatus = 'warning';
+                        $log.error($scope.messages);
+                    } else {
+                        // The request has succeeded.
+                        $scope.submitted = false;
+                        $scope.messages = 'Query succeeded : Upcoming conferences';
+                        $scope.alertStatus = 'success';
+                        $log.info($scope.messages);
+
+                        if (!pageToken) {
+                            $scope.conferences = [];
+                        }
+                        angular.forEach(resp.items, function (conference) {
+                            $scope.conferences.push(conference);
+                        });
+                        $scope.upcomingPageToken = resp.nextPageToken || null;
+                    }
+                    $scope.submitted = true;
+                });
+            });
+    };
+
     /**
      * Invokes the conference.getConferencesCreated method.
      */
     $scope.getConferencesCreated = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
-            execute(function (resp) {
+        gapi.client.conference.getConferencesCreated({
+            fieldMask: $scope.listFieldMask
+        }).execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
                     if (resp.error) {
@@ -511,8 +583,11 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.getConferencesAttend = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
-            execute(function (resp) {
+        var cache = conferenceApp.attendingCache;
+        gapi.client.conference.getConferencesToAttend({
+            fieldMask: $scope.listFieldMask,
+            ifNoneMatch: cache.etag || undefined
+        }).execute(function (resp) {
                 $scope.$apply(function () {
                     if (resp.error) {
                         // The request has failed.
@@ -526,8 +601,12 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                             return;
                         }
                     } else {
-                        // The request has succeeded.
-                        $scope.conferences = resp.result.items;
+                        // The request has succeeded; the list didn't change if notModified.
+                        if (!resp.result.notModified) {
+                            cache.etag = resp.result.etag;
+                            cache.items = resp.result.items || [];
+                        }
+                        $scope.conferences = cache.items;
                         $scope.loading = false;
                         $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
                         $scope.alertStatus = 'success';
@@ -554,12 +633,13 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
 
     /**
      * Initializes the conference detail page.
-     * Invokes the conference.getConference method and sets the returned conference in the $scope.
+     * Invokes the conference.getConferenceDetail method, which returns the conference along with
+     * the user's registration state, and sets them in the $scope.
      *
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client.conference.getConference({
+        gapi.client.conference.getConferenceDetail({
             websafeConferenceKey: $routeParams.websafeConferenceKey
         }).execute(function (resp) {
             $scope.$apply(function () {
@@ -574,27 +654,14 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 } else {
                     // The request has succeeded.
                     $scope.alertStatus = 'success';
-                    $scope.conference = resp.result;
-                }
-            });
-        });
-
-        $scope.loading = true;
-        // If the user is attending the conference, updates the status message and available function.
-        gapi.client.conference.getProfile().execute(function (resp) {
-            $scope.$apply(function () {
-                $scope.loading = false;
-                if (resp.error) {
-                    // Failed to get a user profile.
-                } else {
-                    var profile = resp.result;
-                    for (var i = 0; i < profile.conferenceKeysToAttend.length; i++) {
-                        if ($routeParams.websafeConferenceKey == profile.conferenceKeysToAttend[i]) {
-                            // The user is attending the conference.
-                            $scope.alertStatus = 'info';
-                            $scope.messages = 'You are attending this conference';
-                            $scope.isUserAttending = true;
-                        }
+                    $scope.conference = resp.result.conference;
+                    $scope.sessionCount = resp.result.sessionCount || 0;
+                    $scope.featuredSpeaker = resp.result.featuredSpeaker;
+                    if (resp.result.isAttending) {
+                        // The user is attending the conference.
+                        $scope.alertStatus = 'info';
+                        $scope.messages = 'You are attending this conference';
+                        $scope.isUserAttending = true;
                     }
                 }
             });
@@ -624,12 +691,17 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
+                    if (resp.result.registered) {
                         // Register succeeded.
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
                         $scope.isUserAttending = true;
                         $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+                    } else if (resp.result.position) {
+                        // Sold out: queued on the waitlist.
+                        $scope.messages = 'There are no seats available. You are number ' +
+                            resp.result.position + ' on the waitlist';
+                        $scope.alertStatus = 'info';
                     } else {
                         $scope.messages = 'Failed to register for the conference';
                         $scope.alertStatus = 'warning';
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""tasks.py
+
+Conference app background work run by cron jobs and push queue tasks.
+
+Task handlers in main.py only import this module, not the Endpoints API
+layer in conference.py, so that they start fast on a cold instance.
+
+"""
+
+import logging
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Profile
+from models import Session
+from models import Speaker
+
+from utils import MAX_SESSION_DURATION
+from utils import bumpConferenceVersion
+from utils import sessionTimeFields
+from utils import summarizeSessions
+
+
+MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT ANNOUNCEMENTS'
+MEMCACHE_SPEAKERS_KEY = 'FEATURED SPEAKERS'
+
+# entities processed per task by the batch jobs
+BATCH_SIZE = 200
+
+
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+def nearlySoldOutConferences():
+    """Return the conferences with 5 seats or less left, name only."""
+    return Conference.query(ndb.AND(
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job.
+    """
+    confs = nearlySoldOutConferences()
+
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(conf.name for conf in confs))
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        announcement = ""
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    return announcement
+
+
+# - - - Featured Speaker - - - - - - - - - - - - - - - - - - -
+
+def cacheFeaturedSpeaker(websafeSessionKey):
+    """Create Featured Speaker & assign to memcache; used by
+    the set_featured_speaker task."""
+
+    featuredSpeaker = {}
+
+    # Get session; nothing to do (and nothing to retry) if it's gone
+    new_s_key = ndb.Key(urlsafe=websafeSessionKey)
+    new_session = new_s_key.get()
+    if not new_session:
+        logging.warning('No session found with key: %s', websafeSessionKey)
+        return featuredSpeaker
+
+    # Retrieve conference parent's key
+    c_key = new_s_key.parent()
+    conference = c_key.get()
+
+    # Get all the sessions for the given conference
+    q = Session.query(ancestor=c_key).fetch()
+
+    # Set an empty dictionary to hold the new session
+    # speaker's websafe key and init it to 0
+    new_speakerKey = {}
+    new_speakerKey[new_session.speaker.websafeSpeakerKey] = 0
+
+    # check if new speakers are attending more than one
+    # session in the same conference
+    for session in q:
+        if session.speaker.websafeSpeakerKey in new_speakerKey:
+            new_speakerKey[session.speaker.websafeSpeakerKey] += 1
+            if new_speakerKey[session.speaker.websafeSpeakerKey] > 1:
+                featuredSpeaker['name'] = session.speaker.name
+                featuredSpeaker['email'] = session.speaker.email
+                break
+
+    if any(featuredSpeaker):
+        # If there is a featured speaker we put it in the memcache
+        speaker = 'Come and listen to the best speakers! %s, %s, %s %s' % (
+            featuredSpeaker['name'],
+            featuredSpeaker['email'],
+            'is going to attend the:',
+            conference.name + ' conference!')
+        memcache.set(MEMCACHE_SPEAKERS_KEY, speaker)
+
+    return featuredSpeaker
+
+
+# - - - Session times backfill - - - - - - - - - - - - - - - - -
+
+def backfillSessionTimes(cursor=None):
+    """Set the normalized startMinute, endMinute and startTimestamp of a
+    batch of Sessions, then chain a task for the next batch."""
+    sessions, next_cursor, more = Session.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor)
+
+    modified = []
+    for sess in sessions:
+        try:
+            fields = sessionTimeFields(
+                sess.date, sess.startTime, sess.duration)
+        except ValueError:
+            logging.warning('Session %s has an invalid start time: %s',
+                            sess.key.urlsafe(), sess.startTime)
+            continue
+        if sess.duration > MAX_SESSION_DURATION:
+            # time-window queries only look back MAX_SESSION_DURATION
+            # minutes, they would miss it
+            logging.warning('Session %s lasts longer than %d minutes: %s',
+                            sess.key.urlsafe(), MAX_SESSION_DURATION,
+                            sess.duration)
+            continue
+        if any(getattr(sess, name) != value
+               for name, value in fields.items()):
+            sess.populate(**fields)
+            modified.append(sess)
+    ndb.put_multi(modified)
+
+    if more and next_cursor:
+        taskqueue.add(params={'cursor': next_cursor.urlsafe()},
+                      url='/tasks/backfill_session_times')
+    return len(modified)
+
+
+# - - - Session summaries backfill - - - - - - - - - - - - - - -
+
+@ndb.transactional
+def _summarizeConference(c_key):
+    """Recompute a Conference's sessionSummary from its Sessions."""
+    conf = c_key.get()
+    conf.sessionSummary = summarizeSessions(Session.query(ancestor=c_key))
+    bumpConferenceVersion(conf)
+    conf.put()
+
+
+def backfillSessionSummaries(cursor=None):
+    """Recompute the sessionSummary of a batch of Conferences, then chain
+    a task for the next batch."""
+    c_keys, next_cursor, more = Conference.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor, keys_only=True)
+    for c_key in c_keys:
+        _summarizeConference(c_key)
+
+    if more and next_cursor:
+        taskqueue.add(params={'cursor': next_cursor.urlsafe()},
+                      url='/tasks/backfill_session_summaries')
+    return len(c_keys)
+
+
+# - - - Index rewrite - - - - - - - - - - - - - - - - - - - - - -
+
+# kinds rewritten, in order, so that their stored index rows match the
+# properties their models index; WaitlistEntry is left out, its entities
+# were never written with the old indexes
+REINDEXED_MODELS = (Conference, Session, Profile, Speaker)
+
+
+@ndb.transactional_tasklet
+def _rewriteGroupAsync(keys):
+    """Read and put entities of one entity group again, in a transaction,
+    so that a concurrent update (e.g. a registration) isn't overwritten."""
+    entities = yield ndb.get_multi_async(keys)
+    yield ndb.put_multi_async([entity for entity in entities if entity])
+
+
+def reindexEntities(step=0, cursor=None):
+    """Rewrite a batch of entities of a kind, one transaction per entity
+    group, all in parallel; then chain a task for the next batch or the
+    next kind."""
+    model = REINDEXED_MODELS[step]
+    keys, next_cursor, more = model.query().fetch_page(
+        BATCH_SIZE, start_cursor=cursor, keys_only=True)
+    groups = {}
+    for key in keys:
+        groups.setdefault(key.root(), []).append(key)
+    for future in [_rewriteGroupAsync(group) for group in groups.values()]:
+        future.get_result()
+
+    if more and next_cursor:
+        taskqueue.add(params={'step': step, 'cursor': next_cursor.urlsafe()},
+                      url='/tasks/reindex_entities')
+    elif step + 1 < len(REINDEXED_MODELS):
+        taskqueue.add(params={'step': step + 1},
+                      url='/tasks/reindex_entities')
+    else:
+        logging.info('Index rewrite done.')
+    return len(keys)
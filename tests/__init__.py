@@ -0,0 +1,18 @@
+"""Tests of the conference app, against the service stubs of the App
+Engine SDK. Run them from the app directory:
+
+    GAE_SDK=~/google-cloud-sdk/platform/google_appengine \
+        python -m unittest discover -s tests -t .
+
+"""
+
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if os.environ.get('GAE_SDK'):
+    sys.path.insert(0, os.environ['GAE_SDK'])
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_DIR)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""base.py
+
+AppTestCase, the test case the app's tests derive from: every test runs
+against fresh datastore (strongly consistent, unless consistency says
+otherwise), memcache and task queue stubs, signed in as self.user.
+
+"""
+
+import unittest
+
+import endpoints
+from google.appengine.api import users
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Conference
+from models import Profile
+
+from tests import APP_DIR
+
+
+class AppTestCase(unittest.TestCase):
+
+    """AppTestCase -- test case with the App Engine service stubs"""
+
+    # probability that a global query sees a write right away
+    consistency = 1
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=self.consistency)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.taskqueue = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+        ndb.get_context().clear_cache()
+
+        # Endpoints authenticates the caller from the request; tests pick
+        # them with signIn()
+        self.user = None
+        self._getCurrentUser = endpoints.get_current_user
+        endpoints.get_current_user = lambda: self.user
+
+    def tearDown(self):
+        endpoints.get_current_user = self._getCurrentUser
+        self.testbed.deactivate()
+
+    def signIn(self, email):
+        """Make email the caller of the API methods."""
+        self.user = users.User(email)
+
+    def createConference(self, seats, **values):
+        """Store a conference of seats seats; return its websafe key."""
+        conf = Conference(parent=ndb.Key(Profile, 'organizer@example.com'),
+                          name='PyCon', maxAttendees=seats,
+                          seatsAvailable=seats, **values)
+        return conf.put().urlsafe()
+
+    def tasks(self, url):
+        """Return the params of the tasks queued for url."""
+        return [task.extract_params()
+                for task in self.taskqueue.get_filtered_tasks(url=url)]
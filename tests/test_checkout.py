@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""test_checkout.py
+
+Multi-conference checkout: all or nothing, or best effort.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from conference import ConferenceApi
+from conference import MEMCACHE_REGISTRATION_METRICS_PREFIX
+from models import CheckoutForm
+from models import CheckoutOutcome
+from models import Profile
+from utils import MEMCACHE_CONF_VERSION_KEY
+
+from tests.base import AppTestCase
+
+
+class CheckoutTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self.api = ConferenceApi()
+        self.signIn('a@example.com')
+        self.open = self.createConference(2)
+        self.soldOut = self.createConference(0)
+
+    def checkout(self, wscks, bestEffort=False):
+        forms = self.api.registerForConferences(CheckoutForm(
+            websafeConferenceKeys=wscks, bestEffort=bestEffort))
+        return dict((form.websafeConferenceKey, form.outcome)
+                    for form in forms.items)
+
+    def seats(self, wsck):
+        return ndb.Key(urlsafe=wsck).get().seatsAvailable
+
+    def attending(self):
+        return ndb.Key(Profile, 'a@example.com').get().conferenceKeysToAttend
+
+    def testAllOrNothingGivesSeatsBack(self):
+        outcomes = self.checkout([self.open, self.soldOut])
+        self.assertEqual(outcomes, {
+            self.open: CheckoutOutcome.CANCELLED,
+            self.soldOut: CheckoutOutcome.SOLD_OUT})
+        self.assertEqual(self.seats(self.open), 2)
+        self.assertEqual(self.attending(), [])
+
+    def testBestEffortKeepsTheSeatsTaken(self):
+        outcomes = self.checkout([self.open, self.soldOut], bestEffort=True)
+        self.assertEqual(outcomes, {
+            self.open: CheckoutOutcome.REGISTERED,
+            self.soldOut: CheckoutOutcome.SOLD_OUT})
+        self.assertEqual(self.seats(self.open), 1)
+        self.assertEqual(self.attending(), [self.open])
+
+        outcomes = self.checkout([self.open])
+        self.assertEqual(outcomes,
+                         {self.open: CheckoutOutcome.ALREADY_REGISTERED})
+
+    def testWaitlistedConferenceIsSoldOut(self):
+        conf = ndb.Key(urlsafe=self.open).get()
+        conf.waitlistLength = 1
+        conf.put()
+        self.assertEqual(self.checkout([self.open]),
+                         {self.open: CheckoutOutcome.SOLD_OUT})
+        self.assertEqual(self.seats(self.open), 2)
+
+    def testAttemptsAreCounted(self):
+        self.checkout([self.open, self.soldOut], bestEffort=True)
+        for wsck in (self.open, self.soldOut):
+            self.assertEqual(memcache.get(
+                MEMCACHE_REGISTRATION_METRICS_PREFIX % wsck + 'attempts'), 1)
+
+    def testNewerCachedVersionIsKept(self):
+        # a concurrent registration committed version 5 first
+        cache_key = MEMCACHE_CONF_VERSION_KEY % self.open
+        memcache.set(cache_key, (5, 0))
+        self.checkout([self.open])
+        self.assertEqual(memcache.get(cache_key), (5, 0))
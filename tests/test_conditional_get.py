@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""test_conditional_get.py
+
+Conditional GETs: a matching ETag gets notModified instead of the data.
+
+"""
+
+from conference import CONF_CONDITIONAL_GET_REQUEST
+from conference import CONF_REGISTRATION_REQUEST
+from conference import ConferenceApi
+
+from tests.base import AppTestCase
+
+ConditionalRequest = CONF_CONDITIONAL_GET_REQUEST.combined_message_class
+RegistrationRequest = CONF_REGISTRATION_REQUEST.combined_message_class
+
+
+class ConditionalGetTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self.api = ConferenceApi()
+        self.wsck = self.createConference(10)
+        self.signIn('a@example.com')
+
+    def get(self, etag=None):
+        return self.api.getConference(ConditionalRequest(
+            websafeConferenceKey=self.wsck, ifNoneMatch=etag))
+
+    def testMatchingEtagIsNotModified(self):
+        cf = self.get()
+        self.assertEqual(cf.name, 'PyCon')
+        self.assertFalse(cf.notModified)
+
+        cached = self.get(cf.etag)
+        self.assertTrue(cached.notModified)
+        self.assertEqual(cached.etag, cf.etag)
+        self.assertIsNone(cached.name)
+
+    def testChangeInvalidatesEtag(self):
+        etag = self.get().etag
+        self.api.registerForConference(
+            RegistrationRequest(websafeConferenceKey=self.wsck))
+
+        cf = self.get(etag)
+        self.assertFalse(cf.notModified)
+        self.assertEqual(cf.seatsAvailable, 9)
+        self.assertNotEqual(cf.etag, etag)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+"""test_facets.py
+
+Facet counters, updated by retriable tasks.
+
+"""
+
+from google.appengine.ext import ndb
+
+import facets
+
+from tests.base import AppTestCase
+
+
+class FacetsTest(AppTestCase):
+
+    def testUpdateIdIsTheConferenceVersion(self):
+        conf = ndb.Key(urlsafe=self.createConference(
+            10, city='Paris', version=3)).get()
+        facets.enqueueUpdate(conf, set())
+        [params] = self.tasks('/tasks/update_facets')
+        self.assertEqual(params['update'], '%s 3' % conf.key.urlsafe())
+
+    def testRetriedUpdateCountsOnce(self):
+        deltas = [('CITY', 'Paris', 1), ('TOPIC', 'Python', 1)]
+        facets.update('conference 0', deltas)
+        facets.update('conference 0', deltas)
+        self.assertEqual(facets.getCounts()['CITY'], {'Paris': 1})
+        self.assertEqual(facets.getCounts()['TOPIC'], {'Python': 1})
+
+    def testEveryUpdateCounts(self):
+        facets.update('conference 0', [('CITY', 'Paris', 1)])
+        facets.update('conference 1', [('CITY', 'Paris', -1),
+                                       ('CITY', 'Lyon', 1)])
+        self.assertEqual(facets.getCounts()['CITY'], {'Lyon': 1})
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""test_mailer.py
+
+The email pipeline's pull queue worker.
+
+"""
+
+import base64
+
+from google.appengine.api import mail
+from google.appengine.runtime import apiproxy_errors
+
+import mailer
+
+from tests.base import AppTestCase
+
+
+class MailerTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self.testbed.init_app_identity_stub()
+        self.sent = []
+        self._sendMail = mail.send_mail
+        mail.send_mail = self.sendMail
+
+    def tearDown(self):
+        mail.send_mail = self._sendMail
+        AppTestCase.tearDown(self)
+
+    def sendMail(self, sender, to, subject, body):
+        if self.sent:
+            raise apiproxy_errors.OverQuotaError('mail quota exceeded')
+        self.sent.append(to)
+
+    def testSentNotificationsAreDeletedWhenSendingFails(self):
+        for email in ('a@example.com', 'b@example.com'):
+            mailer.enqueue(mailer.CONFERENCE_CREATED, email,
+                           {'name': 'PyCon'})
+        with self.assertRaises(apiproxy_errors.OverQuotaError):
+            mailer.sendBatch()
+
+        left = self.taskqueue.GetTasks(mailer.MAIL_QUEUE)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(left), 1)
+        # the stub returns task bodies base64 encoded
+        self.assertNotIn(self.sent[0], base64.b64decode(left[0]['body']))
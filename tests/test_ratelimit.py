@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""test_ratelimit.py
+
+Token bucket admission control of the expensive endpoints.
+
+"""
+
+import httplib
+
+import ratelimit
+from models import TooManyRequestsException
+from ratelimit import rateLimited
+from settings import RATE_LIMITS
+
+from tests.base import AppTestCase
+
+
+class RequestState(object):
+
+    def __init__(self, remote_address):
+        self.remote_address = remote_address
+
+
+class LimitedApi(object):
+
+    request_state = None
+
+    @rateLimited
+    def queryConferences(self, request):
+        return True
+
+
+class RateLimitTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        ratelimit._leases.clear()
+        self.api = LimitedApi()
+        _, self.burst = RATE_LIMITS['queryConferences']
+
+    def exhaust(self):
+        for _ in range(self.burst):
+            self.api.queryConferences(None)
+
+    def testCallsOverTheLimitGetA503(self):
+        self.signIn('a@example.com')
+        self.exhaust()
+        with self.assertRaises(TooManyRequestsException) as raised:
+            self.api.queryConferences(None)
+        # the status Endpoints passes through to the client
+        self.assertEqual(raised.exception.http_status,
+                         httplib.SERVICE_UNAVAILABLE)
+
+    def testAnonymousCallersAreLimitedByAddress(self):
+        self.api.request_state = RequestState('192.0.2.1')
+        self.exhaust()
+        with self.assertRaises(TooManyRequestsException):
+            self.api.queryConferences(None)
+        self.api.request_state = RequestState('192.0.2.2')
+        self.assertTrue(self.api.queryConferences(None))
+
+    def testAnonymousCallersOfUnknownAddressAreAdmitted(self):
+        for _ in range(self.burst * 2):
+            self.assertTrue(self.api.queryConferences(None))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""test_reconcile.py
+
+Seats reconciliation, split into shards at __scatter__ samples.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Profile
+
+import reconcile
+
+from tests.base import AppTestCase
+
+
+class ReconcileTest(AppTestCase):
+
+    def testNoScatterSamplesMakeOneShard(self):
+        self.assertEqual(reconcile._splitKeys(8), [])
+
+    def testJobFixesDriftedSeats(self):
+        wsck = self.createConference(10)
+        ndb.put_multi([Profile(key=ndb.Key(Profile, 'u%d@example.com' % i),
+                               conferenceKeysToAttend=[wsck])
+                       for i in range(3)])
+
+        job = reconcile.start(8)
+        self.assertEqual(job.shards, 1)
+        for params in self.tasks('/tasks/reconcile_seats'):
+            reconcile.processBatch(params['shard'], int(params['batch']))
+        for params in self.tasks('/tasks/reconcile_seats_merge'):
+            reconcile.merge(int(params['job']))
+
+        self.assertEqual(ndb.Key(urlsafe=wsck).get().seatsAvailable, 7)
+        self.assertEqual(job.key.get().conferencesFixed, 1)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""test_registration.py
+
+Idempotent registration: requests repeating a requestId get the outcome
+of the first one back.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from conference import CONF_REGISTRATION_REQUEST
+from conference import ConferenceApi
+from conference import MEMCACHE_REGISTRATION_RESULT_KEY
+from conference import REGISTRATION_PENDING
+from models import ConflictException
+from models import Profile
+from models import SoldOutException
+
+from tests.base import AppTestCase
+
+RegistrationRequest = CONF_REGISTRATION_REQUEST.combined_message_class
+
+
+class RegistrationTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self.api = ConferenceApi()
+        self.wsck = self.createConference(2)
+        self.signIn('a@example.com')
+
+    def request(self, request_id):
+        return RegistrationRequest(websafeConferenceKey=self.wsck,
+                                   requestId=request_id)
+
+    def seats(self):
+        return ndb.Key(urlsafe=self.wsck).get().seatsAvailable
+
+    def testRetryGetsTheFirstOutcome(self):
+        self.assertTrue(self.api.registerForConference(
+            self.request('r1')).registered)
+        # not a 409 already registered
+        self.assertTrue(self.api.registerForConference(
+            self.request('r1')).registered)
+        self.assertEqual(self.seats(), 1)
+
+        with self.assertRaises(ConflictException):
+            self.api.registerForConference(self.request('r2'))
+
+    def testOutcomeSurvivesMemcacheEviction(self):
+        self.api.registerForConference(self.request('r1'))
+        memcache.flush_all()
+        self.assertTrue(self.api.registerForConference(
+            self.request('r1')).registered)
+        self.assertEqual(self.seats(), 1)
+        prof = ndb.Key(Profile, 'a@example.com').get()
+        self.assertEqual(len(prof.registrationRecords), 1)
+
+    def testFailureOutcomesAreReplayed(self):
+        conf = ndb.Key(urlsafe=self.wsck).get()
+        conf.seatsAvailable = 0
+        conf.put()
+        with self.assertRaises(SoldOutException):
+            self.api._conferenceRegistration(self.request('r1'))
+
+        # a seat freed up: the retry still gets the first outcome
+        conf.seatsAvailable = 1
+        conf.put()
+        memcache.flush_all()
+        with self.assertRaises(SoldOutException):
+            self.api._conferenceRegistration(self.request('r1'))
+        self.assertTrue(self.api._conferenceRegistration(
+            self.request('r2')).data)
+
+    def testConcurrentDuplicateIsRejected(self):
+        memcache.add(MEMCACHE_REGISTRATION_RESULT_KEY % (
+            'a@example.com', self.wsck, 'reg', 'r1'), REGISTRATION_PENDING)
+        with self.assertRaises(ConflictException):
+            self.api.registerForConference(self.request('r1'))
+        self.assertEqual(self.seats(), 2)
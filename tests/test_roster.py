@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""test_roster.py
+
+Roster exports, written by a chain of tasks passing a query cursor.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Profile
+
+import roster
+
+from tests.base import AppTestCase
+
+
+class RosterTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self._batchSize = roster.BATCH_SIZE
+        roster.BATCH_SIZE = 2
+        self.wsck = self.createConference(10)
+        ndb.put_multi([Profile(key=ndb.Key(Profile, 'u%d@example.com' % i),
+                               displayName='User %d' % i,
+                               mainEmail='u%d@example.com' % i,
+                               conferenceKeysToAttend=[self.wsck])
+                       for i in range(5)])
+
+    def tearDown(self):
+        roster.BATCH_SIZE = self._batchSize
+        AppTestCase.tearDown(self)
+
+    def runChain(self):
+        """Run the export tasks, and the tasks they enqueue, until none
+        are left."""
+        while True:
+            tasks = self.tasks('/tasks/export_roster')
+            if not tasks:
+                return
+            self.taskqueue.FlushQueue('default')
+            for params in tasks:
+                roster.exportBatch(int(params['export']),
+                                   int(params['chunk']))
+
+    def rows(self, export):
+        return ''.join(roster.getChunk(export, i)
+                       for i in range(export.chunks)).splitlines()
+
+    def testChainExportsEveryAttendee(self):
+        export = roster.start(self.wsck, 'csv')
+        self.runChain()
+
+        export = export.key.get()
+        self.assertEqual(roster.status(export), 'DONE')
+        self.assertEqual(export.chunks, 3)
+        self.assertEqual(export.rows, 5)
+        rows = self.rows(export)
+        self.assertEqual(rows[0], ','.join(roster.COLUMNS))
+        self.assertEqual(sorted(rows[1:]), [
+            'User %d,u%d@example.com,NOT_SPECIFIED' % (i, i)
+            for i in range(5)])
+
+    def testDuplicateTaskIsIgnored(self):
+        export = roster.start(self.wsck, 'jsonl')
+        self.taskqueue.FlushQueue('default')
+        roster.exportBatch(export.key.id(), 0)
+        roster.exportBatch(export.key.id(), 0)
+
+        self.assertEqual(export.key.get().chunks, 1)
+        self.assertEqual(self.tasks('/tasks/export_roster'),
+                         [{'export': str(export.key.id()), 'chunk': '1'}])
+
+    def testResumeContinuesFromTheCursor(self):
+        export = roster.start(self.wsck, 'jsonl')
+        self.taskqueue.FlushQueue('default')
+        roster.exportBatch(export.key.id(), 0)
+        # the chain dies
+        self.taskqueue.FlushQueue('default')
+
+        roster.resume(export.key.get())
+        self.runChain()
+        export = export.key.get()
+        self.assertEqual(export.rows, 5)
+        self.assertEqual(len(self.rows(export)), 5)
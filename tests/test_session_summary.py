@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""test_session_summary.py
+
+The session summary kept on each conference, which the organizer
+dashboard and the conference detail page read instead of the sessions.
+
+"""
+
+from models import Session
+from models import SpeakerProperty
+
+from utils import getFeaturedSpeaker
+from utils import summarizeSessions
+
+from tests.base import AppTestCase
+
+
+def _session(email, sessionType='LECTURE'):
+    return Session(name='Talk', sessionType=sessionType,
+                   speaker=SpeakerProperty(name=email.split('@')[0],
+                                           email=email,
+                                           websafeSpeakerKey='key-' + email))
+
+
+class SessionSummaryTest(AppTestCase):
+
+    def testFeaturedSpeakerHasTheMostSessions(self):
+        summary = summarizeSessions([
+            _session('ada@example.com'),
+            _session('bob@example.com', 'WORKSHOP'),
+            _session('ada@example.com', 'WORKSHOP'),
+        ])
+        self.assertEqual(summary.sessionCount, 3)
+        self.assertEqual(summary.sessionsByType,
+                         {'LECTURE': 1, 'WORKSHOP': 2})
+        self.assertEqual(summary.speakerCount, 2)
+        self.assertEqual(getFeaturedSpeaker(summary), dict(
+            name='ada', email='ada@example.com',
+            websafeSpeakerKey='key-ada@example.com', sessions=2))
+
+    def testNoFeaturedSpeakerWithOneSessionEach(self):
+        summary = summarizeSessions([_session('ada@example.com'),
+                                     _session('bob@example.com')])
+        self.assertIsNone(getFeaturedSpeaker(summary))
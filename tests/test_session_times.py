@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""test_session_times.py
+
+The backfill of the normalized session times that time-window queries
+filter on.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Session
+
+from tasks import backfillSessionTimes
+
+from tests.base import AppTestCase
+
+
+class BackfillSessionTimesTest(AppTestCase):
+
+    def setUp(self):
+        super(BackfillSessionTimesTest, self).setUp()
+        self.c_key = ndb.Key(urlsafe=self.createConference(10))
+
+    def testSessionIsNormalized(self):
+        s_key = Session(parent=self.c_key, name='Keynote',
+                        startTime=930, duration=45).put()
+        self.assertEqual(backfillSessionTimes(), 1)
+        sess = s_key.get()
+        self.assertEqual((sess.startMinute, sess.endMinute), (570, 615))
+
+    def testOverlongSessionIsSkipped(self):
+        # longer than time-window queries look back
+        s_key = Session(parent=self.c_key, name='Hackathon',
+                        startTime=900, duration=24 * 60).put()
+        self.assertEqual(backfillSessionTimes(), 0)
+        self.assertIsNone(s_key.get().startMinute)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""test_versions.py
+
+The memcache copies of the conference version counters behind ETags.
+
+"""
+
+from google.appengine.api import memcache
+
+from utils import MEMCACHE_CONF_VERSION_KEY
+from utils import cacheConferenceVersions
+
+from tests.base import AppTestCase
+
+
+class VersionsTest(AppTestCase):
+
+    def testCopyOnlyMovesForward(self):
+        cacheConferenceVersions('wsck', (3, 1))
+        # a transaction that committed earlier refreshes the copy late
+        cacheConferenceVersions('wsck', (2, 1))
+        self.assertEqual(memcache.get(MEMCACHE_CONF_VERSION_KEY % 'wsck'),
+                         (3, 1))
+        cacheConferenceVersions('wsck', (3, 2))
+        self.assertEqual(memcache.get(MEMCACHE_CONF_VERSION_KEY % 'wsck'),
+                         (3, 2))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""test_waitlist.py
+
+Registration of sold out conferences: the waitlist and its FIFO
+promotion.
+
+"""
+
+import endpoints
+from google.appengine.ext import ndb
+
+from conference import CONF_REGISTRATION_REQUEST
+from conference import ConferenceApi
+from models import Profile
+
+import waitlist
+
+from tests.base import AppTestCase
+
+RegistrationRequest = CONF_REGISTRATION_REQUEST.combined_message_class
+
+
+class WaitlistTest(AppTestCase):
+
+    def setUp(self):
+        AppTestCase.setUp(self)
+        self.api = ConferenceApi()
+        self.wsck = self.createConference(1)
+
+    def register(self, email):
+        self.signIn(email)
+        return self.api.registerForConference(
+            RegistrationRequest(websafeConferenceKey=self.wsck))
+
+    def unregister(self, email):
+        self.signIn(email)
+        return self.api.unregisterFromConference(
+            RegistrationRequest(websafeConferenceKey=self.wsck)).data
+
+    def conference(self):
+        return ndb.Key(urlsafe=self.wsck).get()
+
+    def attending(self, email):
+        prof = ndb.Key(Profile, email).get()
+        return bool(prof) and self.wsck in prof.conferenceKeysToAttend
+
+    def testSoldOutQueuesInOrder(self):
+        self.assertTrue(self.register('a@example.com').registered)
+
+        wf = self.register('b@example.com')
+        self.assertFalse(wf.registered)
+        self.assertEqual(wf.position, 1)
+        self.assertEqual(self.register('c@example.com').position, 2)
+        # registering again keeps the place
+        self.assertEqual(self.register('b@example.com').position, 1)
+        self.assertEqual(self.conference().waitlistLength, 2)
+
+    def testFreedSeatGoesToTheHeadOfTheWaitlist(self):
+        self.register('a@example.com')
+        self.register('b@example.com')
+        self.assertTrue(self.unregister('a@example.com'))
+        self.assertEqual(self.conference().seatsAvailable, 1)
+        self.assertEqual(self.tasks('/tasks/promote_waitlist'),
+                         [{'conference': self.wsck}])
+
+        # a newcomer can't take the freed seat before the promotion runs
+        wf = self.register('c@example.com')
+        self.assertFalse(wf.registered)
+        self.assertEqual(wf.position, 2)
+
+        waitlist.promote(self.wsck)
+        conf = self.conference()
+        self.assertTrue(self.attending('b@example.com'))
+        self.assertFalse(self.attending('c@example.com'))
+        self.assertEqual(conf.seatsAvailable, 0)
+        self.assertEqual(conf.waitlistLength, 1)
+        self.assertEqual(self.register('c@example.com').position, 1)
+
+    def testLeavingReopensRegistration(self):
+        self.register('a@example.com')
+        self.register('b@example.com')
+        self.assertTrue(waitlist.leave(self.wsck, 'b@example.com'))
+        self.assertFalse(waitlist.leave(self.wsck, 'b@example.com'))
+        self.assertEqual(self.conference().waitlistLength, 0)
+
+        self.unregister('a@example.com')
+        self.assertTrue(self.register('c@example.com').registered)
+
+    def testJoiningWithSeatsLeftEnqueuesPromotion(self):
+        # a seat freed up between the sold out registration and the join
+        waitlist.join(self.wsck, 'b@example.com')
+        self.assertEqual(self.tasks('/tasks/promote_waitlist'),
+                         [{'conference': self.wsck}])
+
+    def testMalformedKeyIsNotFound(self):
+        self.signIn('a@example.com')
+        with self.assertRaises(endpoints.NotFoundException):
+            self.api.registerForConference(
+                RegistrationRequest(websafeConferenceKey='not-a-key'))
+
+
+class EventuallyConsistentWaitlistTest(WaitlistTest):
+
+    # global queries never see the latest writes
+    consistency = 0
+
+    def testPromotionSeesEntriesJustQueued(self):
+        self.register('a@example.com')
+        self.register('b@example.com')
+        self.assertEqual(self.register('c@example.com').position, 2)
+        self.unregister('a@example.com')
+
+        waitlist.promote(self.wsck)
+        self.assertTrue(self.attending('b@example.com'))
+        self.assertEqual(self.conference().waitlistLength, 1)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""unitofwork.py
+
+Unit of work for the conference app: records the entities a request
+reads and modifies, serves repeated reads from memory and writes every
+modified entity with a single put_multi.
+
+Create a new UnitOfWork inside a transaction function, so that a retried
+transaction never sees entities read by a failed attempt.
+
+"""
+
+from google.appengine.ext import ndb
+
+
+class UnitOfWork(object):
+
+    """UnitOfWork -- identity map and write coalescing for one request"""
+
+    def __init__(self):
+        # key -> entity (or None when it doesn't exist), for every key
+        # read or registered so far
+        self._identityMap = {}
+        # keys of the entities to write at commit, in registration order
+        self._dirty = []
+
+    def get(self, key):
+        """Return the entity for key, reading the datastore only the first
+        time the key is asked for."""
+        if key not in self._identityMap:
+            self._identityMap[key] = key.get()
+        return self._identityMap[key]
+
+    def get_multi(self, keys):
+        """Return the entities for keys, reading the ones not held yet with
+        a single get_multi."""
+        missing = [key for key in set(keys) if key not in self._identityMap]
+        if missing:
+            self._identityMap.update(zip(missing, ndb.get_multi(missing)))
+        return [self._identityMap[key] for key in keys]
+
+    def add(self, entity):
+        """Register a new or modified entity, to be written at commit;
+        the entity must already have its (allocated) key."""
+        if entity.key is None:
+            raise ValueError('Entity must have a key: %r' % entity)
+        if entity.key not in self._dirty:
+            self._dirty.append(entity.key)
+        self._identityMap[entity.key] = entity
+
+    def commit(self):
+        """Write every registered entity with one put_multi, inside the
+        surrounding transaction if there is one; return them."""
+        entities = [self._identityMap[key] for key in self._dirty]
+        self._dirty = []
+        if entities:
+            ndb.put_multi(entities)
+        return entities
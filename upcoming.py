@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""upcoming.py
+
+Feed of the upcoming conferences: the conferences that haven't ended yet,
+ordered by startDate, in pages of PAGE_SIZE. The first pages are
+precomputed into memcache whenever a conference is created or updated,
+and daily as conferences end, so serving them is a single cache read.
+
+The datastore allows inequality filters on a single property, the one
+the results are sorted by: the query is bounded on startDate to the
+conferences that started at most LONG_CONFERENCE_DAYS ago, and the
+conferences that ended are skipped in memory. The long running
+conferences that started earlier and haven't ended are queried on their
+own, on endDate, and lead the first page.
+
+"""
+
+from datetime import date
+from datetime import timedelta
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import LONG_CONFERENCE_DAYS
+
+PAGE_SIZE = 20
+# pages refreshed by refresh(), starting with the first
+PRECOMPUTED_PAGES = 3
+
+# a page, keyed by its page token; seatsAvailable changes don't refresh
+# the cache, hence the expiry
+MEMCACHE_UPCOMING_KEY = 'UPCOMING CONFERENCES %s'
+MEMCACHE_UPCOMING_TTL = 600
+
+
+def _query(today):
+    """Return the query of the conferences that may not have ended,
+    except the long running ones started before its bound."""
+    return Conference.query(
+        Conference.startDate >=
+        today - timedelta(days=LONG_CONFERENCE_DAYS)
+    ).order(Conference.startDate, Conference.name)
+
+
+def _longRunning(today):
+    """Return the long running conferences started before the bound of
+    _query that haven't ended, in feed order."""
+    bound = today - timedelta(days=LONG_CONFERENCE_DAYS)
+    confs = Conference.query(Conference.longRunning == True,  # noqa
+                             Conference.endDate >= today).fetch()
+    return sorted((conf for conf in confs if conf.startDate < bound),
+                  key=lambda conf: (conf.startDate, conf.name))
+
+
+def fetchPage(token=None, today=None):
+    """Query a page of the feed; return its Conferences and the token of
+    the next page (None on the last page)."""
+    today = today or date.today()
+    cursor = ndb.Cursor(urlsafe=token) if token else None
+    it = _query(today).iter(start_cursor=cursor, produce_cursors=True,
+                            batch_size=PAGE_SIZE)
+    # the long running conferences come first; they lengthen the first
+    # page rather than shifting the cursors of the others
+    confs = [] if cursor else _longRunning(today)
+    fetched = 0
+    for conf in it:
+        if (conf.endDate or conf.startDate) >= today:
+            confs.append(conf)
+            fetched += 1
+            if fetched == PAGE_SIZE:
+                break
+
+    next_token = None
+    if fetched == PAGE_SIZE and it.has_next():
+        next_token = it.cursor_after().urlsafe()
+    return confs, next_token
+
+
+def getPage(token=None):
+    """Return a page of the feed, from memcache when it's there; return
+    its Conferences and the token of the next page."""
+    cache_key = MEMCACHE_UPCOMING_KEY % (token or '')
+    page = memcache.get(cache_key)
+    if page is None:
+        page = fetchPage(token)
+        memcache.set(cache_key, page, time=MEMCACHE_UPCOMING_TTL)
+    return page
+
+
+def refresh():
+    """Precompute the first PRECOMPUTED_PAGES pages into memcache."""
+    pages = {}
+    token = None
+    for _ in range(PRECOMPUTED_PAGES):
+        page = fetchPage(token)
+        pages[MEMCACHE_UPCOMING_KEY % (token or '')] = page
+        token = page[1]
+        if not token:
+            break
+    memcache.set_multi(pages, time=MEMCACHE_UPCOMING_TTL)
+
+
+def enqueueRefresh(transactional=False):
+    """Enqueue a task refreshing the precomputed pages."""
+    taskqueue.add(url='/tasks/refresh_upcoming',
+                  transactional=transactional)
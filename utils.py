@@ -1,10 +1,142 @@
-import json
 import os
-import time
 import uuid
+from datetime import datetime
+from datetime import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
 
-from google.appengine.api import urlfetch
 from models import Profile
+from models import SessionSummary
+
+MEMCACHE_CONF_VERSION_KEY = 'CONFERENCE VERSION %s'
+# Longest allowed session, in minutes; bounds time-window queries on
+# Session.startMinute
+MAX_SESSION_DURATION = 12 * 60
+# compare-and-set attempts on a memcache version copy
+VERSION_CAS_RETRIES = 3
+
+
+def cacheConferenceVersions(wsck, versions):
+    """Move the memcache copy of a conference's (version, scheduleVersion)
+    forward to versions; a copy as new or newer is kept, as commits can
+    refresh it in any order."""
+    cache_key = MEMCACHE_CONF_VERSION_KEY % wsck
+    client = memcache.Client()
+    for _ in range(VERSION_CAS_RETRIES):
+        cached = client.gets(cache_key)
+        if cached is None:
+            if client.add(cache_key, versions):
+                return
+        elif cached[0] >= versions[0] and cached[1] >= versions[1]:
+            return
+        elif client.cas(cache_key, versions):
+            return
+    # contended: the next read reloads it from the datastore
+    client.delete(cache_key)
+
+
+def bumpConferenceVersion(conf, schedule=False):
+    """Bump the Conference (or its schedule) version counter; must be
+    called inside the transaction that puts the conference, the
+    memcache copy is moved forward once it commits."""
+    if schedule:
+        conf.scheduleVersion += 1
+    else:
+        conf.version += 1
+    wsck = conf.key.urlsafe()
+    versions = (conf.version, conf.scheduleVersion)
+    ndb.get_context().call_on_commit(
+        lambda: cacheConferenceVersions(wsck, versions))
+
+
+def militaryToMinutes(military):
+    """Convert a military notation time (e.g. 1430) to minutes after
+    midnight; raise ValueError if it isn't a valid time of day."""
+    hours, minutes = divmod(military, 100)
+    if military < 0 or hours > 23 or minutes > 59:
+        raise ValueError('Invalid military time: %s' % military)
+    return hours * 60 + minutes
+
+
+def sessionTimeFields(date, startTime, duration):
+    """Return the normalized time properties of a Session (startMinute,
+    endMinute and startTimestamp) given its date, military start time and
+    duration; unknown values are None. Raise ValueError on a bad time."""
+    fields = dict(startMinute=None, endMinute=None, startTimestamp=None)
+    if startTime is None:
+        return fields
+    fields['startMinute'] = militaryToMinutes(startTime)
+    if duration:
+        fields['endMinute'] = fields['startMinute'] + duration
+    if date:
+        fields['startTimestamp'] = datetime.combine(
+            date, time(*divmod(fields['startMinute'], 60)))
+    return fields
+
+
+def sessionInterval(session):
+    """Return the (start, end) of a Session in minutes since 0001-01-01 00:00,
+    or None when its date, start time or duration is unknown."""
+    if not session.date or session.startTime is None or not session.duration:
+        return None
+    startMinute = session.startMinute
+    if startMinute is None:
+        # not backfilled yet
+        try:
+            startMinute = militaryToMinutes(session.startTime)
+        except ValueError:
+            return None
+    start = session.date.toordinal() * 1440 + startMinute
+    return start, start + session.duration
+
+
+def addToSessionSummary(summary, session, newSpeaker):
+    """Count a Session in a SessionSummary; newSpeaker tells whether its
+    speaker has no other session in the conference."""
+    summary.sessionCount += 1
+    sessType = session.sessionType or 'NOT_SPECIFIED'
+    byType = dict(summary.sessionsByType or {})
+    byType[sessType] = byType.get(sessType, 0) + 1
+    summary.sessionsByType = byType
+    if session.date:
+        summary.firstDate = min(summary.firstDate or session.date,
+                                session.date)
+        summary.lastDate = max(summary.lastDate or session.date,
+                               session.date)
+    if newSpeaker:
+        summary.speakerCount += 1
+    if session.speaker:
+        speakers = dict(summary.speakers or {})
+        speaker = speakers.setdefault(session.speaker.email, dict(
+            name=session.speaker.name,
+            websafeSpeakerKey=session.speaker.websafeSpeakerKey,
+            sessions=0))
+        speaker['sessions'] += 1
+        summary.speakers = speakers
+
+
+def getFeaturedSpeaker(summary):
+    """Return the featured speaker of a SessionSummary as a dict (the
+    speaker with the most sessions, if more than one), or None."""
+    featured = None
+    for email, speaker in sorted((summary.speakers or {}).items()):
+        if speaker['sessions'] > 1 and (
+                not featured or speaker['sessions'] > featured['sessions']):
+            featured = dict(speaker, email=email)
+    return featured
+
+
+def summarizeSessions(sessions):
+    """Return the SessionSummary of a conference's Sessions."""
+    summary = SessionSummary()
+    speakers = set()
+    for sess in sessions:
+        email = sess.speaker.email if sess.speaker else None
+        addToSessionSummary(summary, sess, email and email not in speakers)
+        speakers.add(email)
+    return summary
+
 
 def getUserId(user, id_type="email"):
     if id_type == "email":
@@ -12,6 +144,11 @@ def getUserId(user, id_type="email"):
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
+        # imported here, only this code path needs them
+        import json
+        import time
+        from google.appengine.api import urlfetch
+
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
         token_type = 'id_token'
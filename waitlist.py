@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""waitlist.py
+
+Waitlist of sold out conferences. Registrations that find no seat left
+are queued as WaitlistEntry children of the conference, so that the
+queue is read with strongly consistent ancestor queries; every
+unregistration enqueues a task which promotes the head of the queue, in
+FIFO order, to the seats that freed up. The conference counts its
+entries in waitlistLength, and registrations find it sold out while
+that count is above 0, so only the promotion task hands out the seats
+freed up.
+
+"""
+
+import logging
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import WaitlistEntry
+
+from utils import bumpConferenceVersion
+
+# waitlist entries promoted per task
+PROMOTION_BATCH_SIZE = 20
+
+
+def entryKey(wsck, user_id):
+    """Return the WaitlistEntry key of a user for a conference; wsck must
+    be a valid websafe key."""
+    return ndb.Key(WaitlistEntry, user_id, parent=ndb.Key(urlsafe=wsck))
+
+
+@ndb.transactional
+def join(wsck, user_id):
+    """Queue a user on a conference waitlist, keeping their place if they
+    are already queued; return the WaitlistEntry."""
+    key = entryKey(wsck, user_id)
+    entry, conf = ndb.get_multi([key, key.parent()])
+    if entry:
+        return entry
+    entry = WaitlistEntry(key=key, websafeConferenceKey=wsck,
+                          userId=user_id)
+    if not conf:
+        entry.put()
+        return entry
+    conf.waitlistLength += 1
+    if conf.seatsAvailable > 0:
+        # a seat freed up since the registration found none
+        enqueuePromotion(wsck, transactional=True)
+    ndb.put_multi([entry, conf])
+    return entry
+
+
+@ndb.transactional
+def leave(wsck, user_id):
+    """Remove a user from a conference waitlist; return whether they were
+    queued."""
+    key = entryKey(wsck, user_id)
+    entry, conf = ndb.get_multi([key, key.parent()])
+    if not entry:
+        return False
+    key.delete()
+    if conf and conf.waitlistLength > 0:
+        conf.waitlistLength -= 1
+        conf.put()
+    return True
+
+
+def position(entry):
+    """Return the (1-based) position of an entry in its waitlist; the
+    count is strongly consistent, so it includes entries just queued."""
+    return WaitlistEntry.query(
+        WaitlistEntry.created < entry.created,
+        ancestor=entry.key.parent()).count() + 1
+
+
+def enqueuePromotion(wsck, transactional=False):
+    """Enqueue a task promoting the head of a conference waitlist."""
+    taskqueue.add(params={'conference': wsck},
+                  url='/tasks/promote_waitlist',
+                  transactional=transactional)
+
+
+@ndb.transactional(xg=True)
+def _promoteEntry(entry_key, c_key):
+    """Register the user of a waitlist entry and remove the entry;
+    return False, leaving the entry queued, if no seat is left."""
+    entry, conf = ndb.get_multi([entry_key, c_key])
+    if not entry:
+        # already promoted, or the user left the waitlist
+        return True
+    if conf and conf.seatsAvailable <= 0:
+        return False
+
+    to_put = []
+    prof = ndb.Key(Profile, entry.userId).get()
+    if conf and prof and entry.websafeConferenceKey not in \
+            prof.conferenceKeysToAttend:
+        # register user, take away one seat
+        prof.conferenceKeysToAttend.append(entry.websafeConferenceKey)
+        conf.seatsAvailable -= 1
+        bumpConferenceVersion(conf)
+        to_put.append(prof)
+    elif not prof:
+        logging.warning('Dropping waitlist entry %s: no profile',
+                        entry_key.id())
+    if conf:
+        conf.waitlistLength = max(conf.waitlistLength - 1, 0)
+        to_put.append(conf)
+    ndb.put_multi(to_put)
+    entry_key.delete()
+    return True
+
+
+def promote(wsck):
+    """Promote the head of a conference waitlist to the seats left, in
+    FIFO order; chain another task while seats and entries remain."""
+    c_key = ndb.Key(urlsafe=wsck)
+    # an ancestor query: entries queued just before the task ran are seen
+    entry_keys = WaitlistEntry.query(ancestor=c_key).order(
+        WaitlistEntry.created).fetch(PROMOTION_BATCH_SIZE, keys_only=True)
+
+    for entry_key in entry_keys:
+        if not _promoteEntry(entry_key, c_key):
+            # sold out again
+            return
+    if len(entry_keys) == PROMOTION_BATCH_SIZE:
+        enqueuePromotion(wsck)